@@ -0,0 +1,91 @@
+"""
+Multi-account analytics for FinWise.
+
+A statement file (or the saved history) may hold transactions for many
+account holders, identified by an Account column. Category statistics and
+budget status are computed with one groupby partitioned by account, never
+across accounts. Insight metrics for every account come from one cube with
+an account key; only the Markdown rendering runs per account.
+"""
+import pandas as pd
+
+from aggregates import AggregateCube
+from anomalies import detect_anomalies
+from budgets import STATUS_COLUMNS, SpendCounters, evaluate_budgets, is_budget_spec
+from ingestion import ACCOUNT_COLUMN
+from insights import compute_insight_metrics, render_insights
+
+
+def has_accounts(df, account_col=ACCOUNT_COLUMN):
+    """True when transactions carry an account column with more than one account."""
+    return account_col in df.columns and df[account_col].nunique() > 1
+
+
+def account_budgets(budget_goals, account):
+    """The {category: budget} goals for one account from shared or per-account goals."""
+    if budget_goals and not any(is_budget_spec(goals) for goals in budget_goals.values()):
+        return budget_goals.get(account, {})
+    return budget_goals or {}
+
+
+def budget_status_by_account(df, budget_goals, account_col=ACCOUNT_COLUMN, counters=None):
+    """
+    Every account's budgets in their current period (see budgets.evaluate_budgets).
+
+    `budget_goals` is either one {category: budget} mapping applied to every
+    account, or {account: {category: budget}}. Spending comes from one set of
+    counters partitioned by account (built here unless `counters` is given).
+    Returns one row per account and budgeted category; Remaining is negative
+    when the budget is exceeded.
+    """
+    columns = [account_col] + STATUS_COLUMNS
+    if counters is None:
+        counters = SpendCounters.build(df, group_col=account_col)
+    statuses = [
+        evaluate_budgets(counters, account_budgets(budget_goals, account), group=account).assign(**{account_col: account})
+        for account in counters.groups()
+    ]
+    statuses = [status for status in statuses if not status.empty]
+    if not statuses:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(statuses, ignore_index=True)[columns]
+
+
+def insights_by_account(df, budget_goals=None, account_col=ACCOUNT_COLUMN, anomalies_df=None, counters=None,
+                        **anomaly_options):
+    """
+    Smart insights for every account in one batch: the insight metrics of all
+    accounts are evaluated together on a cube keyed by account, and anomalies are
+    scored in one partitioned pass unless `anomalies_df` (from anomalies_by_account)
+    is given. `budget_goals` is shared or per account as in budget_status_by_account;
+    budget spending comes from `counters` when given (e.g. built from the whole
+    history while `df` is filtered), otherwise from `df`.
+    Returns one row per account with its transaction count, anomaly count and insights text.
+    """
+    columns = [account_col, "Transactions", "Anomalies", "Insights"]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    cube = AggregateCube.build(df, group_col=account_col)
+    metrics = compute_insight_metrics(cube, group_col=account_col)
+    if counters is None and budget_goals:
+        counters = SpendCounters.from_cube(cube, group_col=account_col)
+    if anomalies_df is None:
+        anomalies_df = anomalies_by_account(df, account_col, **anomaly_options)
+    anomalies_per_account = (
+        dict(list(anomalies_df.groupby(anomalies_df[account_col].astype(str), sort=False)))
+        if not anomalies_df.empty else {}
+    )
+    empty_anomalies = anomalies_df.iloc[0:0]
+    rows = []
+    for account, transactions in df.groupby(account_col, observed=True, sort=True).size().items():
+        account_anomalies = anomalies_per_account.get(str(account), empty_anomalies)
+        goals = account_budgets(budget_goals, account)
+        status = evaluate_budgets(counters, goals, group=str(account)) if goals else None
+        insights = render_insights(metrics, goals, account_anomalies, group=str(account), budget_status=status)
+        rows.append((account, transactions, len(account_anomalies), insights))
+    return pd.DataFrame(rows, columns=columns)
+
+
+def anomalies_by_account(df, account_col=ACCOUNT_COLUMN, **anomaly_options):
+    """Anomalies scored against each account's own category statistics, in one partitioned pass."""
+    return detect_anomalies(df, account_col=account_col, **anomaly_options)
@@ -0,0 +1,201 @@
+"""
+Pre-aggregated transaction cube for FinWise.
+
+The cube holds one row per (day, category, Debit/Credit) with the sum, count
+and M2 (sum of squared deviations from the cell mean) of the amounts. It is built once per dataset; the sidebar,
+tabs, charts and insights then answer their questions by slicing and rolling
+up the cube instead of scanning every transaction again.
+
+When amounts are int64 paise the sums stay exact integers inside the cube;
+every accessor returns rupees.
+"""
+import numpy as np
+import pandas as pd
+
+from transactions import amount_scale
+
+CUBE_KEYS = ["Date", "Category", "Debit/Credit"]
+# Upper bound on the points in a trend series, whatever the length of history
+MAX_TREND_POINTS = 400
+# Trend resolutions from finest to coarsest: name -> approximate days per bin
+TREND_RESOLUTIONS = {"Day": 1, "Week": 7, "Month": 30.44}
+
+
+def trend_resolution(start, end, max_points=MAX_TREND_POINTS):
+    """The finest of day/week/month whose bins over [start, end] fit in `max_points`."""
+    span_days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    for resolution, days in TREND_RESOLUTIONS.items():
+        if span_days / days <= max_points:
+            return resolution
+    return "Month"
+
+
+def bin_dates(dates, resolution):
+    """Floor datetime64 days to the start of their week (Monday) or month."""
+    days = dates.to_numpy().astype("datetime64[D]")
+    if resolution == "Week":
+        # 1970-01-01 was a Thursday, so day numbers shifted by 3 count from a Monday
+        days = days - ((days.astype(np.int64) + 3) % 7).astype("timedelta64[D]")
+    elif resolution == "Month":
+        days = days.astype("datetime64[M]").astype("datetime64[D]")
+    return pd.DatetimeIndex(days.astype("datetime64[ns]"), name=dates.name)
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling: positions of `n_out` points of
+    (x, y) that keep the visual shape of the line, always including both ends.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket is the third vertex of the triangle
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[hi:next_hi].mean()
+        next_y = y[hi:next_hi].mean()
+        prev = keep[i]
+        area = np.abs((x[prev] - next_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (next_y - y[prev]))
+        keep[i + 1] = lo + int(np.argmax(area))
+    return keep
+
+
+class AggregateCube:
+    """Day x category x Debit/Credit -> Sum, Count, M2, sorted by date."""
+
+    def __init__(self, cells, scale=1):
+        self.cells = cells
+        # Amount units per rupee: 100 when Sum holds integer paise
+        self.scale = scale
+
+    @classmethod
+    def build(cls, df, group_col=None):
+        """
+        Aggregate transactions into the cube in a single grouped pass. With a
+        `group_col` (e.g. Account) it is kept as a further key of every cell.
+        """
+        if df is None or df.empty:
+            return cls(pd.DataFrame({
+                "Date": pd.Series(dtype="datetime64[ns]"), "Category": pd.Series(dtype=object),
+                "Debit/Credit": pd.Series(dtype=object), "Sum": pd.Series(dtype=float),
+                "Count": pd.Series(dtype="int64"), "M2": pd.Series(dtype=float),
+            }))
+        scale = amount_scale(df["Amount"])
+        # Integer paise are summed as int64; M2 is float so it cannot overflow
+        amounts = df["Amount"] if scale != 1 else df["Amount"].astype(float)
+        keys = [pd.to_datetime(df["Date"]).dt.normalize().rename("Date"), df["Category"], df["Debit/Credit"]]
+        if group_col is not None:
+            keys.append(df[group_col])
+        grouped = amounts.groupby(keys, observed=True, sort=True)
+        cells = grouped.sum().rename("Sum").to_frame()
+        cells["Count"] = grouped.size()
+        # Per-cell M2 from deviations about the cell mean, never as SumSq - Sum^2 / Count
+        cells["M2"] = grouped.var(ddof=0).to_numpy() * cells["Count"].to_numpy()
+        return cls(cells.reset_index(), scale)
+
+    def __len__(self):
+        return len(self.cells)
+
+    @property
+    def empty(self):
+        return self.cells.empty
+
+    def slice(self, start_date=None, end_date=None, categories=None, kind=None):
+        """
+        Sub-cube for an inclusive date range, a set of categories and/or one of
+        "Debit"/"Credit". The date range is found by binary search on the sorted dates.
+        """
+        cells = self.cells
+        if start_date is not None or end_date is not None:
+            dates = cells["Date"].to_numpy()
+            lo = 0 if start_date is None else dates.searchsorted(np.datetime64(pd.Timestamp(start_date)), side="left")
+            hi = len(dates) if end_date is None else dates.searchsorted(np.datetime64(pd.Timestamp(end_date)), side="right")
+            cells = cells.iloc[lo:hi]
+        if categories is not None:
+            cells = cells[cells["Category"].isin(categories)]
+        if kind is not None:
+            cells = cells[cells["Debit/Credit"] == kind]
+        return AggregateCube(cells, self.scale)
+
+    def debits(self):
+        return self.slice(kind="Debit")
+
+    def credits(self):
+        return self.slice(kind="Credit")
+
+    def total(self):
+        return float(self.cells["Sum"].sum() / self.scale)
+
+    def count(self):
+        return int(self.cells["Count"].sum())
+
+    def mean(self):
+        count = self.count()
+        return self.total() / count if count else np.nan
+
+    def categories(self):
+        """Categories present in this (sub-)cube."""
+        return self.cells["Category"].unique().tolist()
+
+    def date_range(self):
+        """(first, last) day in the cube, or (None, None) when empty."""
+        if self.cells.empty:
+            return None, None
+        return self.cells["Date"].iloc[0], self.cells["Date"].iloc[-1]
+
+    def _rollup(self, keys):
+        return self.cells.groupby(keys, observed=True)[["Sum", "Count"]].sum()
+
+    def by_category(self):
+        """
+        Per-category Sum, Count, Mean and (sample) Std. The cells' M2 are merged as in
+        anomalies._CategoryStats (Chan et al.): their sum plus each cell's Count times the
+        squared distance of its mean from the category mean.
+        """
+        cells = self.cells
+        by_category = cells.groupby("Category", observed=True)
+        rolled = by_category[["Sum", "Count", "M2"]].sum()
+        cell_means = cells["Sum"].to_numpy() / cells["Count"].to_numpy()
+        category_means = (by_category["Sum"].transform("sum") / by_category["Count"].transform("sum")).to_numpy()
+        between = cells["Count"].to_numpy() * (cell_means - category_means) ** 2
+        rolled["M2"] += pd.Series(between, index=cells.index).groupby(cells["Category"], observed=True).sum()
+        rolled["Sum"] = rolled["Sum"] / self.scale
+        rolled["M2"] = rolled["M2"] / self.scale ** 2
+        rolled["Mean"] = rolled["Sum"] / rolled["Count"]
+        rolled["Std"] = np.sqrt(rolled["M2"] / (rolled["Count"] - 1)).where(rolled["Count"] > 1)
+        return rolled
+
+    def by_day(self):
+        """Total amount per day."""
+        return self._rollup("Date")["Sum"] / self.scale
+
+    def by_month(self):
+        """Total amount per calendar month (PeriodIndex)."""
+        return self.cells.groupby(self.cells["Date"].dt.to_period("M"))["Sum"].sum() / self.scale
+
+    def by_weekday(self):
+        """Total amount per weekday name."""
+        return self.cells.groupby(self.cells["Date"].dt.day_name())["Sum"].sum() / self.scale
+
+    def trend(self, max_points=MAX_TREND_POINTS):
+        """
+        Total amount over time as a series of at most `max_points` points, plus its resolution.
+        The resolution (day/week/month) is picked from the date range; if even monthly bins
+        would exceed the bound, the monthly series is downsampled with LTTB.
+        """
+        daily = self.by_day()
+        if daily.empty:
+            return daily, "Day"
+        resolution = trend_resolution(daily.index[0], daily.index[-1], max_points)
+        if resolution != "Day":
+            daily = daily.groupby(bin_dates(daily.index, resolution)).sum()
+        if len(daily) > max_points:
+            daily = daily.iloc[lttb(daily.index.asi8, daily.to_numpy(), max_points)]
+        return daily, resolution
@@ -0,0 +1,340 @@
+"""
+Spending anomaly detection for FinWise.
+
+Z-scores are computed per category with grouped transforms, so no Python
+code runs per transaction. A robust mode scores against the median/MAD
+instead of mean/std, optionally per calendar season (day of month or
+weekday), so one huge outlier cannot mask the rest and regular bills on a
+fixed day are not flagged. IncrementalAnomalyDetector keeps running
+per-category statistics so appended transactions can be scored without
+recomputing over the full history.
+"""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+ANOMALY_METHODS = ("zscore", "robust")
+SEASONALITY_KEYS = {
+    "day_of_month": lambda dates: dates.dt.day,
+    "weekday": lambda dates: dates.dt.weekday,
+}
+# Scales MAD so the robust score is comparable to a z-score for normal data
+MAD_SCALE = 0.6745
+# When more than half the amounts are identical the MAD is 0; the mean absolute deviation,
+# scaled by this factor, stands in for it (sqrt(pi/2), the same normal-data consistency)
+MEAN_AD_SCALE = 1.253314
+# Seasonal groups smaller than this fall back to the category-wide median/MAD
+MIN_SEASONAL_COUNT = 3
+
+
+def describe_zscores(zscores, label="Z-score"):
+    """Build the human-readable reason for each flagged z-score, vectorized."""
+    values = np.asarray(zscores, dtype=float)
+    prefix = np.where(values > 0, f"Unusually high expense ({label}: ", f"Unusually low expense ({label}: ")
+    return pd.Series(
+        np.char.add(np.char.add(prefix, np.char.mod("%.2f", values)), ")"),
+        index=getattr(zscores, "index", None)
+    )
+
+
+def robust_center_scale(amounts, keys, window=None):
+    """
+    Grouped median and robust scale of amounts, broadcast back to every row, plus each
+    group's size. The scale is MAD / 0.6745, or 1.253314 * the mean absolute deviation
+    from the median where the MAD is 0. With `window`, all of them are trailing rolling
+    statistics over the last `window` rows of the group (rows must already be in date order).
+    """
+    grouped = amounts.groupby(keys, observed=True, sort=False)
+    if window is None:
+        median = grouped.transform("median")
+    else:
+        median = grouped.transform(lambda s: s.rolling(window, min_periods=1).median())
+    deviation = (amounts - median).abs()
+    deviation_grouped = deviation.groupby(keys, observed=True, sort=False)
+    if window is None:
+        mad = deviation_grouped.transform("median")
+        mean_ad = deviation_grouped.transform("mean")
+    else:
+        mad = deviation_grouped.transform(lambda s: s.rolling(window, min_periods=1).median())
+        mean_ad = deviation_grouped.transform(lambda s: s.rolling(window, min_periods=1).mean())
+    scale = (mad / MAD_SCALE).where(mad > 0, MEAN_AD_SCALE * mean_ad)
+    return median, scale, grouped.transform("size")
+
+
+def robust_scores(amounts, categories, dates, seasonality=None, window=None):
+    """
+    Modified z-scores, 0.6745 * (x - median) / MAD, within each category; where the MAD
+    is 0, (x - median) / (1.253314 * mean absolute deviation) instead.
+    `categories` may also be a list of key columns, e.g. [accounts, categories].
+    With `seasonality`, the median/MAD come from the same category and calendar
+    bucket whenever that bucket has enough history.
+    """
+    keys = list(categories) if isinstance(categories, list) else [categories]
+    median, scale, _ = robust_center_scale(amounts, keys, window)
+    if seasonality is not None:
+        if seasonality not in SEASONALITY_KEYS:
+            raise ValueError(f"Unknown seasonality '{seasonality}'. Expected one of {list(SEASONALITY_KEYS)}.")
+        season = SEASONALITY_KEYS[seasonality](dates)
+        seasonal_median, seasonal_scale, seasonal_count = robust_center_scale(amounts, keys + [season], window)
+        use_seasonal = seasonal_count >= MIN_SEASONAL_COUNT
+        median = seasonal_median.where(use_seasonal, median)
+        scale = seasonal_scale.where(use_seasonal, scale)
+    # Only a group of identical amounts has no spread at all; nothing in it is unusual
+    return ((amounts - median) / scale).where(scale > 0)
+
+
+def detect_anomalies(df, category_col="Category", amount_col="Amount", threshold_zscore=2.5,
+                     method="zscore", seasonality=None, window=None, account_col=None):
+    """
+    Detects anomalies in spending based on Z-score within each category.
+    A higher Z-score threshold means fewer, more extreme anomalies.
+
+    method="robust" scores with the median/MAD instead of mean/std, optionally
+    conditioned on `seasonality` ("day_of_month" or "weekday") and computed over
+    a trailing `window` of debits. The output has the same columns either way.
+
+    With `account_col`, statistics are partitioned by account as well as
+    category, so account holders are never scored against each other, and the
+    account column is included first in the output.
+    """
+    if method not in ANOMALY_METHODS:
+        raise ValueError(f"Unknown anomaly method '{method}'. Expected one of {list(ANOMALY_METHODS)}.")
+    if df.empty:
+        return pd.DataFrame()
+
+    # Only consider debit transactions for anomaly detection, and only the columns the result needs
+    debit_mask = df["Debit/Credit"] == "Debit"
+    columns = ["Date", "Details", amount_col, category_col]
+    if account_col is not None:
+        columns = [account_col] + columns
+    debit_transactions = df.loc[debit_mask, columns].reset_index(drop=True)
+
+    if debit_transactions.empty:
+        return pd.DataFrame()
+
+    # Ensure 'Date' column is datetime before using .dt accessor
+    debit_transactions["Date"] = pd.to_datetime(debit_transactions["Date"])
+
+    # Statistics are grouped by category, or by (account, category) when partitioned
+    group_cols = [category_col] if account_col is None else [account_col, category_col]
+    output_columns = columns[:-2] + ["Amount", category_col, "Anomaly_Reason", "ZScore"]
+    amounts = debit_transactions[amount_col]
+    if method == "robust":
+        if window is not None:
+            # Rolling statistics need each category in date order; the original order is restored below
+            order = debit_transactions["Date"].argsort(kind="stable")
+            debit_transactions = debit_transactions.iloc[order]
+            amounts = debit_transactions[amount_col]
+        debit_transactions["ZScore"] = robust_scores(
+            amounts, [debit_transactions[col] for col in group_cols], debit_transactions["Date"], seasonality, window
+        )
+        debit_transactions = debit_transactions.sort_index()
+        anomalies_df = debit_transactions[debit_transactions["ZScore"].abs() > threshold_zscore].copy()
+        anomalies_df["Anomaly_Reason"] = describe_zscores(anomalies_df["ZScore"], label="robust score")
+        return anomalies_df[output_columns]
+
+    # Mean and std dev of amounts for each category, broadcast back to every row
+    grouped = amounts.groupby([debit_transactions[col] for col in group_cols], observed=True)
+    category_mean = grouped.transform("mean")
+    category_std = grouped.transform("std")
+
+    # Z-score is undefined where std dev is 0 (e.g., all transactions in a category are the same amount)
+    debit_transactions["ZScore"] = ((amounts - category_mean) / category_std).where(category_std > 0)
+
+    # Flag anomalies based on threshold
+    anomalies_df = debit_transactions[debit_transactions["ZScore"].abs() > threshold_zscore].copy()
+    anomalies_df["Anomaly_Reason"] = describe_zscores(anomalies_df["ZScore"])
+    return anomalies_df[output_columns]
+
+
+class _CategoryStats:
+    """Running sufficient statistics for one category: weight (count), mean and M2."""
+    __slots__ = ("weight", "mean", "m2", "as_of", "window")
+
+    def __init__(self, window=None):
+        self.weight = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.as_of = None
+        self.window = deque(maxlen=window) if window else None
+
+    def add(self, amount):
+        # Welford's update
+        self.weight += 1.0
+        delta = amount - self.mean
+        self.mean += delta / self.weight
+        self.m2 += delta * (amount - self.mean)
+
+    def remove(self, amount):
+        # Welford's update in reverse, used when a value leaves the rolling window
+        if self.weight <= 1.0:
+            self.weight, self.mean, self.m2 = 0.0, 0.0, 0.0
+            return
+        self.weight -= 1.0
+        delta = amount - self.mean
+        self.mean -= delta / self.weight
+        self.m2 = max(self.m2 - delta * (amount - self.mean), 0.0)
+
+    def merge(self, weight, mean, m2):
+        # Chan et al. parallel combination of two sets of statistics
+        total = self.weight + weight
+        if total <= 0:
+            return
+        delta = mean - self.mean
+        self.mean += delta * weight / total
+        self.m2 += m2 + delta * delta * self.weight * weight / total
+        self.weight = total
+
+    def decay(self, factor):
+        self.weight *= factor
+        self.m2 *= factor
+
+    def std(self):
+        if self.weight <= 1.0:
+            return np.nan
+        return float(np.sqrt(self.m2 / (self.weight - 1.0)))
+
+
+class IncrementalAnomalyDetector:
+    """
+    Per-category z-score detector that is updated incrementally instead of
+    recomputing mean/std over the full history.
+
+    By default every debit counts equally, and after fit() the scores match
+    detect_anomalies exactly. With `half_life_days`, older debits are
+    exponentially down-weighted; with `window`, only the last `window` debits
+    of each category count. New transactions are scored in O(1) each.
+    """
+
+    def __init__(self, threshold_zscore=2.5, half_life_days=None, window=None,
+                 category_col="Category", amount_col="Amount"):
+        if half_life_days is not None and window is not None:
+            raise ValueError("Use either half_life_days or window, not both.")
+        self.threshold_zscore = threshold_zscore
+        self.half_life_days = half_life_days
+        self.window = window
+        self.category_col = category_col
+        self.amount_col = amount_col
+        self.stats = {}
+
+    def _category(self, category):
+        stats = self.stats.get(category)
+        if stats is None:
+            stats = self.stats[category] = _CategoryStats(self.window)
+        return stats
+
+    def _decay_to(self, stats, as_of):
+        if self.half_life_days is None or as_of is None:
+            return
+        if stats.as_of is not None and as_of > stats.as_of:
+            elapsed_days = (as_of - stats.as_of) / np.timedelta64(1, "D")
+            stats.decay(0.5 ** (elapsed_days / self.half_life_days))
+        if stats.as_of is None or as_of > stats.as_of:
+            stats.as_of = as_of
+
+    def update(self, category, amount, date=None):
+        """Add a single debit to the running statistics in O(1)."""
+        stats = self._category(category)
+        amount = float(amount)
+        if self.window is not None:
+            if len(stats.window) == stats.window.maxlen:
+                stats.remove(stats.window[0])
+            stats.window.append(amount)
+            stats.add(amount)
+        elif self.half_life_days is not None:
+            date = pd.Timestamp(date).to_datetime64() if date is not None else stats.as_of
+            if stats.as_of is not None and date is not None and date < stats.as_of:
+                # A late-arriving debit enters with the weight it would have today
+                weight = 0.5 ** (((stats.as_of - date) / np.timedelta64(1, "D")) / self.half_life_days)
+                stats.merge(weight, amount, 0.0)
+            else:
+                self._decay_to(stats, date)
+                stats.merge(1.0, amount, 0.0)
+        else:
+            stats.add(amount)
+
+    def score(self, category, amount):
+        """Z-score of an amount against the category's current statistics (NaN if undefined)."""
+        stats = self.stats.get(category)
+        if stats is None:
+            return np.nan
+        std = stats.std()
+        if not std > 0:
+            return np.nan
+        return (float(amount) - stats.mean) / std
+
+    def _debits(self, df):
+        columns = ["Date", "Details", self.amount_col, self.category_col]
+        debits = df.loc[df["Debit/Credit"] == "Debit", columns].reset_index(drop=True)
+        if not debits.empty:
+            debits["Date"] = pd.to_datetime(debits["Date"])
+        return debits
+
+    def _merge_batch(self, debits):
+        """Fold a frame of debits into the statistics with one grouped pass."""
+        categories = debits[self.category_col]
+        amounts = debits[self.amount_col].astype(float)
+        if self.window is not None:
+            # Only the last `window` debits per category can still be in the window
+            tail = debits.groupby(categories, observed=True, sort=False).tail(self.window)
+            for category, values in tail.groupby(self.category_col, observed=True, sort=False)[self.amount_col]:
+                for amount in values.to_numpy(dtype=float):
+                    self.update(category, amount)
+            return
+
+        if self.half_life_days is not None:
+            dates = debits["Date"]
+            batch_as_of = dates.groupby(categories, observed=True).max()
+            for category, as_of in batch_as_of.items():
+                self._decay_to(self._category(category), as_of.to_datetime64())
+            reference = categories.map({c: s.as_of for c, s in self.stats.items()})
+            ages = (pd.to_datetime(reference) - dates) / np.timedelta64(1, "D")
+            weights = 0.5 ** (ages / self.half_life_days)
+        else:
+            weights = pd.Series(1.0, index=debits.index)
+
+        weighted = pd.DataFrame({"w": weights, "wx": weights * amounts})
+        sums = weighted.groupby(categories, observed=True).sum()
+        means = sums["wx"] / sums["w"]
+        deviations = amounts - categories.map(means).astype(float)
+        m2 = (weights * deviations * deviations).groupby(categories, observed=True).sum()
+        for category in sums.index:
+            self._category(category).merge(float(sums.at[category, "w"]), float(means[category]), float(m2[category]))
+
+    def fit(self, df):
+        """Reset and build the statistics from a full history in one vectorized pass."""
+        self.stats = {}
+        return self.append(df, score=False)
+
+    def append(self, df, score=True):
+        """
+        Add newly arrived transactions without touching the existing history.
+        When `score` is true, returns the new debits that are anomalous
+        relative to the statistics as they stood before the append.
+        """
+        debits = self._debits(df)
+        flagged = pd.DataFrame()
+        if debits.empty:
+            return flagged if score else self
+        if score:
+            flagged = self._flag(debits)
+        self._merge_batch(debits)
+        return flagged if score else self
+
+    def _flag(self, debits):
+        category_mean = debits[self.category_col].map({c: s.mean for c, s in self.stats.items()}).astype(float)
+        category_std = debits[self.category_col].map({c: s.std() for c, s in self.stats.items()}).astype(float)
+        debits["ZScore"] = ((debits[self.amount_col] - category_mean) / category_std).where(category_std > 0)
+        anomalies_df = debits[debits["ZScore"].abs() > self.threshold_zscore].copy()
+        anomalies_df["Anomaly_Reason"] = describe_zscores(anomalies_df["ZScore"])
+        return anomalies_df[["Date", "Details", "Amount", self.category_col, "Anomaly_Reason", "ZScore"]]
+
+    def anomalies(self, df):
+        """Score transactions against the current statistics, in the same shape as detect_anomalies."""
+        if df.empty:
+            return pd.DataFrame()
+        debits = self._debits(df)
+        if debits.empty:
+            return pd.DataFrame()
+        return self._flag(debits)
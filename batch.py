@@ -0,0 +1,163 @@
+"""
+Batch processing CLI for FinWise.
+
+Processes every statement CSV in a directory across a pool of worker
+processes and writes, per input file, the categorized transactions, the
+flagged anomalies and a Markdown insights report:
+
+    python batch.py statements/ --output-dir reports/ --workers 8
+
+Files with an Account column are analyzed per account: anomalies are scored
+against each account's own statistics and the insights report has one
+section per account. A batch_summary.json with per-file results and overall
+throughput (files/sec, rows/sec) is written next to the reports.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from accounts import anomalies_by_account, has_accounts, insights_by_account
+from categorizer import DEFAULT_RULES_PATH, CategorizationCache
+from core import analyze_transactions, load_compiled_rules, load_transactions
+from ingestion import IngestionError, warning_messages
+from instrumentation import finish_run, stage, start_run
+from transactions import in_rupees
+
+# Compiled once per worker process by init_worker, not once per file
+_worker_rules = None
+_worker_cache = None
+
+
+def init_worker(rules_path=DEFAULT_RULES_PATH):
+    """Compile the rules and create a categorization cache for this process."""
+    global _worker_rules, _worker_cache
+    _worker_rules = load_compiled_rules(rules_path)
+    _worker_cache = CategorizationCache(_worker_rules.hash)
+
+
+def process_file(path, output_dir, budget_goals=None, chunksize=None, anomaly_options=None,
+                 amount_unit="rupees"):
+    """
+    Categorize one statement and write its reports. Returns a result dict; errors
+    are reported in it rather than raised, so one bad file does not stop a batch.
+    Reports are always written in rupees, whatever `amount_unit` is used internally.
+    The result's "stages" lists the duration, rows in/out and memory change of each step.
+    """
+    if _worker_rules is None:
+        init_worker()
+    run = start_run()
+    started = time.perf_counter()
+    name = os.path.splitext(os.path.basename(path))[0]
+    result = {"file": path, "rows": 0, "anomalies": 0, "warnings": [], "error": None}
+    try:
+        df, counts = load_transactions(path, _worker_rules, cache=_worker_cache, chunksize=chunksize,
+                                     amount_unit=amount_unit)
+        result["warnings"] = warning_messages(counts)
+        result["rows"] = len(df)
+        if df.empty:
+            result["error"] = "No valid transactions remaining after cleaning."
+            return result
+        with stage("analyze", rows_in=len(df)) as record:
+            if has_accounts(df):
+                # Anomalies are scored once for every account and reused by the per-account reports
+                anomalies_df = anomalies_by_account(df, **(anomaly_options or {}))
+                reports = insights_by_account(df, budget_goals, anomalies_df=anomalies_df)
+                insights = "\n\n".join(f"## {row[0]}\n\n{row.Insights}" for row in reports.itertuples(index=False))
+            else:
+                anomalies_df, insights = analyze_transactions(df, budget_goals, **(anomaly_options or {}))
+            record["rows_out"] = len(anomalies_df)
+        result["anomalies"] = len(anomalies_df)
+        with stage("write", rows_in=len(df)):
+            in_rupees(df).to_csv(os.path.join(output_dir, f"{name}_categorized.csv"), index=False)
+            in_rupees(anomalies_df).to_csv(os.path.join(output_dir, f"{name}_anomalies.csv"), index=False)
+            with open(os.path.join(output_dir, f"{name}_insights.md"), "w", encoding="utf-8") as f:
+                f.write(insights + "\n")
+    except IngestionError as e:
+        result["error"] = str(e)
+    except Exception as e:
+        result["error"] = f"Error processing file: {e}"
+    finally:
+        result["seconds"] = time.perf_counter() - started
+        result["stages"] = finish_run(run).stages
+    return result
+
+
+def run_batch(input_dir, output_dir, pattern="*.csv", workers=None, rules_path=DEFAULT_RULES_PATH,
+              budget_goals=None, chunksize=None, anomaly_options=None, amount_unit="rupees"):
+    """
+    Process every file matching `pattern` in `input_dir`. With workers=1 everything
+    runs in this process. Returns a summary dict including files/sec and rows/sec.
+    """
+    paths = sorted(glob.glob(os.path.join(input_dir, pattern)))
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    args = (output_dir, budget_goals, chunksize, anomaly_options, amount_unit)
+
+    started = time.perf_counter()
+    if workers == 1 or len(paths) <= 1:
+        init_worker(rules_path)
+        results = [process_file(path, *args) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(rules_path,)) as pool:
+            # Hand files out in batches so thousands of small statements do not pay one round trip each
+            batch_size = max(1, len(paths) // (workers * 4))
+            results = list(pool.map(process_file, paths, *[[arg] * len(paths) for arg in args],
+                                    chunksize=batch_size))
+    elapsed = time.perf_counter() - started
+
+    rows = sum(result["rows"] for result in results)
+    return {
+        "files": len(paths),
+        "failed": sum(1 for result in results if result["error"]),
+        "rows": rows,
+        "anomalies": sum(result["anomalies"] for result in results),
+        "workers": workers,
+        "seconds": elapsed,
+        "files_per_sec": len(paths) / elapsed if elapsed else 0.0,
+        "rows_per_sec": rows / elapsed if elapsed else 0.0,
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Categorize a directory of statement CSVs and report anomalies and insights.")
+    parser.add_argument("input_dir", help="Directory containing statement CSV files")
+    parser.add_argument("--output-dir", default="finwise_reports", help="Where to write the per-file reports")
+    parser.add_argument("--pattern", default="*.csv", help="Glob pattern for input files (default: *.csv)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--rules", default=DEFAULT_RULES_PATH, help="Categorization rules JSON file")
+    parser.add_argument("--budgets", help="JSON file of budgets, category -> amount (monthly) or {amount, period, rollover}")
+    parser.add_argument("--chunksize", type=int, default=None, help="Read each file in chunks of this many rows")
+    parser.add_argument("--threshold", type=float, default=2.5, help="Anomaly score threshold")
+    parser.add_argument("--method", choices=["zscore", "robust"], default="zscore", help="Anomaly scoring method")
+    parser.add_argument("--seasonality", choices=["day_of_month", "weekday"], default=None,
+                        help="Seasonal buckets for robust scoring")
+    parser.add_argument("--paise", action="store_true", help="Hold amounts as exact integer paise while processing")
+    args = parser.parse_args(argv)
+
+    budget_goals = None
+    if args.budgets:
+        with open(args.budgets, "r", encoding="utf-8") as f:
+            budget_goals = json.load(f)
+    anomaly_options = {"threshold_zscore": args.threshold, "method": args.method, "seasonality": args.seasonality}
+
+    summary = run_batch(args.input_dir, args.output_dir, pattern=args.pattern, workers=args.workers,
+                        rules_path=args.rules, budget_goals=budget_goals, chunksize=args.chunksize,
+                        anomaly_options=anomaly_options, amount_unit="paise" if args.paise else "rupees")
+    with open(os.path.join(args.output_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    for result in summary["results"]:
+        if result["error"]:
+            print(f"FAILED {result['file']}: {result['error']}")
+    print(f"Processed {summary['files']} files ({summary['failed']} failed), {summary['rows']:,} rows, "
+          f"{summary['anomalies']:,} anomalies in {summary['seconds']:.2f}s with {summary['workers']} workers")
+    print(f"Throughput: {summary['files_per_sec']:.1f} files/sec, {summary['rows_per_sec']:,.0f} rows/sec")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
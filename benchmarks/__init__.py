@@ -0,0 +1 @@
+"""Performance benchmarks for FinWise. Run from the repository root, e.g. `python -m benchmarks.bench_categorization`."""
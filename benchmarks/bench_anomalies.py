@@ -0,0 +1,76 @@
+"""
+Anomaly detection speed: the original row-wise apply/merge implementation
+versus the vectorized detect_anomalies, on synthetic debits.
+
+    python -m benchmarks.bench_anomalies --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from anomalies import detect_anomalies
+from categorizer import INCOME_CATEGORY, load_rules
+
+
+def legacy_detect_anomalies(df, category_col="Category", amount_col="Amount", threshold_zscore=2.5):
+    """The original implementation, kept here as the baseline."""
+    debit_transactions = df[df["Debit/Credit"] == "Debit"].copy()
+    debit_transactions["Date"] = pd.to_datetime(debit_transactions["Date"])
+    category_stats = debit_transactions.groupby(category_col)[amount_col].agg(["mean", "std"]).reset_index()
+    category_stats.rename(columns={"mean": "CategoryMean", "std": "CategoryStd"}, inplace=True)
+    debit_transactions = pd.merge(debit_transactions, category_stats, on=category_col, how="left")
+    debit_transactions["ZScore"] = debit_transactions.apply(
+        lambda row: (row[amount_col] - row["CategoryMean"]) / row["CategoryStd"]
+        if row["CategoryStd"] > 0 else np.nan, axis=1
+    )
+    anomalies_df = debit_transactions[debit_transactions["ZScore"].abs() > threshold_zscore].copy()
+    anomalies_df["Anomaly_Reason"] = anomalies_df.apply(
+        lambda row: f"Unusually high expense (Z-score: {row['ZScore']:.2f})" if row["ZScore"] > 0 else f"Unusually low expense (Z-score: {row['ZScore']:.2f})",
+        axis=1
+    )
+    return anomalies_df[["Date", "Details", "Amount", category_col, "Anomaly_Reason", "ZScore"]]
+
+
+def make_debits(rows, seed=42):
+    """Synthetic debits: lognormal amounts per category over two years."""
+    rng = np.random.default_rng(seed)
+    categories = np.array([c for c in load_rules() if c != INCOME_CATEGORY] + ["Other"])
+    category_idx = rng.integers(0, len(categories), rows)
+    scale = np.exp(rng.uniform(4, 9, len(categories)))
+    return pd.DataFrame({
+        "Date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D"),
+        "Details": "Synthetic debit",
+        "Amount": np.round(scale[category_idx] * rng.lognormal(0, 0.5, rows), 2),
+        "Debit/Credit": "Debit",
+        "Category": categories[category_idx],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    df = make_debits(args.rows)
+
+    start = time.perf_counter()
+    legacy = legacy_detect_anomalies(df)
+    legacy_secs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = detect_anomalies(df)
+    vectorized_secs = time.perf_counter() - start
+
+    if len(legacy) != len(result) or not np.allclose(legacy["ZScore"].to_numpy(), result["ZScore"].to_numpy()):
+        raise SystemExit("Vectorized anomaly detection disagrees with the legacy implementation!")
+
+    print(f"Debits:     {len(df):,} ({len(result):,} anomalies)")
+    print(f"Legacy:     {legacy_secs:8.3f}s  {len(df) / legacy_secs:14,.0f} rows/sec")
+    print(f"Vectorized: {vectorized_secs:8.3f}s  {len(df) / vectorized_secs:14,.0f} rows/sec")
+    print(f"Speedup:    {legacy_secs / vectorized_secs:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Categorization throughput: the original per-row df.apply loop versus the
+compiled CompiledRules engine, and how the engine scales as the rule file
+grows to thousands of merchant keywords.
+
+    python -m benchmarks.bench_categorization --rows 200000
+    python -m benchmarks.bench_categorization --keywords 100 1000 5000
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from categorizer import CompiledRules, load_rules
+
+SAMPLE_FILE = "finwise_sample_data_3months.csv"
+
+
+def legacy_categorize(details, debit_credit, rules):
+    """The original row-at-a-time implementation, kept here as the baseline."""
+    details_lower = str(details).lower()
+    if debit_credit == "Credit":
+        return "Income"
+    for category, patterns in rules.items():
+        if category == "Income":
+            continue
+        for pattern in patterns:
+            if re.search(pattern, details_lower):
+                return category
+    return "Other"
+
+
+def regex_only_match(details_lower, category_patterns):
+    """One regex alternation per category, tried in file order: the approach before the keyword automaton."""
+    for category, pattern in category_patterns:
+        if pattern.search(details_lower):
+            return category
+    return "Other"
+
+
+def synthetic_rules(rules, keywords, seed=42):
+    """The bundled rules plus `keywords` random merchant names spread over the existing categories."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    grown = {category: list(patterns) for category, patterns in rules.items()}
+    categories = [category for category in grown if category != "Income"]
+    for _ in range(keywords):
+        name = "".join(rng.choice(letters, rng.integers(6, 12)))
+        grown[categories[rng.integers(len(categories))]].append(f"{name} store")
+    return grown
+
+
+def keyword_scaling(df, rules, sizes):
+    """Match rate of the compiled engine and of per-category regexes as the keyword count grows (no caching)."""
+    details = df["Details"].str.lower().tolist()
+    print(f"{'keywords':>9} {'automaton matches/s':>20} {'regex-only matches/s':>21}")
+    for size in sizes:
+        grown = synthetic_rules(rules, size)
+        compiled = CompiledRules(grown)
+        start = time.perf_counter()
+        fast = [compiled.match(text) or "Other" for text in details]
+        fast_secs = time.perf_counter() - start
+
+        patterns = [(category, re.compile("|".join(f"(?:{p})" for p in grown[category])))
+                    for category in compiled.categories]
+        start = time.perf_counter()
+        slow = [regex_only_match(text, patterns) for text in details]
+        slow_secs = time.perf_counter() - start
+        if fast != slow:
+            raise SystemExit("Keyword automaton disagrees with the regex-only matcher!")
+        print(f"{sum(len(p) for p in grown.values()):>9,} {len(details) / fast_secs:>17,.0f} "
+              f"{len(details) / slow_secs:>18,.0f}")
+
+
+def make_frame(rows, seed=42):
+    """Resample the bundled sample statement up to the requested number of rows."""
+    sample = pd.read_csv(SAMPLE_FILE)
+    rng = np.random.default_rng(seed)
+    return sample.iloc[rng.integers(0, len(sample), rows)].reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--keywords", type=int, nargs="*", help="Extra synthetic keywords to scale the rule file by")
+    args = parser.parse_args()
+
+    rules = load_rules()
+    df = make_frame(args.rows)
+    if args.keywords:
+        keyword_scaling(df, rules, args.keywords)
+        return
+
+    start = time.perf_counter()
+    legacy = df.apply(lambda row: legacy_categorize(row["Details"], row["Debit/Credit"], rules), axis=1)
+    legacy_secs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = CompiledRules(rules)
+    result = compiled.categorize(df["Details"], df["Debit/Credit"])
+    compiled_secs = time.perf_counter() - start
+
+    if not (legacy.to_numpy() == result.to_numpy()).all():
+        raise SystemExit("Compiled categorization disagrees with the legacy implementation!")
+
+    print(f"Rows:     {len(df):,}")
+    print(f"Legacy:   {legacy_secs:8.3f}s  {len(df) / legacy_secs:14,.0f} rows/sec")
+    print(f"Compiled: {compiled_secs:8.3f}s  {len(df) / compiled_secs:14,.0f} rows/sec (incl. compilation)")
+    print(f"Speedup:  {legacy_secs / compiled_secs:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
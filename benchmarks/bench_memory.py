@@ -0,0 +1,33 @@
+"""
+Session memory per transaction: processed transactions as loaded versus the
+compact representation kept in st.session_state.
+
+    python -m benchmarks.bench_memory --rows 1000000
+"""
+import argparse
+
+from benchmarks.bench_categorization import make_frame
+from categorizer import CompiledRules, load_rules
+from ingestion import clean_chunk, new_warning_counts
+from transactions import compact_transactions, memory_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    df = clean_chunk(make_frame(args.rows), new_warning_counts())
+    df["Category"] = CompiledRules(load_rules()).categorize(df["Details"], df["Debit/Credit"])
+
+    print(f"Rows: {len(df):,}")
+    for amount_dtype in ["float64", "float32"]:
+        report = memory_report(df, compact_transactions(df, amount_dtype=amount_dtype))
+        print(f"Compact ({amount_dtype} amounts): "
+              f"{report['before']['bytes_per_transaction']:7.1f} -> {report['after']['bytes_per_transaction']:5.1f} bytes/transaction "
+              f"({report['before']['bytes'] / 2**20:,.1f} MiB -> {report['after']['bytes'] / 2**20:,.1f} MiB, "
+              f"{report['reduction']:.0%} smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+End-to-end pipeline benchmark: every stage of an upload, run headlessly on
+synthetic statements shaped like finwise_sample_data_3months.csv, at several
+sizes. Records wall time, peak RSS and rows/sec per stage and writes JSON
+that can be compared across commits:
+
+    python -m benchmarks.bench_pipeline --sizes 10000 100000 1000000 10000000 --output bench.json
+    python -m benchmarks.bench_pipeline --compare baseline.json --output bench.json
+
+Stages, in order, each fed by the previous one:
+    load        read and clean the CSV (the parsing half of load_and_process_file)
+    categorize  process_transactions_advanced, then compact and date-sort
+    aggregate   build the AggregateCube used by the sidebar, tabs and charts
+    anomalies   detect_anomalies
+    insights    generate_smart_insights
+    charts      create_enhanced_visualizations, including serializing the figures
+
+Each size runs in a fresh process so peak RSS is not inflated by earlier,
+larger runs. Statement files are generated once into --data-dir and reused.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+import random_data_generator
+from aggregates import AggregateCube
+from anomalies import detect_anomalies
+from categorizer import load_rules
+from charts import build_figures
+from core import generate_smart_insights, load_compiled_rules, process_transactions
+from ingestion import read_transactions
+from instrumentation import current_rss_bytes, max_rss_bytes
+from transactions import compact_transactions, sort_by_date
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+STAGES = ["load", "categorize", "aggregate", "anomalies", "insights", "charts"]
+# Two years of history: long enough for weekly trend bins and month-over-month insights
+DEFAULT_START = "2023-01-01"
+DEFAULT_END = "2024-12-31"
+# A stage counts as a regression when it is this much slower than the baseline
+DEFAULT_TOLERANCE = 0.20
+
+
+class PeakRSS:
+    """Samples RSS on a background thread while a stage runs, to find that stage's own peak."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes() or 0)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_bytes() or 0
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes() or 0)
+        if not self.peak:
+            self.peak = max_rss_bytes() # No /proc: fall back to the process high-water mark
+
+
+def statement_path(data_dir, rows, seed):
+    return os.path.join(data_dir, f"statement_{rows}_{seed}.csv")
+
+
+def ensure_statement(data_dir, rows, seed, start=DEFAULT_START, end=DEFAULT_END):
+    """Generate the synthetic statement for `rows` unless it is already on disk."""
+    path = statement_path(data_dir, rows, seed)
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        random_data_generator.write_transactions(tmp_path, rows=rows, file_format="csv", start=start, end=end,
+                                                 seed=seed)
+        os.replace(tmp_path, path)
+    return path
+
+
+def run_size(path, rows, repeat=1):
+    """
+    Run every stage on one statement file and return one result dict per stage.
+    With repeat > 1 each stage is re-run on the same input and the fastest run is kept.
+    """
+    rules = load_compiled_rules()
+    budget_goals = {category: 10_000.0 for category in load_rules() if not category.startswith("_")}
+
+    def categorize(df):
+        # A fresh frame each time, since categorization adds the Category column in place
+        return compact_transactions(sort_by_date(process_transactions(df.copy(), rules)))
+
+    def charts(cube):
+        figures = build_figures(cube)
+        return sum(len(figure.to_json()) for figure in figures if figure is not None)
+
+    inputs = {}
+    steps = {
+        "load": lambda: read_transactions(path)[0],
+        "categorize": lambda: categorize(inputs["load"]),
+        "aggregate": lambda: AggregateCube.build(inputs["categorize"]),
+        "anomalies": lambda: detect_anomalies(inputs["categorize"]),
+        "insights": lambda: generate_smart_insights(inputs["categorize"], budget_goals, inputs["anomalies"],
+                                                    cube=inputs["aggregate"]),
+        "charts": lambda: charts(inputs["aggregate"]),
+    }
+    results = []
+    for stage in STAGES:
+        timings = []
+        for _ in range(repeat):
+            with PeakRSS() as rss:
+                started = time.perf_counter()
+                output = steps[stage]()
+                timings.append(time.perf_counter() - started)
+        inputs[stage] = output
+        seconds = min(timings)
+        result = {
+            "rows": rows,
+            "stage": stage,
+            "seconds": seconds,
+            "rows_per_sec": rows / seconds if seconds else None,
+            "peak_rss_mb": rss.peak / 2**20,
+        }
+        if stage == "anomalies":
+            result["anomalies"] = len(output)
+        if stage == "charts":
+            result["figure_bytes"] = output
+        results.append(result)
+    return results
+
+
+def environment():
+    """What the numbers were measured on, so results from different machines are not confused."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        "commit": commit,
+        "uncommitted_changes": dirty,
+        "timestamp": pd.Timestamp.now(tz="UTC").isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Stages slower than the baseline by more than `tolerance` (a fraction), matched on
+    (rows, stage). Returns a list of {rows, stage, baseline_seconds, seconds, slowdown}.
+    """
+    previous = {(r["rows"], r["stage"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["rows"], result["stage"]))
+        if before is None or not before["seconds"]:
+            continue
+        slowdown = result["seconds"] / before["seconds"] - 1
+        if slowdown > tolerance:
+            regressions.append({"rows": result["rows"], "stage": result["stage"],
+                                "baseline_seconds": before["seconds"], "seconds": result["seconds"],
+                                "slowdown": slowdown})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Row counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "finwise_bench"),
+                        help="Where generated statements are cached between runs")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown before a stage is flagged (default: 0.20 = 20%%)")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'rows':>11} {'stage':<11} {'seconds':>9} {'rows/sec':>14} {'peak RSS':>10}")
+    for rows in args.sizes:
+        path = ensure_statement(args.data_dir, rows, args.seed)
+        # A fresh interpreter per size; spawn rather than fork so nothing is inherited
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            size_results = pool.submit(run_size, path, rows, args.repeat).result()
+        for result in size_results:
+            print(f"{rows:>11,} {result['stage']:<11} {result['seconds']:>9.3f} "
+                  f"{result['rows_per_sec'] or 0:>14,.0f} {result['peak_rss_mb']:>8.0f}MB")
+        results.extend(size_results)
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"\nCompared with {args.compare} (commit {baseline['environment'].get('commit')}):")
+        for regression in regressions:
+            print(f"  REGRESSION {regression['rows']:,} rows / {regression['stage']}: "
+                  f"{regression['baseline_seconds']:.3f}s -> {regression['seconds']:.3f}s "
+                  f"(+{regression['slowdown']:.0%})")
+        if regressions:
+            raise SystemExit(1)
+        print(f"  No stage slower by more than {args.tolerance:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
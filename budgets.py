@@ -0,0 +1,183 @@
+"""
+Budget tracking for FinWise.
+
+Budgets are set per category for a weekly, monthly or yearly period and may
+roll over: unused budget (or overspending) from earlier periods is carried
+into the current one. A budget is either a plain amount, meaning a monthly
+budget without rollover, or {"amount": ..., "period": "Week"|"Month"|"Year",
+"rollover": bool}.
+
+Spending is kept in SpendCounters: debit totals per (group, period, period
+number, category). The counters are built from an AggregateCube or from
+transactions and are updated incrementally as new transactions arrive, so
+period-to-date spend is a lookup instead of a groupby over the history.
+evaluate_budgets evaluates every budget at once: spend so far, carried amount,
+remaining budget, daily burn rate and the projected overrun at period end.
+"""
+import numpy as np
+import pandas as pd
+
+from transactions import in_rupees
+
+BUDGET_PERIODS = ["Week", "Month", "Year"]
+DEFAULT_PERIOD = "Month"
+# Group of counters built without a group column (as in insights.py)
+ALL = "All"
+STATUS_COLUMNS = [
+    "Category", "Period", "Budget", "Carried", "Available", "Spent", "Remaining",
+    "Burn Rate", "Projected", "Projected Overrun", "Period End",
+]
+COUNTER_LEVELS = ["Group", "Period", "Number", "Category"]
+
+
+def is_budget_spec(value):
+    """True for a single budget: an amount or a {"amount", "period", "rollover"} mapping."""
+    return not isinstance(value, dict) or "amount" in value
+
+
+def normalize_budgets(budget_goals):
+    """
+    Budgets as a frame with Category, Budget, Period and Rollover, one row per
+    positive budget, in the order given. Raises ValueError for an unknown period.
+    """
+    rows = []
+    for category, spec in (budget_goals or {}).items():
+        if not isinstance(spec, dict):
+            spec = {"amount": spec}
+        period = spec.get("period", DEFAULT_PERIOD)
+        if period not in BUDGET_PERIODS:
+            raise ValueError(f"Unknown budget period '{period}' for {category}. Expected one of {BUDGET_PERIODS}.")
+        amount = float(spec.get("amount") or 0.0)
+        if amount > 0:
+            rows.append((category, amount, period, bool(spec.get("rollover", False))))
+    return pd.DataFrame(rows, columns=["Category", "Budget", "Period", "Rollover"])
+
+
+def period_numbers(days, period):
+    """Consecutive integer number of the week (from Monday), month or year of each datetime64[D] day."""
+    days = np.asarray(days, dtype="datetime64[D]")
+    if period == "Week":
+        # 1970-01-01 was a Thursday, so day numbers shifted by 3 count from a Monday
+        return (days.astype(np.int64) + 3) // 7
+    if period == "Month":
+        return days.astype("datetime64[M]").astype(np.int64)
+    return days.astype("datetime64[Y]").astype(np.int64)
+
+
+def period_start(numbers, period):
+    """First day (datetime64[D]) of the periods with the given numbers."""
+    numbers = np.asarray(numbers, dtype=np.int64)
+    if period == "Week":
+        return (numbers * 7 - 3).astype("datetime64[D]")
+    unit = "datetime64[M]" if period == "Month" else "datetime64[Y]"
+    return numbers.astype(unit).astype("datetime64[D]")
+
+
+class SpendCounters:
+    """Debit totals in rupees per (group, period, period number, category), updated incrementally."""
+
+    def __init__(self):
+        self.spend = pd.Series(dtype=float, index=pd.MultiIndex.from_arrays([[]] * 4, names=COUNTER_LEVELS))
+        self.first_day = pd.Series(dtype="datetime64[ns]")
+        self.last_day = pd.Series(dtype="datetime64[ns]")
+
+    @classmethod
+    def build(cls, df, group_col=None):
+        return cls().add(df, group_col)
+
+    @classmethod
+    def from_cube(cls, cube, group_col=None):
+        """Counters from an AggregateCube's daily cells, without touching the transactions."""
+        counters = cls()
+        debits = cube.debits().cells
+        groups = debits[group_col] if group_col in debits.columns else ALL
+        counters._fold(debits["Date"], debits["Category"], debits["Sum"] / cube.scale, groups)
+        return counters
+
+    def add(self, df, group_col=None):
+        """Fold new transactions into the counters. Only their debits are read."""
+        debits = df[df["Debit/Credit"] == "Debit"]
+        groups = debits[group_col] if group_col is not None else ALL
+        self._fold(debits["Date"], debits["Category"], in_rupees(debits)["Amount"].astype(float), groups)
+        return self
+
+    def _fold(self, dates, categories, amounts, groups):
+        if len(dates) == 0:
+            return
+        daily = pd.DataFrame({
+            "Group": groups, "Day": dates.to_numpy().astype("datetime64[D]"),
+            "Category": categories, "Sum": amounts.to_numpy(),
+        })
+        # Roll up to days first; each period is then a rollup of the (much smaller) daily totals
+        daily["Group"] = daily["Group"].astype(str)
+        daily["Category"] = daily["Category"].astype(str)
+        daily = daily.groupby(["Group", "Day", "Category"], sort=False)["Sum"].sum().reset_index()
+        days = daily["Day"].to_numpy().astype("datetime64[D]")
+        parts = []
+        for period in BUDGET_PERIODS:
+            keys = [daily["Group"], pd.Series(period, index=daily.index), pd.Series(period_numbers(days, period)),
+                    daily["Category"]]
+            parts.append(daily["Sum"].groupby(keys, sort=False).sum())
+        added = pd.concat(parts)
+        added.index.names = COUNTER_LEVELS
+        self.spend = self.spend.add(added, fill_value=0.0) if len(self.spend) else added.sort_index()
+        by_group = daily.groupby("Group")["Day"]
+        self.first_day = pd.concat([self.first_day, by_group.min()]).groupby(level=0).min()
+        self.last_day = pd.concat([self.last_day, by_group.max()]).groupby(level=0).max()
+
+    def groups(self):
+        return self.last_day.index.tolist()
+
+
+def evaluate_budgets(counters, budget_goals, group=ALL, as_of=None):
+    """
+    Every budget of one group in its current period, as of `as_of` (default: the
+    group's latest debit). Returns STATUS_COLUMNS in the budgets' order: Available
+    is the budget plus any amount carried over, Burn Rate is spend per elapsed day,
+    Projected the spend at that rate by Period End, and Projected Overrun how far
+    that exceeds Available (0 when on track).
+    """
+    budgets = normalize_budgets(budget_goals)
+    if budgets.empty or group not in counters.last_day.index:
+        return pd.DataFrame(columns=STATUS_COLUMNS)
+    as_of = np.datetime64(pd.Timestamp(as_of if as_of is not None else counters.last_day[group]), "D")
+    first_day = np.datetime64(counters.first_day[group], "D")
+    periods = budgets["Period"].to_numpy()
+
+    # Current and first period of each budget's period type, as arrays aligned with the budgets
+    current = np.empty(len(budgets), dtype=np.int64)
+    first = np.empty(len(budgets), dtype=np.int64)
+    starts = np.empty(len(budgets), dtype="datetime64[D]")
+    ends = np.empty(len(budgets), dtype="datetime64[D]")
+    for period in np.unique(periods):
+        rows = periods == period
+        current[rows] = period_numbers([as_of], period)[0]
+        first[rows] = period_numbers([first_day], period)[0]
+        starts[rows] = period_start(current[rows], period)
+        ends[rows] = period_start(current[rows] + 1, period)
+
+    spend = counters.spend.xs(group, level="Group")
+    lookup = pd.MultiIndex.from_arrays([periods, current, budgets["Category"].to_numpy()])
+    spent = spend.reindex(lookup, fill_value=0.0).to_numpy()
+
+    # Rollover: every earlier period since the first debit adds (budget - spent) to this one
+    current_by_period = pd.Series(dict(zip(periods, current)))
+    spend_current = current_by_period.reindex(spend.index.get_level_values("Period")).to_numpy()
+    earlier = spend[spend.index.get_level_values("Number").to_numpy() < spend_current]
+    earlier_spent = earlier.groupby(level=["Period", "Category"]).sum().reindex(
+        pd.MultiIndex.from_arrays([periods, budgets["Category"].to_numpy()]), fill_value=0.0
+    ).to_numpy()
+    amounts = budgets["Budget"].to_numpy()
+    carried = np.where(budgets["Rollover"].to_numpy(), np.maximum(current - first, 0) * amounts - earlier_spent, 0.0)
+
+    available = amounts + carried
+    elapsed_days = (as_of - starts).astype(np.int64) + 1
+    period_days = (ends - starts).astype(np.int64)
+    burn_rate = spent / elapsed_days
+    projected = burn_rate * period_days
+    return pd.DataFrame({
+        "Category": budgets["Category"], "Period": periods, "Budget": amounts, "Carried": carried,
+        "Available": available, "Spent": spent, "Remaining": available - spent, "Burn Rate": burn_rate,
+        "Projected": projected, "Projected Overrun": np.clip(projected - available, 0.0, None),
+        "Period End": pd.to_datetime(ends - np.timedelta64(1, "D")),
+    }, columns=STATUS_COLUMNS)
@@ -0,0 +1,601 @@
+"""
+Rule-based categorization engine for FinWise.
+
+The keyword rules in categories.json are compiled once so a whole column of
+transaction details can be categorized in one call instead of one df.apply
+row at a time. Plain keywords (almost all of them) go into a single
+Aho-Corasick automaton that scans each description once, however many
+keywords there are; only patterns that really are regular expressions are
+run through `re`. Results can be memoized across calls in a
+CategorizationCache keyed on the normalized description.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "categories.json")
+INCOME_CATEGORY = "Income"
+DEFAULT_CATEGORY = "Other"
+# Optional rules entry, {category: priority}; higher priorities take precedence over file order
+PRIORITIES_KEY = "_priorities"
+# A pattern containing any of these is treated as a regular expression rather than a plain keyword
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+
+
+def load_rules(file_path=DEFAULT_RULES_PATH):
+    """Load the category -> keyword patterns mapping (plus optional "_priorities") from a JSON file."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_rules(rules, file_path=DEFAULT_RULES_PATH):
+    """Write rules back as JSON, one category per line as in the shipped file. Writes are atomic."""
+    lines = [f"    {json.dumps(category, ensure_ascii=False)}: {json.dumps(patterns, ensure_ascii=False)}"
+             for category, patterns in rules.items()]
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("{\n" + ",\n".join(lines) + "\n}\n")
+    os.replace(tmp_path, file_path)
+
+
+def add_keyword(category, details, file_path=DEFAULT_RULES_PATH):
+    """
+    Learn a literal keyword rule: the normalized description becomes a pattern of `category`.
+    A missing rules file is created, so this also builds up an overlay for merge_rules().
+    Returns the updated rules (unchanged if the keyword was already there).
+    """
+    rules = load_rules(file_path) if os.path.exists(file_path) else {}
+    keyword = normalize_details(details).strip()
+    if not is_literal(keyword):
+        keyword = re.escape(keyword)
+    patterns = rules.setdefault(category, [])
+    if keyword not in patterns:
+        patterns.append(keyword)
+        save_rules(rules, file_path)
+    return rules
+
+
+def merge_rules(rules, overlay):
+    """
+    Rules with an overlay's patterns appended to their categories (new categories go last).
+    Learned keywords are kept in an overlay like this instead of in the shipped categories.json.
+    """
+    merged = dict(rules)
+    for category, patterns in overlay.items():
+        if category != PRIORITIES_KEY:
+            existing = merged.get(category, [])
+            merged[category] = existing + [pattern for pattern in patterns if pattern not in existing]
+    return merged
+
+
+def hash_rules(rules):
+    """Stable fingerprint of a rule set. Category order is significant, so keys are not sorted."""
+    payload = json.dumps(rules, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_details(details):
+    """Normalize a description for matching and caching: lowercased, exactly as the original per-row loop did."""
+    return str(details).lower()
+
+
+def is_literal(pattern):
+    """True if a pattern has no regex metacharacters, so a plain substring search gives the same result."""
+    return REGEX_METACHARACTERS.isdisjoint(pattern)
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over literal keywords, each tagged with a rank.
+
+    The trie keeps only its own edges (goto) plus a failure link per node, the
+    longest proper suffix that is also a trie path, so memory grows with the
+    total keyword length rather than with keywords times alphabet. best_rank()
+    follows failure links on a mismatch; each character of a text moves forward
+    once and the failure steps are amortized against it, so a text is scanned
+    in linear time however many keywords there are. matches() reports every
+    keyword occurring in a text by following output links (the nearest failure
+    ancestor at which a keyword ends).
+    """
+    NO_MATCH = sys.maxsize
+
+    def __init__(self, keywords):
+        """`keywords` is an iterable of (keyword, rank) pairs; lower ranks win."""
+        goto = [{}]
+        rank = [self.NO_MATCH]
+        ranks_at = {}
+        for keyword, keyword_rank in keywords:
+            node = 0
+            for char in keyword:
+                child = goto[node].get(char)
+                if child is None:
+                    child = len(goto)
+                    goto[node][char] = child
+                    goto.append({})
+                    rank.append(self.NO_MATCH)
+                node = child
+            rank[node] = min(rank[node], keyword_rank)
+            ranks_at.setdefault(node, []).append(keyword_rank)
+
+        # Breadth-first over the trie, so a node's failure target is always finished before it;
+        # each node's best rank also covers every keyword that ends at one of its suffixes
+        fail = [0] * len(goto)
+        output = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            rank[node] = min(rank[node], rank[fail[node]])
+            output[node] = fail[node] if fail[node] in ranks_at else output[fail[node]]
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0) if node else 0
+                queue.append(child)
+        self._goto = goto
+        self._fail = fail
+        self._rank = rank
+        self._ranks_at = ranks_at
+        self._output = output
+
+    def __len__(self):
+        return len(self._goto)
+
+    def best_rank(self, text):
+        """Smallest rank of any keyword occurring in `text`, or NO_MATCH."""
+        goto = self._goto
+        fail = self._fail
+        rank = self._rank
+        state = 0
+        best = rank[0]
+        for char in text:
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            state = next_state or 0
+            if rank[state] < best:
+                best = rank[state]
+        return best
+
+    def matches(self, text):
+        """Ranks of every keyword occurring in `text` (once per keyword, in no particular order)."""
+        goto = self._goto
+        fail = self._fail
+        ranks_at = self._ranks_at
+        output = self._output
+        found = set()
+        state = 0
+        for char in text:
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            state = next_state or 0
+            node = state if state in ranks_at else output[state]
+            while node:
+                found.update(ranks_at[node])
+                node = output[node]
+        return found
+
+
+class CategorizationCache:
+    """
+    Bounded LRU cache of normalized description -> debit category.
+
+    The cache is tied to the hash of the rules that produced its entries and
+    empties itself as soon as it is used with a different rule set.
+    """
+
+    def __init__(self, rules_hash=None, max_entries=100_000):
+        self.rules_hash = rules_hash
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.dirty = False
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ensure_rules(self, rules_hash):
+        """Drop every entry if they were computed with a different rule set."""
+        with self._lock:
+            if self.rules_hash != rules_hash:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.rules_hash = rules_hash
+                self.dirty = True
+
+    def get(self, key):
+        """Return the cached category for a normalized description, or None."""
+        with self._lock:
+            category = self._entries.get(key)
+            if category is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return category
+
+    def put(self, key, category):
+        with self._lock:
+            self._entries[key] = category
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self.dirty = True
+
+    def save(self, file_path):
+        """Persist the cache as JSON (least recently used first). Writes are atomic."""
+        with self._lock:
+            payload = {"rules_hash": self.rules_hash, "entries": list(self._entries.items())}
+            self.dirty = False
+        directory = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path, rules_hash, max_entries=100_000):
+        """Load a persisted cache, starting empty if it is missing, unreadable or built from other rules."""
+        cache = cls(rules_hash, max_entries=max_entries)
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return cache
+        if payload.get("rules_hash") == rules_hash:
+            for key, category in payload.get("entries", [])[-max_entries:]:
+                cache._entries[key] = category
+        return cache
+
+    def stats(self):
+        """Counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def metrics_text(self):
+        """Counters in the Prometheus text exposition format."""
+        stats = self.stats()
+        lines = []
+        for name, kind, help_text in [
+            ("hits", "counter", "Categorization cache lookups served from the cache."),
+            ("misses", "counter", "Categorization cache lookups that ran the rules."),
+            ("evictions", "counter", "Entries evicted by the LRU bound."),
+            ("invalidations", "counter", "Times the cache was emptied because the rules changed."),
+            ("entries", "gauge", "Entries currently held in the cache."),
+        ]:
+            metric = f"finwise_categorization_cache_{name}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {stats[name]}")
+        return "\n".join(lines) + "\n"
+
+
+class RuleProfile:
+    """
+    Per-rule hit counts and cumulative match time collected while categorizing.
+
+    Hits are counted per transaction for the rule that decided its category.
+    Regex rules are timed individually; keyword rules share one automaton scan,
+    whose time is reported separately.
+    """
+
+    def __init__(self, rule_count):
+        self.hits = np.zeros(rule_count, dtype=np.int64)
+        self.seconds = np.zeros(rule_count)
+        self.automaton_seconds = 0.0
+        self.unmatched = 0
+
+    def reset(self):
+        self.hits[:] = 0
+        self.seconds[:] = 0.0
+        self.automaton_seconds = 0.0
+        self.unmatched = 0
+
+
+class CompiledRules:
+    """
+    Precompiled form of the categorization rules.
+
+    Semantics match the original per-row loop: credits are always "Income",
+    debits get the first category (in file order) with a matching pattern,
+    and unmatched debits fall back to "Other". An optional "_priorities"
+    entry in the rules, {category: priority}, makes precedence explicit:
+    higher priorities win, and categories without one (priority 0) keep their
+    file order among themselves.
+    """
+
+    def __init__(self, rules, profile=False):
+        self.rules = rules
+        self.hash = hash_rules(rules)
+        self.priorities = rules.get(PRIORITIES_KEY, {})
+        # "Income" only applies to credits, and a category without patterns can never match
+        matchable = [category for category, patterns in rules.items()
+                     if category not in (INCOME_CATEGORY, PRIORITIES_KEY) and patterns]
+        # Precedence order: highest priority first, file order within a priority (sorted() is stable)
+        self.categories = sorted(matchable, key=lambda category: -self.priorities.get(category, 0))
+
+        # Every rule gets an id in precedence order, so the smallest matching id decides the category
+        # and identifies the rule that fired. Literal keywords go into one automaton; only real regexes
+        # are compiled with re.
+        self.patterns = [(pattern, category) for category in self.categories for pattern in rules[category]]
+        keywords = []
+        self._regex_fallback = []
+        for rule_id, (pattern, category) in enumerate(self.patterns):
+            if is_literal(pattern):
+                keywords.append((pattern, rule_id))
+            else:
+                self._regex_fallback.append((rule_id, re.compile(pattern)))
+        self._keywords = KeywordAutomaton(keywords)
+        self.profile = RuleProfile(len(self.patterns)) if profile else None
+
+    def match_rule(self, details_lower):
+        """Return the id of the rule that decides already-lowercased details, or None if none matches."""
+        if self.profile is not None:
+            return self._match_rule_profiled(details_lower)
+        best = self._keywords.best_rank(details_lower)
+        # Regexes only matter if they rank ahead of the best keyword hit
+        for rule_id, pattern in self._regex_fallback:
+            if rule_id >= best:
+                break
+            if pattern.search(details_lower):
+                return rule_id
+        return best if best < len(self.patterns) else None
+
+    def _match_rule_profiled(self, details_lower):
+        profile = self.profile
+        start = time.perf_counter()
+        best = self._keywords.best_rank(details_lower)
+        profile.automaton_seconds += time.perf_counter() - start
+        for rule_id, pattern in self._regex_fallback:
+            if rule_id >= best:
+                break
+            start = time.perf_counter()
+            found = pattern.search(details_lower)
+            profile.seconds[rule_id] += time.perf_counter() - start
+            if found:
+                return rule_id
+        return best if best < len(self.patterns) else None
+
+    def match(self, details_lower):
+        """Return the debit category for already-lowercased details, or None if no rule matches."""
+        rule_id = self.match_rule(details_lower)
+        return None if rule_id is None else self.patterns[rule_id][1]
+
+    def explain(self, details, debit_credit):
+        """(category, pattern that fired) for one transaction; the pattern is None for credits and fallbacks."""
+        if debit_credit == "Credit":
+            return INCOME_CATEGORY, None
+        rule_id = self.match_rule(normalize_details(details))
+        if rule_id is None:
+            return DEFAULT_CATEGORY, None
+        pattern, category = self.patterns[rule_id]
+        return category, pattern
+
+    def categorize_one(self, details, debit_credit):
+        """Categorize a single transaction."""
+        if debit_credit == "Credit":
+            return INCOME_CATEGORY
+        return self.match(normalize_details(details)) or DEFAULT_CATEGORY
+
+    def categorize(self, details, debit_credit, cache=None):
+        """
+        Categorize whole columns at once.
+
+        Each distinct description is matched once and the result is broadcast
+        back to every row that shares it. With a cache, descriptions seen in
+        earlier calls are not matched again. While profiling, the cache is
+        bypassed so every rule's hits and cost are measured.
+        """
+        codes, uniques = pd.factorize(details, use_na_sentinel=False)
+        if self.profile is not None:
+            return self._categorize_profiled(codes, uniques, details, debit_credit)
+        if cache is None:
+            unique_categories = [self.match(normalize_details(value)) or DEFAULT_CATEGORY for value in uniques]
+        else:
+            cache.ensure_rules(self.hash)
+            unique_categories = []
+            for value in uniques:
+                key = normalize_details(value)
+                category = cache.get(key)
+                if category is None:
+                    category = self.match(key) or DEFAULT_CATEGORY
+                    cache.put(key, category)
+                unique_categories.append(category)
+        unique_categories = np.array(unique_categories, dtype=object)
+        categories = unique_categories[codes]
+        categories[np.asarray(debit_credit == "Credit")] = INCOME_CATEGORY
+        return pd.Series(categories, index=details.index, name="Category")
+
+    def _categorize_profiled(self, codes, uniques, details, debit_credit):
+        # -1 marks descriptions no rule matched
+        rule_ids = np.array([-1 if rule_id is None else rule_id
+                             for rule_id in (self.match_rule(normalize_details(value)) for value in uniques)],
+                            dtype=np.int64)
+        row_rules = rule_ids[codes]
+        is_credit = np.asarray(debit_credit == "Credit")
+        debit_rules = row_rules[~is_credit]
+        self.profile.hits += np.bincount(debit_rules[debit_rules >= 0], minlength=len(self.patterns))
+        self.profile.unmatched += int((debit_rules < 0).sum())
+        rule_categories = np.array([category for _, category in self.patterns] + [DEFAULT_CATEGORY], dtype=object)
+        categories = rule_categories[row_rules]  # -1 picks the trailing DEFAULT_CATEGORY
+        categories[is_credit] = INCOME_CATEGORY
+        return pd.Series(categories, index=details.index, name="Category")
+
+    def rule_stats(self):
+        """One row per rule with its kind, hits and (for regexes) cumulative match time, in precedence order."""
+        if self.profile is None:
+            raise ValueError("Rule statistics need profiling; create CompiledRules(rules, profile=True).")
+        return pd.DataFrame({
+            "Pattern": [pattern for pattern, _ in self.patterns],
+            "Category": [category for _, category in self.patterns],
+            "Kind": ["keyword" if is_literal(pattern) else "regex" for pattern, _ in self.patterns],
+            "Hits": self.profile.hits,
+            "Seconds": np.where([is_literal(pattern) for pattern, _ in self.patterns], np.nan, self.profile.seconds),
+        })
+
+    def conflicts(self):
+        """
+        Keyword rules that overlap across categories, in precedence order:
+
+        - "duplicate": the same keyword in two categories; the lower one never fires.
+        - "shadowed": a higher-precedence keyword is contained in this one, so whenever
+          this keyword matches the other does too, and this rule never fires.
+        - "overlap": this keyword is contained in a higher-precedence one, so descriptions
+          containing the longer keyword go to the other category.
+
+        Regex rules cannot be compared statically and are not reported.
+        """
+        # Only keywords that contain one another can conflict. Running each keyword through the
+        # automaton finds the keywords inside it, which gives both directions of containment
+        # without comparing every pair.
+        keyword_ids = [rule_id for rule_id, (pattern, _) in enumerate(self.patterns) if is_literal(pattern)]
+        contained = {rule_id: self._keywords.matches(self.patterns[rule_id][0]) for rule_id in keyword_ids}
+        containers = {rule_id: set() for rule_id in keyword_ids}
+        for rule_id, inside in contained.items():
+            for other_id in inside:
+                containers[other_id].add(rule_id)
+
+        conflicts = []
+        for rule_id in keyword_ids:
+            pattern, category = self.patterns[rule_id]
+            for other_id in sorted((contained[rule_id] | containers[rule_id]) - {rule_id}):
+                other, other_category = self.patterns[other_id]
+                if other_id > rule_id:
+                    break
+                if other_category == category:
+                    continue
+                if other == pattern:
+                    kind = "duplicate"
+                elif other in pattern:
+                    kind = "shadowed"
+                else:
+                    kind = "overlap"
+                conflicts.append({"kind": kind, "pattern": pattern, "category": category,
+                                  "winning_pattern": other, "winning_category": other_category})
+                if kind != "overlap":
+                    break  # Dead already; the first (highest-precedence) cause is enough
+        return conflicts
+
+
+class RulesProvider:
+    """
+    Serves the current CompiledRules for a rules file and hot-reloads it.
+
+    The file's mtime and size are checked at most every `check_interval`
+    seconds; when they change and the content hash differs, the rules are
+    recompiled off to the side and swapped in with a single reference
+    assignment, so a reader always sees one complete rule set. A file that
+    fails to parse or compile is reported in `last_error` and the previous
+    rules stay in service. Subscribers are called with (old, new) after
+    every swap, so only the caches tied to the old rules need dropping.
+    """
+
+    def __init__(self, file_path=DEFAULT_RULES_PATH, check_interval=1.0):
+        self.file_path = file_path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self.last_error = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._signature = None
+        self._content_hash = None
+        self._last_check = time.monotonic()
+        self._rules = None
+        self.refresh(force=True)
+        if self._rules is None:
+            raise ValueError(f"Could not load categorization rules from {file_path}: {self.last_error}")
+
+    def subscribe(self, callback):
+        """Call `callback(old_rules, new_rules)` after every swap."""
+        self._subscribers.append(callback)
+
+    def get(self):
+        """The current rules, picking up file changes at most every `check_interval` seconds."""
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.refresh()
+        return self._rules
+
+    def refresh(self, force=False):
+        """Reload the file if it changed. Returns True if a new rule set was swapped in."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            try:
+                stat = os.stat(self.file_path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if signature == self._signature and not force:
+                    return False
+                with open(self.file_path, "rb") as f:
+                    content = f.read()
+                self._signature = signature
+                content_hash = hashlib.sha256(content).hexdigest()
+                if content_hash == self._content_hash:
+                    return False # Touched or rewritten with the same content
+                new_rules = CompiledRules(json.loads(content.decode("utf-8")))
+            except (OSError, ValueError, TypeError, AttributeError, re.error) as e:
+                self.last_error = str(e)
+                return False
+            old_rules, self._rules = self._rules, new_rules
+            self._content_hash = content_hash
+            self.last_error = None
+            if old_rules is not None:
+                self.reloads += 1
+        if old_rules is not None:
+            for callback in self._subscribers:
+                callback(old_rules, new_rules)
+        return old_rules is not None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report overlapping rules and, for a statement, per-rule hits and cost.")
+    parser.add_argument("rules", nargs="?", default=DEFAULT_RULES_PATH, help="Rules JSON file")
+    parser.add_argument("--profile", metavar="CSV", help="Categorize this statement and report per-rule hits and time")
+    args = parser.parse_args(argv)
+
+    compiled = CompiledRules(load_rules(args.rules), profile=bool(args.profile))
+    print(f"{len(compiled.patterns)} rules in {len(compiled.categories)} categories, precedence: "
+          f"{' > '.join(compiled.categories)}")
+    for conflict in compiled.conflicts():
+        print(f"{conflict['kind']:>9}: '{conflict['pattern']}' ({conflict['category']}) "
+              f"vs '{conflict['winning_pattern']}' ({conflict['winning_category']})")
+
+    if args.profile:
+        df = pd.read_csv(args.profile)
+        df["Debit/Credit"] = df["Debit/Credit"].astype(str).str.strip()
+        compiled.categorize(df["Details"], df["Debit/Credit"])
+        stats = compiled.rule_stats()
+        print(f"\nKeyword automaton: {compiled.profile.automaton_seconds * 1e3:.2f} ms; "
+              f"unmatched debits: {compiled.profile.unmatched}")
+        print(stats.sort_values(["Hits"], ascending=False).to_string(index=False))
+        dead = stats[stats["Hits"] == 0]
+        print(f"\n{len(dead)} of {len(stats)} rules never fired on this statement.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Plotly figures for the FinWise Analytics tab.
+
+Built from an AggregateCube (or transactions, which are aggregated first)
+with no Streamlit dependency, so the same figures can be produced and timed
+headlessly.
+"""
+import plotly.express as px
+
+from aggregates import AggregateCube
+
+# Trend chart title for each resolution chosen by AggregateCube.trend
+TREND_TITLES = {"Day": "Daily", "Week": "Weekly", "Month": "Monthly"}
+
+
+def build_figures(data):
+    """
+    (trend, category pie, top categories bar) figures for transactions or an AggregateCube.
+    Figures that cannot be drawn from the data are None.
+    """
+    if data is None or data.empty:
+        return None, None, None
+
+    cube = data if isinstance(data, AggregateCube) else AggregateCube.build(data)
+
+    # Day, week or month resolution depending on the range, so the chart never carries more than MAX_TREND_POINTS points
+    trend, resolution = cube.trend()
+    spending_trend = trend.rename("Amount").rename_axis(resolution).reset_index()
+
+    fig_trend = px.line(
+        spending_trend,
+        x=resolution,
+        y="Amount",
+        title=f"📈 {TREND_TITLES[resolution]} Spending Trend",
+        color_discrete_sequence=["#1A237E"] # Match header gradient
+    )
+    fig_trend.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)",
+                            xaxis_title=resolution, yaxis_title="Amount (₹)")
+
+    expenses_cube = cube.debits()
+    fig_pie = None
+    fig_bar = None
+
+    if not expenses_cube.empty:
+        category_totals = expenses_cube.by_category()["Sum"].rename("Amount").reset_index()
+        category_totals = category_totals.sort_values("Amount", ascending=False)
+
+        fig_pie = px.pie(
+            category_totals,
+            values="Amount",
+            names="Category",
+            title="🎯 Expense Distribution by Category",
+            color_discrete_sequence=px.colors.qualitative.Pastel
+        )
+        fig_pie.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
+
+        top_categories = category_totals.head(10)
+        fig_bar = px.bar(
+            top_categories,
+            x="Category",
+            y="Amount",
+            title="💰 Top Spending Categories",
+            color="Amount",
+            color_continuous_scale="Viridis"
+        )
+        fig_bar.update_layout(xaxis_tickangle=-45, plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)",
+                              xaxis_title="Category", yaxis_title="Total Amount (₹)")
+
+    return fig_trend, fig_pie, fig_bar
@@ -0,0 +1,91 @@
+"""
+Headless FinWise pipeline.
+
+Everything needed to turn a bank statement CSV into categorized transactions,
+anomaly reports and insights, with no Streamlit import and no side effects at
+import time. The Streamlit app (main.py) and the batch CLI (batch.py) are both
+thin front-ends over these functions.
+"""
+from aggregates import AggregateCube
+from anomalies import detect_anomalies
+from budgets import SpendCounters, evaluate_budgets
+from categorizer import DEFAULT_RULES_PATH, CompiledRules, load_rules
+from ingestion import read_transactions, read_transactions_chunked
+from insights import compute_insight_metrics, render_insights
+from instrumentation import stage
+from transactions import compact_transactions, sort_by_date
+
+
+def load_compiled_rules(file_path=DEFAULT_RULES_PATH):
+    """Load and compile categorization rules."""
+    return CompiledRules(load_rules(file_path))
+
+
+def process_transactions(df, rules, cache=None):
+    """Categorize cleaned transactions in place with compiled rules and return them."""
+    if df is None or df.empty:
+        return df
+    # Categorize the whole column at once; each distinct description is matched only once
+    df["Category"] = rules.categorize(df["Details"], df["Debit/Credit"], cache=cache)
+    return df
+
+
+def load_transactions(source, rules, cache=None, chunksize=None, progress=None, amount_unit="rupees"):
+    """
+    Read, validate and categorize a statement CSV.
+
+    With a `chunksize` the file is read and categorized chunk by chunk, which
+    bounds peak memory for large exports. amount_unit="paise" keeps amounts as
+    exact int64 paise, so every total is an integer sum. The result is
+    date-sorted and compact (see transactions.py). Returns (df, warning counts);
+    raises IngestionError when the file cannot be used at all. The frame may be
+    empty if every row was dropped during cleaning.
+    """
+    if chunksize:
+        with stage("parse_and_categorize_chunked") as record:
+            df, counts = read_transactions_chunked(
+                source, chunksize=chunksize,
+                process_chunk=lambda chunk: process_transactions(chunk, rules, cache), progress=progress,
+                amount_unit=amount_unit
+            )
+            record["rows_in"], record["rows_out"] = counts["rows_read"], len(df)
+    else:
+        with stage("parse") as record:
+            df, counts = read_transactions(source, amount_unit)
+            record["rows_in"], record["rows_out"] = counts["rows_read"], len(df)
+        with stage("categorize", rows_in=len(df)) as record:
+            df = process_transactions(df, rules, cache)
+            record["rows_out"] = len(df)
+    if df.empty:
+        return df, counts
+    with stage("compact", rows_in=len(df)) as record:
+        df = compact_transactions(sort_by_date(df))
+        record["rows_out"] = len(df)
+    return df, counts
+
+
+def analyze_transactions(df, budget_goals=None, **anomaly_options):
+    """
+    Anomalies and smart insights for processed transactions.
+    `anomaly_options` are passed to detect_anomalies. Returns (anomalies_df, insights_text).
+    """
+    cube = AggregateCube.build(df)
+    anomalies_df = detect_anomalies(df, **anomaly_options)
+    return anomalies_df, generate_smart_insights(df, budget_goals or {}, anomalies_df, cube=cube)
+
+
+def generate_smart_insights(df_processed, budget_goals, anomalies_df=None, cube=None, metrics=None, budget_status=None):
+    """
+    Generates textual insights based on processed financial data, including budget adherence and anomalies.
+    Pass `anomalies_df`, the data's AggregateCube, its computed insight metrics (see insights.py) and/or
+    the budget status (see budgets.evaluate_budgets) when they are already available to avoid recomputing them.
+    """
+    if cube is None and (metrics is None or (budget_goals and budget_status is None)):
+        cube = AggregateCube.build(df_processed)
+    if metrics is None:
+        metrics = compute_insight_metrics(cube)
+    if budget_goals and budget_status is None:
+        budget_status = evaluate_budgets(SpendCounters.from_cube(cube), budget_goals)
+    if anomalies_df is None and metrics["debit_count"].any():
+        anomalies_df = detect_anomalies(df_processed) # Use df_processed to get anomalies across all data
+    return render_insights(metrics, budget_goals, anomalies_df, budget_status=budget_status)
@@ -0,0 +1,189 @@
+"""
+CSV ingestion for FinWise.
+
+Validation and cleaning live here, free of Streamlit calls, so the same code
+serves the whole-file upload path and the chunked path used for large bank
+exports. Problems with individual rows are tallied in a warning-counts dict;
+problems that make the file unusable raise IngestionError.
+"""
+import numpy as np
+import pandas as pd
+
+from transactions import AMOUNT_UNITS, compact_transactions, concat_compact, to_paise
+
+REQUIRED_COLUMNS = ["Date", "Details", "Amount", "Debit/Credit"]
+# Kept when present: statements covering several account holders carry an account/user key
+ACCOUNT_COLUMN = "Account"
+OPTIONAL_COLUMNS = [ACCOUNT_COLUMN]
+UNKNOWN_ACCOUNT = "Unassigned"
+# Date formats seen in Indian bank exports. Day-first only: 03/04/2024 is 3 April.
+DATE_FORMATS = [
+    "%d %b %Y", "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y",
+    "%d-%b-%Y", "%d-%b-%y", "%d %B %Y", "%d.%m.%Y", "%Y/%m/%d",
+]
+# Distinct date strings looked at when sniffing which formats a file uses
+DATE_SNIFF_SAMPLE = 100
+DEFAULT_CHUNKSIZE = 50_000
+
+
+class IngestionError(ValueError):
+    """Raised when an uploaded file cannot be turned into transactions at all."""
+
+
+def new_warning_counts():
+    """Running tallies of rows dropped during cleaning."""
+    return {"rows_read": 0, "bad_amount": 0, "bad_date": 0, "invalid_debit_credit": 0, "missing_values": 0}
+
+
+def warning_messages(counts):
+    """User-facing warnings for the rows that were dropped."""
+    messages = []
+    if counts["bad_amount"]:
+        messages.append(f"{counts['bad_amount']} 'Amount' values could not be converted to numbers. These rows were dropped.")
+    if counts["bad_date"]:
+        messages.append(f"{counts['bad_date']} 'Date' values could not be parsed. These rows were dropped.")
+    if counts["invalid_debit_credit"]:
+        messages.append(f"Found {counts['invalid_debit_credit']} rows with invalid 'Debit/Credit' values (expected 'Debit' or 'Credit'). These rows were dropped.")
+    if counts["missing_values"]:
+        messages.append(f"{counts['missing_values']} rows had empty required fields and were dropped.")
+    return messages
+
+
+def check_columns(columns):
+    """Raise IngestionError if any required column is missing from the header."""
+    for col in REQUIRED_COLUMNS:
+        if col not in columns:
+            raise IngestionError(f"Missing required column: '{col}'. Please ensure your CSV has this column.")
+
+
+def sniff_date_formats(values, sample_size=DATE_SNIFF_SAMPLE):
+    """Supported formats that parse any of a sample of date strings, most common first."""
+    sample = pd.Series(values[:sample_size], dtype=object)
+    matches = {
+        date_format: int(pd.to_datetime(sample, format=date_format, errors="coerce").notna().sum())
+        for date_format in DATE_FORMATS
+    }
+    return [date_format for date_format in sorted(matches, key=matches.get, reverse=True) if matches[date_format]]
+
+
+def parse_dates(dates):
+    """
+    Parse a column of date strings in whatever supported formats it uses, in one pass.
+
+    Statements have far fewer distinct dates than rows, so only the unique
+    strings are parsed and the result is broadcast back to every row. The
+    formats are sniffed from a sample and tried most common first; each one
+    only sees the strings the formats before it could not parse, so
+    mixed-format files need no whole-column retry. Strings no format can
+    parse become NaT.
+    """
+    codes, uniques = pd.factorize(dates)
+    uniques = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    # Sniffed formats first; formats absent from the sample are still tried on whatever is left
+    sniffed = sniff_date_formats(uniques.to_numpy())
+    formats = sniffed + [date_format for date_format in DATE_FORMATS if date_format not in sniffed]
+    parsed = pd.to_datetime(uniques, format=formats[0], errors="coerce")
+    for date_format in formats[1:]:
+        remaining = parsed.isna()
+        if not remaining.any():
+            break
+        parsed[remaining] = pd.to_datetime(uniques[remaining], format=date_format, errors="coerce")
+    if len(uniques) and parsed.isna().all():
+        raise IngestionError(
+            "Could not parse 'Date' column. Supported formats include 'DD Mon YYYY', 'YYYY-MM-DD', "
+            "'DD/MM/YYYY' and 'DD-MM-YY'."
+        )
+    # Rows with no date at all (factorize code -1) pick up the trailing NaT
+    values = np.append(parsed.to_numpy(), np.array(["NaT"], dtype=parsed.dtype))
+    return pd.Series(values[codes], index=dates.index, name=dates.name)
+
+
+def clean_chunk(df, counts, amount_unit="rupees"):
+    """
+    Validate and clean a frame of raw CSV rows, updating the warning counts.
+    Works on a whole file or on one chunk of it. Only the required and optional
+    columns are kept. Amounts come back as float64 rupees, or as exact int64
+    paise with amount_unit="paise".
+    """
+    if amount_unit not in AMOUNT_UNITS:
+        raise ValueError(f"Unknown amount unit '{amount_unit}'. Expected one of {list(AMOUNT_UNITS)}.")
+    df.columns = [col.strip() for col in df.columns]
+    check_columns(df.columns)
+    counts["rows_read"] += len(df)
+
+    # Validate and convert 'Amount'
+    # Always float here: an integer Amount column is reserved for paise
+    df["Amount"] = pd.to_numeric(
+        df["Amount"].astype(str).str.replace(",", "").str.replace("₹", ""), errors="coerce"
+    ).astype("float64")
+    bad_amount = df["Amount"].isna()
+    counts["bad_amount"] += int(bad_amount.sum())
+
+    # Validate and convert 'Date' (rows already rejected for their amount are not parsed)
+    df["Date"] = parse_dates(df["Date"].where(~bad_amount))
+    bad_date = df["Date"].isna() & ~bad_amount
+    counts["bad_date"] += int(bad_date.sum())
+
+    # Ensure 'Debit/Credit' column only contains 'Debit' or 'Credit'
+    df["Debit/Credit"] = df["Debit/Credit"].astype(str).str.strip()
+    valid_dc = df["Debit/Credit"].isin(["Debit", "Credit"])
+    invalid_dc = ~valid_dc & ~bad_amount & ~bad_date
+    counts["invalid_debit_credit"] += int(invalid_dc.sum())
+
+    if ACCOUNT_COLUMN in df.columns:
+        df[ACCOUNT_COLUMN] = df[ACCOUNT_COLUMN].fillna(UNKNOWN_ACCOUNT).astype(str).str.strip()
+
+    keep = ~bad_amount & ~bad_date & valid_dc
+    missing = keep & df["Details"].isna()
+    counts["missing_values"] += int(missing.sum())
+    # A single boolean mask replaces the chain of dropna/isin filters; only the columns FinWise uses are kept
+    df = df.loc[keep & ~missing, REQUIRED_COLUMNS + [col for col in OPTIONAL_COLUMNS if col in df.columns]]
+    if amount_unit == "paise":
+        df = df.assign(Amount=to_paise(df["Amount"]))
+    return df
+
+
+def read_transactions(source, amount_unit="rupees"):
+    """Read and clean a whole CSV in one go. Returns (df, warning counts)."""
+    counts = new_warning_counts()
+    df = clean_chunk(pd.read_csv(source), counts, amount_unit)
+    return df, counts
+
+
+def read_transactions_chunked(source, chunksize=DEFAULT_CHUNKSIZE, process_chunk=None, progress=None,
+                              amount_unit="rupees"):
+    """
+    Read, clean and (optionally) process a CSV in fixed-size chunks.
+
+    As in read_transactions, only the required and optional columns (plus whatever
+    process_chunk adds) are kept, and each processed chunk is compacted (see
+    transactions.compact_transactions) before it is appended, so peak memory is
+    bounded by the chunk size plus the compact result rather than by full-size
+    object copies of the file. `progress(rows_read, fraction)` is called
+    after every chunk; fraction is None when the source size is unknown.
+    Returns (df, warning counts).
+    """
+    counts = new_warning_counts()
+    total_bytes = getattr(source, "size", None)
+    parts = []
+    empty = None
+    with pd.read_csv(source, chunksize=chunksize) as reader:
+        for chunk in reader:
+            chunk = clean_chunk(chunk, counts, amount_unit)
+            if chunk.empty:
+                empty = chunk
+            else:
+                if process_chunk is not None:
+                    chunk = process_chunk(chunk)
+                # Each chunk is compacted before the next is read, so only its codes are kept
+                parts.append(compact_transactions(chunk))
+            if progress is not None:
+                fraction = None
+                if total_bytes and hasattr(source, "tell"):
+                    fraction = min(source.tell() / total_bytes, 1.0)
+                progress(counts["rows_read"], fraction)
+    if not parts:
+        if empty is None:
+            raise IngestionError("The uploaded file contains no rows.")
+        return empty, counts
+    return concat_compact(parts), counts
@@ -0,0 +1,291 @@
+"""
+Declarative smart insights for FinWise.
+
+Insights are built from named metrics registered with @insight_metric. Every
+metric is a function of an InsightContext and returns a Series or DataFrame
+indexed by group (one group for a single statement, one per account in a
+batch), so all accounts are evaluated together. Metrics read grouped rollups
+of one AggregateCube (the single grouped pass over the transactions) and may
+use other metrics via ctx["name"]; rollups and metric values are memoized per
+evaluation, so a new metric adds a small rollup of the cube at most, never
+another scan of the transactions.
+
+compute_insight_metrics evaluates the registry; render_insights turns one
+group's metrics, budgets and anomalies into the Markdown report.
+"""
+import numpy as np
+import pandas as pd
+
+from transactions import in_rupees
+
+# Name of the group level in every metric's index
+GROUP = "Group"
+# The single group of an ungrouped evaluation
+ALL = "All"
+# Anomalies listed individually in the report
+TOP_ANOMALIES = 3
+PERIOD_ADJECTIVES = {"Week": "weekly", "Month": "monthly", "Year": "yearly"}
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+INSIGHT_METRICS = {}
+
+
+def insight_metric(name):
+    """Register `func(ctx)` as the insight metric `name`."""
+    def register(func):
+        INSIGHT_METRICS[name] = func
+        return func
+    return register
+
+
+class InsightContext:
+    """
+    Memoized grouped rollups of an AggregateCube's cells, and the metrics computed from them.
+    Keys are factorized once; each rollup is then a bincount over combined integer codes.
+    """
+
+    def __init__(self, cube, group_col=None):
+        cells = cube.cells
+        self.scale = cube.scale
+        if group_col in cells.columns:
+            group = cells[group_col].astype("category")
+            group = group.cat.rename_categories(group.cat.categories.astype(str))
+        else:
+            group = pd.Categorical.from_codes(np.zeros(len(cells), dtype=np.int8), [ALL])
+        # Month starts and weekday numbers straight from the datetime64 days; both are cheap integer keys
+        days = cells["Date"].to_numpy().astype("datetime64[D]")
+        self.cells = cells.assign(**{
+            GROUP: group,
+            "Month": days.astype("datetime64[M]").astype("datetime64[ns]"),
+            "Weekday": (days.astype(np.int64) + 3) % 7, # 1970-01-01 was a Thursday
+        })
+        self.groups = pd.Index(self.cells[GROUP].unique(), name=GROUP) if group_col else pd.Index([ALL], name=GROUP)
+        self.sums = self.cells["Sum"].to_numpy()
+        self.counts = self.cells["Count"].to_numpy()
+        self._keys = {}
+        self._kinds = {}
+        self._rollups = {}
+        self._values = {}
+
+    def key(self, name):
+        """(codes, sorted uniques) of one cell column."""
+        if name not in self._keys:
+            codes, uniques = pd.factorize(self.cells[name], sort=True)
+            if isinstance(uniques, pd.CategoricalIndex):
+                uniques = pd.Index(uniques.astype(object))
+            self._keys[name] = codes, uniques
+        return self._keys[name]
+
+    def kind(self, kind):
+        """Boolean mask of the cells of one Debit/Credit `kind` (None for all cells)."""
+        if kind is None:
+            return None
+        if kind not in self._kinds:
+            self._kinds[kind] = (self.cells["Debit/Credit"] == kind).to_numpy()
+        return self._kinds[kind]
+
+    def rollup(self, keys=(), kind=None):
+        """Sum (in rupees) and Count per group and `keys`, over the cells of one Debit/Credit `kind`."""
+        cache_key = (tuple(keys), kind)
+        if cache_key not in self._rollups:
+            names = [GROUP, *keys]
+            mask = self.kind(kind)
+            factorized = [self.key(name) for name in names]
+            codes = [c if mask is None else c[mask] for c, _ in factorized]
+            sizes = [max(len(uniques), 1) for _, uniques in factorized]
+            cells, inverse = np.unique(np.ravel_multi_index(codes, sizes), return_inverse=True)
+            sums = self.sums if mask is None else self.sums[mask]
+            counts = self.counts if mask is None else self.counts[mask]
+            index = pd.MultiIndex(
+                levels=[uniques for _, uniques in factorized], codes=np.unravel_index(cells, sizes), names=names
+            )
+            rolled = pd.DataFrame({
+                "Sum": np.bincount(inverse, weights=sums, minlength=len(cells)) / self.scale,
+                "Count": np.bincount(inverse, weights=counts, minlength=len(cells)).astype(np.int64),
+            }, index=index if keys else index.get_level_values(0))
+            self._rollups[cache_key] = rolled
+        return self._rollups[cache_key]
+
+    def per_group(self, values, fill_value=0):
+        """A group-level Series reindexed to every group."""
+        values = values.droplevel(list(range(1, values.index.nlevels))) if values.index.nlevels > 1 else values
+        return values.reindex(self.groups, fill_value=fill_value)
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            self._values[name] = INSIGHT_METRICS[name](self)
+        return self._values[name]
+
+
+@insight_metric("total_debits")
+def total_debits(ctx):
+    return ctx.per_group(ctx.rollup(kind="Debit")["Sum"], 0.0)
+
+
+@insight_metric("total_credits")
+def total_credits(ctx):
+    return ctx.per_group(ctx.rollup(kind="Credit")["Sum"], 0.0)
+
+
+@insight_metric("net_flow")
+def net_flow(ctx):
+    return ctx["total_credits"] - ctx["total_debits"]
+
+
+@insight_metric("debit_count")
+def debit_count(ctx):
+    return ctx.per_group(ctx.rollup(kind="Debit")["Count"], 0)
+
+
+@insight_metric("average_debit")
+def average_debit(ctx):
+    return ctx["total_debits"] / ctx["debit_count"].replace(0, np.nan)
+
+
+@insight_metric("category_spending")
+def category_spending(ctx):
+    """Debits per (group, category), largest first within each group."""
+    spending = ctx.rollup(["Category"], kind="Debit")["Sum"]
+    order = np.lexsort((-spending.to_numpy(), spending.index.codes[0]))
+    return spending.iloc[order]
+
+
+@insight_metric("busiest_weekday")
+def busiest_weekday(ctx):
+    weekdays = ctx.rollup(["Weekday"], kind="Debit")["Sum"]
+    group_codes = weekdays.index.codes[0]
+    names = np.asarray(WEEKDAY_NAMES, dtype=object)[weekdays.index.levels[1].to_numpy()[weekdays.index.codes[1]]]
+    # Largest total first within each group; ties go to the weekday whose name sorts first
+    order = np.lexsort((names, -weekdays.to_numpy(), group_codes))
+    first = order[_first_in_group(group_codes[order])]
+    busiest = pd.Series(names[first], index=weekdays.index.levels[0][group_codes[first]])
+    return busiest.reindex(ctx.groups)
+
+
+@insight_metric("month_over_month")
+def month_over_month(ctx):
+    """Each group's two most recent months with debits, and the change between them."""
+    monthly = ctx.rollup(["Month"], kind="Debit")["Sum"]
+    group_codes = monthly.index.codes[0]
+    latest = np.flatnonzero(_last_in_group(group_codes))
+    latest = latest[(latest > 0) & (group_codes[latest - 1] == group_codes[latest])]
+    months = monthly.index.get_level_values("Month")
+    values = monthly.to_numpy()
+    return pd.DataFrame({
+        "Latest": months[latest], "Previous": months[latest - 1], "Change": values[latest] - values[latest - 1],
+    }, index=monthly.index.levels[0][group_codes[latest]])
+
+
+def _first_in_group(group_codes):
+    """True at the first row of each run of equal group codes."""
+    return np.r_[True, group_codes[1:] != group_codes[:-1]] if len(group_codes) else np.zeros(0, dtype=bool)
+
+
+def _last_in_group(group_codes):
+    """True at the last row of each run of equal group codes."""
+    return np.r_[group_codes[1:] != group_codes[:-1], True] if len(group_codes) else np.zeros(0, dtype=bool)
+
+
+def compute_insight_metrics(cube, group_col=None, names=None):
+    """
+    Evaluate the registered metrics (or just `names`) on a cube, grouped by
+    `group_col` when given. Returns {name: value} plus the list of groups under GROUP.
+    """
+    ctx = InsightContext(cube, group_col)
+    metrics = {name: ctx[name] for name in (names or INSIGHT_METRICS)}
+    metrics[GROUP] = ctx.groups.tolist()
+    return metrics
+
+
+def group_value(value, group, default=None):
+    """One group's part of a metric: a scalar, or the remaining levels of a multi-level metric."""
+    if value.index.nlevels > 1:
+        if group not in value.index.get_level_values(0):
+            return value.iloc[0:0].droplevel(0)
+        return value.xs(group, level=0)
+    return value.get(group, default)
+
+
+def _format_budgets(budget_status):
+    """One line per budget from budgets.evaluate_budgets: what is left (or overspent) and the projected overrun."""
+    lines = []
+    for row in budget_status.to_dict("records"):
+        category = row["Category"] if row["Period"] == "Month" else f"{PERIOD_ADJECTIVES[row['Period']]} {row['Category']}"
+        available = f"₹{row['Available']:,.2f}"
+        if row["Carried"]:
+            available += f", including ₹{row['Carried']:,.2f} carried over"
+        if row["Spent"] > row["Available"]:
+            lines.append(f"- You've **exceeded** your {category} budget ({available}) by ₹{(row['Spent'] - row['Available']):,.2f}.")
+        else:
+            line = f"- You have **₹{row['Remaining']:,.2f}** remaining in your {category} budget (out of {available})."
+            if row["Projected Overrun"] > 0:
+                line += f" At this pace you will overspend by **₹{row['Projected Overrun']:,.2f}** by {row['Period End'].strftime('%d %b %Y')}."
+            lines.append(line)
+    return lines
+
+
+def render_insights(metrics, budget_goals=None, anomalies_df=None, group=ALL, budget_status=None):
+    """
+    Markdown insights for one group, from computed metrics, its budget status
+    (see budgets.evaluate_budgets, for its `budget_goals`) and its anomalies.
+    """
+    total_debits = group_value(metrics["total_debits"], group, 0.0)
+    total_credits = group_value(metrics["total_credits"], group, 0.0)
+    insights = [
+        f"**Overall Financial Snapshot:**",
+        f"- Your total expenses amount to **₹{total_debits:,.2f}**.",
+        f"- Your total income/credits amount to **₹{total_credits:,.2f}**.",
+        f"- Your net financial flow is **₹{group_value(metrics['net_flow'], group, 0.0):,.2f}**.",
+    ]
+    if not group_value(metrics["debit_count"], group, 0):
+        insights.append("No debit transactions found to generate detailed spending insights.")
+        return "\n".join(insights)
+
+    # Spending Habits
+    category_summary = group_value(metrics["category_spending"], group)
+    if not category_summary.empty:
+        top_category = category_summary.index[0]
+        insights.append(f"\n**Spending Habits:**")
+        insights.append(f"- Your largest spending area is **{top_category}**, accounting for **₹{category_summary.iloc[0]:,.2f}**.")
+        other_top_categories = category_summary.iloc[1:3]
+        if not other_top_categories.empty:
+            insights.append(f"- Other significant expenses include: {', '.join([f'{cat} (₹{amt:,.2f})' for cat, amt in other_top_categories.items()])}.")
+    else:
+        insights.append("No categorized expenses to analyze spending habits.")
+    insights.append(f"- The average amount per expense transaction is **₹{group_value(metrics['average_debit'], group):,.2f}**.")
+
+    # Budget Adherence (each budget's current week, month or year)
+    insights.append(f"\n**Budget Adherence:**")
+    if budget_goals:
+        budget_insights = _format_budgets(budget_status) if budget_status is not None else []
+        insights.extend(budget_insights or ["- No active budget goals for the current month's categories."])
+    else:
+        insights.append("- No budget goals set or no data for the current period.")
+
+    # Anomaly Detection Insights
+    insights.append(f"\n**Anomaly Detection:**")
+    if anomalies_df is not None and not anomalies_df.empty:
+        insights.append(f"- Detected **{len(anomalies_df)} potential anomalies** in your spending.")
+        for _, row in in_rupees(anomalies_df.head(TOP_ANOMALIES)).iterrows():
+            insights.append(f"  - On {row['Date'].strftime('%Y-%m-%d')}, a **₹{row['Amount']:,.2f}** transaction for '{row['Details']}' in '{row['Category']}' was flagged as: {row['Anomaly_Reason']}.")
+        if len(anomalies_df) > TOP_ANOMALIES:
+            insights.append(f"  - (And {len(anomalies_df) - TOP_ANOMALIES} more anomalies...)")
+    else:
+        insights.append("- No significant spending anomalies detected.")
+
+    # Time-based insights
+    busiest_day = group_value(metrics["busiest_weekday"], group)
+    if busiest_day:
+        insights.append(f"\n**Behavioral Insights:**")
+        insights.append(f"- You tend to spend most on **{busiest_day}s**.")
+    trend = metrics["month_over_month"]
+    if group in trend.index:
+        latest_month, previous_month, change = trend.loc[group, ["Latest", "Previous", "Change"]]
+        if change > 0:
+            insights.append(f"- Your spending in {latest_month.strftime('%B %Y')} increased by **₹{change:,.2f}** compared to {previous_month.strftime('%B %Y')}.")
+        elif change < 0:
+            insights.append(f"- Your spending in {latest_month.strftime('%B %Y')} decreased by **₹{-change:,.2f}** compared to {previous_month.strftime('%B %Y')}.")
+        else:
+            insights.append(f"- Your spending remained consistent in {latest_month.strftime('%B %Y')} compared to {previous_month.strftime('%B %Y')}.")
+
+    return "\n".join(insights)
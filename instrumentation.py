@@ -0,0 +1,214 @@
+"""
+Lightweight per-stage instrumentation for FinWise.
+
+Pipeline code wraps each step in `with stage("name", rows_in=...) as record:`
+and sets record["rows_out"]. While a run is active (see start_run) every
+stage's duration, rows in/out and RSS delta is added to that run, written as
+one JSON line to the "finwise.metrics" logger and accumulated in the
+process-wide METRICS registry, which renders the Prometheus text format.
+Outside a run, stage() records nothing, so headless callers pay almost no
+cost.
+"""
+import contextvars
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("finwise.metrics")
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_run = contextvars.ContextVar("finwise_current_run", default=None)
+
+
+def current_rss_bytes():
+    """Resident set size of this process (Linux /proc), or None where unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss_bytes():
+    """High-water RSS of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MetricsRegistry:
+    """
+    Per-stage counters and duration histograms accumulated over every run in this process,
+    plus the text of any registered collectors (e.g. the categorization cache's counters).
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.runs = 0
+        self.run_seconds = 0.0
+        self._stages = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def register_collector(self, name, collect):
+        """Append `collect()`, Prometheus text, to every export; registering a name again replaces it."""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def observe(self, record):
+        with self._lock:
+            stats = self._stages.setdefault(record["stage"], {
+                "count": 0, "seconds": 0.0, "rows_in": 0, "rows_out": 0, "memory_delta_bytes": 0,
+                "buckets": [0] * len(self.buckets),
+            })
+            stats["count"] += 1
+            stats["seconds"] += record["seconds"]
+            stats["rows_in"] += record["rows_in"] or 0
+            stats["rows_out"] += record["rows_out"] or 0
+            stats["memory_delta_bytes"] = record["memory_delta_bytes"] or 0
+            for i, bound in enumerate(self.buckets):
+                if record["seconds"] <= bound:
+                    stats["buckets"][i] += 1
+
+    def observe_run(self, seconds):
+        with self._lock:
+            self.runs += 1
+            self.run_seconds += seconds
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            stages = {name: dict(stats, buckets=list(stats["buckets"])) for name, stats in self._stages.items()}
+            runs, run_seconds = self.runs, self.run_seconds
+            collectors = list(self._collectors.values())
+        lines = [
+            "# HELP finwise_runs_total Dashboard runs (Streamlit reruns) instrumented.",
+            "# TYPE finwise_runs_total counter",
+            f"finwise_runs_total {runs}",
+            "# HELP finwise_run_seconds_total Wall time of all instrumented runs.",
+            "# TYPE finwise_run_seconds_total counter",
+            f"finwise_run_seconds_total {run_seconds:.6f}",
+            "# HELP finwise_stage_duration_seconds Wall time per pipeline stage.",
+            "# TYPE finwise_stage_duration_seconds histogram",
+        ]
+        for name, stats in sorted(stages.items()):
+            label = f'stage="{name}"'
+            for bound, count in zip(self.buckets, stats["buckets"]):
+                lines.append(f'finwise_stage_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'finwise_stage_duration_seconds_bucket{{{label},le="+Inf"}} {stats["count"]}')
+            lines.append(f"finwise_stage_duration_seconds_sum{{{label}}} {stats['seconds']:.6f}")
+            lines.append(f"finwise_stage_duration_seconds_count{{{label}}} {stats['count']}")
+        for metric, key, kind, help_text in [
+            ("finwise_stage_rows_in_total", "rows_in", "counter", "Rows passed into each stage."),
+            ("finwise_stage_rows_out_total", "rows_out", "counter", "Rows produced by each stage."),
+            ("finwise_stage_memory_delta_bytes", "memory_delta_bytes", "gauge", "RSS change during the stage's last run."),
+        ]:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(f'{metric}{{stage="{name}"}} {stats[key]}' for name, stats in sorted(stages.items()))
+        return "\n".join(lines) + "\n" + "".join(collect() for collect in collectors)
+
+
+METRICS = MetricsRegistry()
+
+
+class PipelineRun:
+    """
+    The stage records of one run (one Streamlit rerun, one batch file, ...), in the
+    order the stages started. A stage entered inside another has a larger "depth".
+    """
+
+    def __init__(self, registry=METRICS):
+        self.registry = registry
+        self.stages = []
+        self.depth = 0
+        self.started = time.perf_counter()
+        self.seconds = None
+
+    def finish_stage(self, record):
+        self.registry.observe(record)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"event": "stage", **record}))
+
+
+def start_run(registry=METRICS):
+    """Begin recording stages in the current thread/context. Returns the new PipelineRun."""
+    run = PipelineRun(registry)
+    _current_run.set(run)
+    return run
+
+
+def finish_run(run):
+    """Stop recording and account the run's total wall time."""
+    if _current_run.get() is run:
+        _current_run.set(None)
+    run.seconds = time.perf_counter() - run.started
+    run.registry.observe_run(run.seconds)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"event": "run", "seconds": run.seconds, "stages": len(run.stages)}))
+    return run
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Time a pipeline stage in the active run. Yields the record dict; set
+    record["rows_out"] inside the block. A no-op when no run is active.
+    """
+    run = _current_run.get()
+    record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+    if run is None:
+        yield record
+        return
+    record["depth"] = run.depth
+    run.stages.append(record)
+    run.depth += 1
+    rss_before = current_rss_bytes()
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        rss_after = current_rss_bytes()
+        record["memory_delta_bytes"] = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        run.depth -= 1
+        run.finish_stage(record)
+
+
+def log_to(target):
+    """Send the JSON-lines metrics log to a file path, or to stderr for "-"."""
+    handler = logging.StreamHandler(sys.stderr) if target == "-" else logging.FileHandler(target, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return handler
+
+
+def serve_metrics(port, registry=METRICS, host="0.0.0.0"):
+    """Serve registry.prometheus_text() at http://host:port/metrics on a daemon thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes are not worth a log line each
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="finwise-metrics").start()
+    return server
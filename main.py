@@ -1,6 +1,5 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import os
@@ -9,81 +8,112 @@ import re # Import regex module
 import numpy as np # For numerical operations like standard deviation
 
 import json
+import hashlib
+import secrets
+
+from accounts import budget_status_by_account, has_accounts, insights_by_account
+from aggregates import AggregateCube
+from anomalies import IncrementalAnomalyDetector, detect_anomalies
+from budgets import BUDGET_PERIODS, DEFAULT_PERIOD, SpendCounters, evaluate_budgets
+from charts import build_figures
+from categorizer import (
+    DEFAULT_RULES_PATH, PRIORITIES_KEY, CategorizationCache, CompiledRules, RulesProvider, add_keyword, load_rules,
+    merge_rules,
+)
+from core import generate_smart_insights, load_transactions, process_transactions
+from ingestion import ACCOUNT_COLUMN, DEFAULT_CHUNKSIZE, IngestionError, warning_messages
+from insights import compute_insight_metrics
+from instrumentation import METRICS, finish_run, log_to, serve_metrics, stage, start_run
+from overrides import ID_COLUMN, CategoryOverrides, with_ids
+from store import TransactionStore
+from transactions import TransactionIndex, compact_transactions, in_rupees
+
+CATEGORIZATION_CACHE_PATH = os.path.join(".finwise_cache", "categorization_cache.json")
+# Saved history is kept per profile: a signed-in account, or else a private ?profile= link
+PROFILES_PATH = os.path.join(".finwise_cache", "profiles")
+PROFILE_PARAM = "profile"
+# Per-profile files: manual corrections, and keywords learned from them (an overlay on categories.json)
+CATEGORY_OVERRIDES_FILE = "category_overrides.json"
+LEARNED_RULES_FILE = "learned_rules.json"
+
+# Per-stage metrics export: a JSON-lines log file ("-" for stderr) and/or a Prometheus /metrics port
+METRICS_LOG_ENV = "FINWISE_METRICS_LOG"
+METRICS_PORT_ENV = "FINWISE_METRICS_PORT"
+
+# --- Keyword-Based Categorization Rules (categories.json, hot-reloaded) ---
+@st.cache_resource
+def get_rules_provider():
+    """One rules provider shared by every session; edits to categories.json apply without a server restart."""
+    provider = RulesProvider(DEFAULT_RULES_PATH)
+    # The description -> category cache is the only shared state tied to the rules themselves;
+    # every other cached step is keyed on the rules hash and simply misses for new rules
+    provider.subscribe(lambda old_rules, new_rules: get_categorization_cache().ensure_rules(new_rules.hash))
+    return provider
+
+def current_rules():
+    """The rules in force. main() reads them once per run, so a single run never mixes two rule sets."""
+    return get_rules_provider().get()
+
+@st.cache_resource
+def get_categorization_cache():
+    """One description -> category cache shared by every session, seeded from disk; its counters are exported with METRICS."""
+    cache = CategorizationCache.load(CATEGORIZATION_CACHE_PATH, current_rules().hash)
+    METRICS.register_collector("categorization_cache", cache.metrics_text)
+    return cache
+
+@st.cache_resource(max_entries=32)
+def get_learned_categorization_cache(rules_hash):
+    """An in-memory cache for rules extended with a profile's learned keywords."""
+    return CategorizationCache(rules_hash)
+
+def categorization_cache_for(rules):
+    """The shared cache for the shipped rules; rules with learned keywords get their own."""
+    if rules.hash == current_rules().hash:
+        return get_categorization_cache()
+    return get_learned_categorization_cache(rules.hash)
+
+@st.cache_resource
+def get_learned_rules(profile):
+    """Keywords a profile learned from its corrections, {category: [keyword, ...]}, seeded from disk."""
+    try:
+        return load_rules(os.path.join(profile, LEARNED_RULES_FILE))
+    except (OSError, ValueError):
+        return {}
+
+@st.cache_resource(max_entries=32)
+def compile_profile_rules(rules_hash, learned_key, _rules, _learned):
+    return CompiledRules(merge_rules(_rules.rules, _learned))
+
+def profile_rules(profile):
+    """The shipped rules in force with this profile's learned keywords appended."""
+    rules = current_rules()
+    learned = get_learned_rules(profile)
+    if not learned:
+        return rules
+    return compile_profile_rules(rules.hash, json.dumps(learned, sort_keys=True), rules, learned)
 
-# --- Load Keyword-Based Categorization Rules from JSON ---
-with open("categories.json", "r", encoding="utf-8") as f:
-    CATEGORY_RULES = json.load(f)
-def load_json(file_path):
-    """    Load a JSON file and return its content.
-    """
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
-# --- Load Keyword-Based Categorization Rules ---
 def categorize_transaction_by_keywords(details, amount, debit_credit):
     """
     Categorizes a financial transaction based on predefined regex keywords.
     """
-    details_lower = str(details).lower()
-
-    if debit_credit == "Credit":
-        # Check for specific income keywords first
-        for category, patterns in CATEGORY_RULES.items():
-            if category == "Income":
-                for pattern in patterns:
-                    if re.search(pattern, details_lower):
-                        return "Income"
-        return "Income" # Default to Income for any credit not caught by explicit income keywords
-
-    # For Debit transactions
-    for category, patterns in CATEGORY_RULES.items():
-        if category == "Income": # Skip "Income" category for debit transactions
-            continue
-        for pattern in patterns:
-            if re.search(pattern, details_lower):
-                return category
-    return "Other" # Default if no keyword matches for debits
-
-def detect_anomalies(df, category_col="Category", amount_col="Amount", threshold_zscore=2.5):
-    """
-    Detects anomalies in spending based on Z-score within each category.
-    A higher Z-score threshold means fewer, more extreme anomalies.
-    """
-    if df.empty:
-        return pd.DataFrame()
-
-    anomalies_list = []
-    # Only consider debit transactions for anomaly detection
-    debit_transactions = df[df["Debit/Credit"] == "Debit"].copy()
-
-    if debit_transactions.empty:
-        return pd.DataFrame()
+    return current_rules().categorize_one(details, debit_credit)
 
-    # Ensure 'Date' column is datetime before using .dt accessor
-    debit_transactions['Date'] = pd.to_datetime(debit_transactions['Date'])
+# Uploads larger than this are read in chunks to keep peak memory bounded
+CHUNKED_INGESTION_THRESHOLD_BYTES = 20 * 1024 * 1024
 
-    # Calculate mean and std dev of amounts for each category
-    category_stats = debit_transactions.groupby(category_col)[amount_col].agg(['mean', 'std']).reset_index()
-    category_stats.rename(columns={'mean': 'CategoryMean', 'std': 'CategoryStd'}, inplace=True)
+# Anomaly scoring modes selectable in the sidebar -> detect_anomalies keyword arguments
+ANOMALY_SCORING_MODES = {
+    "Z-score (mean/std)": {},
+    "Robust (median/MAD)": {"method": "robust"},
+    "Robust + day-of-month seasonality": {"method": "robust", "seasonality": "day_of_month"},
+    "Robust + weekday seasonality": {"method": "robust", "seasonality": "weekday"},
+}
 
-    # Merge stats back to the transactions
-    debit_transactions = pd.merge(debit_transactions, category_stats, on=category_col, how='left')
-
-    # Calculate Z-score for each transaction
-    # Handle cases where std dev is 0 (e.g., all transactions in a category are the same amount)
-    debit_transactions['ZScore'] = debit_transactions.apply(
-        lambda row: (row[amount_col] - row['CategoryMean']) / row['CategoryStd']
-        if row['CategoryStd'] > 0 else np.nan, axis=1
-    )
-
-    # Flag anomalies based on threshold
-    # We are looking for unusually high expenses, so Z-score > threshold
-    anomalies_df = debit_transactions[debit_transactions['ZScore'].abs() > threshold_zscore].copy()
-    anomalies_df['Anomaly_Reason'] = anomalies_df.apply(
-        lambda row: f"Unusually high expense (Z-score: {row['ZScore']:.2f})" if row['ZScore'] > 0 else f"Unusually low expense (Z-score: {row['ZScore']:.2f})",
-        axis=1
-    )
-    return anomalies_df[['Date', 'Details', 'Amount', category_col, 'Anomaly_Reason', 'ZScore']]
+# Rows per page in the Review & Edit Categories grid; only the visible page is sent to the browser
+REVIEW_PAGE_SIZES = [50, 100, 250]
 
+# Account selector entry that shows every account (each still analyzed separately)
+ALL_ACCOUNTS = "All accounts"
 
 # Page Configuration
 st.set_page_config(
@@ -159,243 +189,390 @@ if "categorization_complete" not in st.session_state:
     st.session_state.categorization_complete = False
 if "budget_goals" not in st.session_state:
     st.session_state.budget_goals = {} # Stores user-defined budget goals
-
-def process_transactions_advanced(df):
+if "budget_version" not in st.session_state:
+    st.session_state.budget_version = 0 # Bumped when budgets are cleared, to reset the budget editor
+if "spend_counters" not in st.session_state:
+    st.session_state.spend_counters = None # Per-period category spend of processed_transactions, for budgets
+if "account_spend_counters" not in st.session_state:
+    st.session_state.account_spend_counters = None # Per-account spend_counters, when there are several accounts
+if "aggregate_cube" not in st.session_state:
+    st.session_state.aggregate_cube = None # Day x category x Debit/Credit aggregates of processed_transactions
+
+def save_categorization_cache():
+    """Persist the shared categorization cache if it picked up new descriptions."""
+    cache = get_categorization_cache()
+    if cache.dirty:
+        try:
+            cache.save(CATEGORIZATION_CACHE_PATH)
+        except OSError:
+            pass # Persisting is best-effort; the in-memory cache still works
+
+def process_transactions_advanced(df, rules):
     """Process all transactions with advanced keyword categorization."""
-    if df is None or df.empty:
-        return df
-
-    df["Category"] = "Other" # Initialize column
-    df["Category"] = df.apply(
-        lambda row: categorize_transaction_by_keywords(row["Details"], row["Amount"], row["Debit/Credit"]),
-        axis=1
-    )
+    df = process_transactions(df, rules, cache=categorization_cache_for(rules))
+    save_categorization_cache()
     return df
 
-def load_and_process_file(file):
-    """Load and process the uploaded CSV file with improved validation."""
+def load_and_process_file(file, rules, amount_unit="rupees"):
+    """
+    Load, validate and categorize the uploaded CSV file, reporting dropped rows in the app.
+    amount_unit="paise" holds amounts as exact int64 paise; they are shown in rupees.
+    """
     try:
-        df = pd.read_csv(file)
-        df.columns = [col.strip() for col in df.columns]
-
-        # Validate and convert 'Amount'
-        if "Amount" in df.columns:
-            df["Amount"] = df["Amount"].astype(str).str.replace(",", "").str.replace("₹", "")
-            df["Amount"] = pd.to_numeric(df["Amount"], errors="coerce")
-            if df["Amount"].isnull().any():
-                st.warning("Some 'Amount' values could not be converted to numbers and were set to NaN. These rows will be dropped.")
-            df = df.dropna(subset=["Amount"])
-        else:
-            st.error("Missing required column: 'Amount'. Please ensure your CSV has this column.")
-            return None
-
-        # Validate and convert 'Date'
-        if "Date" in df.columns:
-            try:
-                df["Date"] = pd.to_datetime(df["Date"], format="%d %b %Y")
-            except ValueError:
-                try:
-                    df["Date"] = pd.to_datetime(df["Date"], format="%Y-%m-%d")
-                except ValueError:
-                    st.error("Could not parse 'Date' column. Please ensure it's in 'DD Mon YYYY' or 'YYYY-MM-DD' format.")
-                    return None
-            if df["Date"].isnull().any():
-                st.warning("Some 'Date' values could not be parsed and were set to NaT. These rows will be dropped.")
-            df = df.dropna(subset=["Date"])
-        else:
-            st.error("Missing required column: 'Date'. Please ensure your CSV has this column.")
-            return None
-
-        # Validate 'Debit/Credit'
-        if "Debit/Credit" not in df.columns:
-            st.error("Missing required column: 'Debit/Credit'. Please ensure your CSV has this column.")
-            return None
-        # Ensure 'Debit/Credit' column only contains 'Debit' or 'Credit'
-        df['Debit/Credit'] = df['Debit/Credit'].astype(str).str.strip()
-        invalid_dc = df[~df['Debit/Credit'].isin(['Debit', 'Credit'])]
-        if not invalid_dc.empty:
-            st.warning(f"Found {len(invalid_dc)} rows with invalid 'Debit/Credit' values (expected 'Debit' or 'Credit'). These rows will be dropped.")
-            df = df[df['Debit/Credit'].isin(['Debit', 'Credit'])]
-
-
-        required_cols = ["Date", "Details", "Amount", "Debit/Credit"]
-        # Final check for any missing required columns after initial processing
-        for col in required_cols:
-            if col not in df.columns or df[col].isnull().all():
-                st.error(f"Critical column '{col}' is missing or entirely empty after initial processing. Cannot proceed.")
-                return None
-
-        df = df.dropna(subset=required_cols) # Final dropna for any remaining NaNs in critical cols
+        df, counts = load_transactions(file, rules, cache=categorization_cache_for(rules), amount_unit=amount_unit)
+        save_categorization_cache()
+        for message in warning_messages(counts):
+            st.warning(message)
         if df.empty:
             st.warning("No valid transactions remaining after cleaning. Please check your CSV data.")
             return None
 
         return df
 
+    except IngestionError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Error processing file: {str(e)}. Please ensure it's a valid CSV with expected columns and data types.")
         return None
 
-def create_enhanced_visualizations(df):
-    """Create enhanced visualizations"""
-    if df is None or df.empty:
-        st.info("No data available for visualizations.")
-        return None, None, None
-
-    df['Date'] = pd.to_datetime(df['Date'])
+def load_and_process_file_chunked(file, rules, chunksize=DEFAULT_CHUNKSIZE, amount_unit="rupees"):
+    """
+    Load, validate and categorize a large CSV chunk by chunk, showing progress while it loads.
+    The returned frame is already categorized.
+    """
+    progress_bar = st.progress(0.0, text="Loading transactions...")
 
-    # Changed from Month to Day for daily spending trend
-    df["Day"] = df["Date"].dt.to_period("D")
-    daily_spending = df.groupby("Day")["Amount"].sum().reset_index()
-    daily_spending["Day"] = daily_spending["Day"].astype(str)
+    def report_progress(rows_read, fraction):
+        progress_bar.progress(fraction or 0.0, text=f"Loaded {rows_read:,} rows...")
 
-    fig_trend = px.line(
-        daily_spending, # Changed to daily_spending
-        x="Day", # Changed to Day
-        y="Amount",
-        title="📈 Daily Spending Trend", # Changed title
-        color_discrete_sequence=["#1A237E"] # Match header gradient
-    )
-    fig_trend.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)",
-                            xaxis_title="Day", yaxis_title="Amount (₹)") # Changed x-axis title
-
-    expenses_df = df[df["Debit/Credit"] == "Debit"].copy()
-    fig_pie = None
-    fig_bar = None
-
-    if not expenses_df.empty:
-        category_totals = expenses_df.groupby("Category")["Amount"].sum().reset_index()
-        category_totals = category_totals.sort_values("Amount", ascending=False)
-
-        fig_pie = px.pie(
-            category_totals,
-            values="Amount",
-            names="Category",
-            title="🎯 Expense Distribution by Category",
-            color_discrete_sequence=px.colors.qualitative.Pastel
-        )
-        fig_pie.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
-
-        top_categories = category_totals.head(10)
-        fig_bar = px.bar(
-            top_categories,
-            x="Category",
-            y="Amount",
-            title="💰 Top Spending Categories",
-            color="Amount",
-            color_continuous_scale="Viridis"
+    try:
+        df, counts = load_transactions(
+            file, rules, cache=categorization_cache_for(rules), chunksize=chunksize, progress=report_progress,
+            amount_unit=amount_unit
         )
-        fig_bar.update_layout(xaxis_tickangle=-45, plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)",
-                              xaxis_title="Category", yaxis_title="Total Amount (₹)")
-    else:
-        st.info("No expense transactions found for category analysis charts.")
+        save_categorization_cache()
+        for message in warning_messages(counts):
+            st.warning(message)
+        if df.empty:
+            st.warning("No valid transactions remaining after cleaning. Please check your CSV data.")
+            return None
 
-    return fig_trend, fig_pie, fig_bar
+        return df
 
+    except IngestionError as e:
+        st.error(str(e))
+        return None
+    except Exception as e:
+        st.error(f"Error processing file: {str(e)}. Please ensure it's a valid CSV with expected columns and data types.")
+        return None
+    finally:
+        progress_bar.empty()
+
+# --- Cached pipeline steps ---
+# Every widget interaction reruns the script, so each expensive step is cached on the inputs it
+# depends on: the upload's content hash, the rules hash, the filter tuple and the budget tuple.
+# Frames, figures and rules are passed as underscore arguments, which Streamlit does not hash.
+# Parsing depends only on the file, so a rules change re-runs categorization but never parsing.
+
+def get_content_hash(uploaded_file):
+    """SHA-256 of the uploaded file's bytes, computed once per upload and remembered in the session."""
+    file_id = getattr(uploaded_file, "file_id", uploaded_file.name)
+    hashes = st.session_state.setdefault("content_hashes", {})
+    if file_id not in hashes:
+        hashes[file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return hashes[file_id]
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_and_categorize_upload(content_hash, large_file, amount_unit, _file, _rules):
+    """
+    Parse, validate and categorize an upload. Warnings and errors are replayed on cache hits.
+    Returns (transactions, hash of the rules they were categorized with), or None.
+    """
+    # Returned in date order so filters can binary-search it (see TransactionIndex), with compact dtypes
+    if large_file:
+        # Chunks are categorized as they are read
+        df = load_and_process_file_chunked(_file, _rules, amount_unit=amount_unit)
+    else:
+        df = load_and_process_file(_file, _rules, amount_unit)
+    return None if df is None else (df, _rules.hash)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def recategorize(content_hash, rules_hash, amount_unit, _df, _rules):
+    """Re-apply changed rules to already-parsed transactions; each distinct description is matched once."""
+    return compact_transactions(process_transactions_advanced(_df, _rules))
+
+def categorized_upload(content_hash, large_file, uploaded_file, rules, amount_unit="rupees"):
+    """The upload categorized with `rules`, recategorizing lazily if it was parsed under older rules."""
+    loaded = load_and_categorize_upload(content_hash, large_file, amount_unit, uploaded_file, rules)
+    if loaded is None:
+        return None
+    df, categorized_with = loaded
+    if categorized_with != rules.hash:
+        df = recategorize(content_hash, rules.hash, amount_unit, df, rules)
+    return df
 
-def generate_smart_insights(df_processed, budget_goals):
-    """Generates textual insights based on processed financial data, including budget adherence and anomalies."""
-    insights = []
-
-    # Overall Metrics
-    total_debits = df_processed[df_processed["Debit/Credit"] == "Debit"]["Amount"].sum()
-    total_credits = df_processed[df_processed["Debit/Credit"] == "Credit"]["Amount"].sum()
-    net_flow = total_credits - total_debits
-
-    insights.append(f"**Overall Financial Snapshot:**")
-    insights.append(f"- Your total expenses amount to **₹{total_debits:,.2f}**.")
-    insights.append(f"- Your total income/credits amount to **₹{total_credits:,.2f}**.")
-    insights.append(f"- Your net financial flow is **₹{net_flow:,.2f}**.")
-
-    debits_df = df_processed[df_processed["Debit/Credit"] == "Debit"].copy()
-
-    if not debits_df.empty:
-        # Ensure 'Date' column is datetime before using .dt accessor on debits_df
-        debits_df['Date'] = pd.to_datetime(debits_df['Date'])
-        
-        # Spending Habits
-        category_summary = debits_df.groupby("Category")["Amount"].sum().sort_values(ascending=False)
-        if not category_summary.empty:
-            top_category = category_summary.index[0]
-            top_category_amount = category_summary.iloc[0]
-            insights.append(f"\n**Spending Habits:**")
-            insights.append(f"- Your largest spending area is **{top_category}**, accounting for **₹{top_category_amount:,.2f}**.")
-            if len(category_summary) > 1:
-                other_top_categories = category_summary.head(3).drop(top_category, errors='ignore')
-                if not other_top_categories.empty:
-                    insights.append(f"- Other significant expenses include: {', '.join([f'{cat} (₹{amt:,.2f})' for cat, amt in other_top_categories.items()])}.")
+def current_profile():
+    """
+    Directory of this user's saved data. A signed-in user (st.user) has one profile per account;
+    anyone else gets a random token in the page's ?profile= link, so the history is only
+    reachable by whoever holds that link (bookmark it to come back to the same history).
+    """
+    if "profile" not in st.session_state:
+        if st.user.get("is_logged_in"):
+            owner = f"user:{st.user.get('email') or st.user.get('sub')}"
         else:
-            insights.append("No categorized expenses to analyze spending habits.")
-
-        avg_transaction_debit = debits_df["Amount"].mean()
-        insights.append(f"- The average amount per expense transaction is **₹{avg_transaction_debit:,.2f}**.")
-
-        # Budget Adherence (for the current month/period of data)
-        insights.append(f"\n**Budget Adherence:**")
-        current_month_data = debits_df[debits_df['Date'].dt.to_period('M') == debits_df['Date'].dt.to_period('M').max()]
-        if not current_month_data.empty and budget_goals:
-            current_month_spending = current_month_data.groupby('Category')['Amount'].sum()
-            budget_insights = []
-            for category, budget_amount in budget_goals.items():
-                spent = current_month_spending.get(category, 0)
-                if budget_amount > 0:
-                    if spent > budget_amount:
-                        budget_insights.append(f"- You've **exceeded** your {category} budget (₹{budget_amount:,.2f}) by ₹{(spent - budget_amount):,.2f}.")
-                    else:
-                        remaining = budget_amount - spent
-                        budget_insights.append(f"- You have **₹{remaining:,.2f}** remaining in your {category} budget (out of ₹{budget_amount:,.2f}).")
-            if budget_insights:
-                insights.extend(budget_insights)
-            else:
-                insights.append("- No active budget goals for the current month's categories.")
+            token = st.query_params.get(PROFILE_PARAM, "")
+            if not re.fullmatch(r"[A-Za-z0-9_-]{22,64}", token):
+                token = secrets.token_urlsafe(16)
+            st.session_state.profile_token = token
+            owner = f"link:{token}"
+        st.session_state.profile = os.path.join(PROFILES_PATH, hashlib.sha256(owner.encode("utf-8")).hexdigest()[:32])
+    token = st.session_state.get("profile_token")
+    if token is not None and st.query_params.get(PROFILE_PARAM) != token:
+        st.query_params[PROFILE_PARAM] = token
+    return st.session_state.profile
+
+@st.cache_resource
+def get_transaction_store(profile):
+    """One profile's month-partitioned Parquet store of saved transactions, shared by its sessions."""
+    return TransactionStore(os.path.join(profile, "store"))
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def load_saved_transactions(profile, store_version, rules_hash, amount_unit, _store, _rules):
+    """Saved transactions; months stored under other rules are recategorized (and saved) first."""
+    _store.recategorize(lambda df: process_transactions_advanced(df, _rules), rules_hash)
+    return _store.load(amount_unit=amount_unit)
+
+def merge_upload_into_store(store, upload_key, df, rules):
+    """
+    Merge an upload into the saved history, once per upload and rules version.
+    Returns the rows that were new to the store, or None if this upload was merged before.
+    """
+    merged_uploads = st.session_state.setdefault("merged_uploads", {})
+    if upload_key in merged_uploads:
+        added_count, duplicates = merged_uploads[upload_key]
+        st.info(f"💾 Saved history: {added_count} new transactions added, {duplicates} already saved.")
+        return None
+    with st.spinner("Saving transactions to your history..."):
+        added, duplicates = store.merge(df, rules_hash=rules.hash)
+    merged_uploads[upload_key] = (len(added), duplicates)
+    st.info(f"💾 Saved history: {len(added)} new transactions added, {duplicates} already saved.")
+    return added
+
+@st.cache_resource
+def get_category_overrides(profile):
+    """One profile's manual category corrections, seeded from disk."""
+    return CategoryOverrides.load(os.path.join(profile, CATEGORY_OVERRIDES_FILE))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def identify_transactions(dataset_key, _df):
+    """The transactions with their stable Id column, hashed once per dataset."""
+    return with_ids(_df)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def apply_overrides(dataset_key, profile, overrides_version, _df, _overrides):
+    """Manual corrections patched over the rule-based categories in one vectorized pass."""
+    return _overrides.apply(_df)
+
+def record_overrides(profile, edits, learn_rules):
+    """
+    Store corrected categories (indexed by transaction Id) and optionally learn a keyword rule
+    for each corrected description into the profile's learned rules; categories.json itself is
+    never modified. Notes for the user are kept for the next run.
+    """
+    overrides = get_category_overrides(profile)
+    overrides.set(edits.index.to_numpy(), edits["Category"].astype(str))
+    try:
+        overrides.save(os.path.join(profile, CATEGORY_OVERRIDES_FILE))
+    except OSError:
+        pass # Persisting is best-effort; the corrections still apply in memory
+    notes = [f"✏️ Saved {len(edits)} category correction(s)."]
+    if learn_rules:
+        corrections = edits[["Details", "Category"]].astype(str).drop_duplicates()
+        learned = get_learned_rules(profile)
+        try:
+            for details, category in corrections.itertuples(index=False):
+                updated = add_keyword(category, details, os.path.join(profile, LEARNED_RULES_FILE))
+        except (OSError, ValueError) as e:
+            notes.append(f"Could not save the learned rules: {e}")
         else:
-            insights.append("- No budget goals set or no data for the current period.")
-
-
-        # Anomaly Detection Insights
-        anomalies_df = detect_anomalies(df_processed) # Use df_processed to get anomalies across all data
-        if not anomalies_df.empty:
-            insights.append(f"\n**Anomaly Detection:**")
-            insights.append(f"- Detected **{len(anomalies_df)} potential anomalies** in your spending.")
-            for i, row in anomalies_df.head(3).iterrows(): # Show top 3 anomalies
-                insights.append(f"  - On {row['Date'].strftime('%Y-%m-%d')}, a **₹{row['Amount']:,.2f}** transaction for '{row['Details']}' in '{row['Category']}' was flagged as: {row['Anomaly_Reason']}.")
-            if len(anomalies_df) > 3:
-                insights.append(f"  - (And {len(anomalies_df) - 3} more anomalies...)")
+            learned.clear()
+            learned.update(updated)
+            rules = profile_rules(profile)
+            for details, category in corrections.itertuples(index=False):
+                matched, pattern = rules.explain(details, "Debit")
+                if matched != category:
+                    notes.append(f"The new rule for '{details}' is shadowed by '{pattern}' ({matched}); "
+                                 f"raise the priority of {category} for it to take effect.")
+    st.session_state.review_notes = notes
+
+def select_account(dataset_key, df, account):
+    """One account's transactions, sliced once per dataset and account and kept in the session."""
+    views = st.session_state.setdefault("account_views", {})
+    if views.get("dataset_key") != dataset_key:
+        views.clear()
+        views["dataset_key"] = dataset_key
+    if account not in views:
+        views[account] = df[(df[ACCOUNT_COLUMN] == account).to_numpy()].reset_index(drop=True)
+    return views[account]
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def find_anomalies(dataset_key, filter_key, anomaly_mode, _filtered_df, _detector=None, multi_account=False):
+    """
+    Anomalies in the filtered view; an unfiltered Z-score view is scored by the session's detector.
+    With several accounts in view, each account is scored against its own category statistics.
+    """
+    anomaly_options = ANOMALY_SCORING_MODES[anomaly_mode]
+    if multi_account:
+        return detect_anomalies(_filtered_df, account_col=ACCOUNT_COLUMN, **anomaly_options)
+    if not anomaly_options and _detector is not None:
+        return _detector.anomalies(_filtered_df)
+    return detect_anomalies(_filtered_df, **anomaly_options)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_charts(dataset_key, filter_key, _cube):
+    """Plotly figures for the Analytics tab."""
+    return create_enhanced_visualizations(_cube)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def build_insights(dataset_key, filter_key, anomaly_mode, budget_key, _filtered_df, _anomalies_df, _cube, _budget_status):
+    """Smart insights text, rendered from the view's metrics; the only step that depends on the budget inputs."""
+    metrics = build_insight_metrics(dataset_key, filter_key, _cube)
+    return generate_smart_insights(_filtered_df, json.loads(budget_key), _anomalies_df, metrics=metrics,
+                                   budget_status=_budget_status)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_insight_metrics(dataset_key, filter_key, _cube):
+    """Every registered insight metric for the filtered view, evaluated together on its cube."""
+    return compute_insight_metrics(_cube)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_account_insights(dataset_key, filter_key, anomaly_mode, budget_key, _filtered_df, _anomalies_df, _counters):
+    """
+    Per-account insights, with every account's metrics computed in one batch, and budget status for
+    every account. Budgets are evaluated on the dataset's per-account counters, not the filtered rows.
+    """
+    budget_goals = json.loads(budget_key)
+    return (
+        insights_by_account(_filtered_df, budget_goals, anomalies_df=_anomalies_df, counters=_counters),
+        budget_status_by_account(_filtered_df, budget_goals, counters=_counters),
+    )
+
+def budget_goals_key():
+    """The session's budgets as a hashable cache key; json.loads(key) gives them back."""
+    return json.dumps(st.session_state.budget_goals, sort_keys=True)
+
+def budget_table(categories):
+    """One editable row per expense category: amount, period and rollover of its budget."""
+    rows = []
+    for category in categories:
+        spec = st.session_state.budget_goals.get(category, 0.0)
+        if not isinstance(spec, dict):
+            spec = {"amount": spec}
+        rows.append((category, float(spec.get("amount") or 0.0), spec.get("period", DEFAULT_PERIOD),
+                     bool(spec.get("rollover", False))))
+    return pd.DataFrame(rows, columns=["Category", "Budget", "Period", "Rollover"])
+
+def save_budget_table(edited):
+    """Store edited budgets; a plain monthly budget without rollover is kept as just its amount."""
+    goals = {}
+    for row in edited.to_dict("records"):
+        amount = float(row["Budget"] or 0.0)
+        if row["Period"] == DEFAULT_PERIOD and not row["Rollover"]:
+            goals[row["Category"]] = amount
         else:
-            insights.append(f"\n**Anomaly Detection:**")
-            insights.append("- No significant spending anomalies detected.")
-
-
-        # Time-based insights (e.g., busiest spending days/months)
-        # FIX: Ensure 'DayOfWeek' and 'MonthYear' are created on debits_df itself
-        debits_df['DayOfWeek'] = debits_df['Date'].dt.day_name()
-        spending_by_day = debits_df.groupby('DayOfWeek')['Amount'].sum().sort_values(ascending=False)
-        if not spending_by_day.empty:
-            busiest_day = spending_by_day.index[0]
-            insights.append(f"\n**Behavioral Insights:**")
-            insights.append(f"- You tend to spend most on **{busiest_day}s**.")
-
-        debits_df['MonthYear'] = debits_df['Date'].dt.to_period('M')
-        monthly_trends = debits_df.groupby('MonthYear')['Amount'].sum()
-        if len(monthly_trends) > 1:
-            latest_month = monthly_trends.index[-1]
-            previous_month = monthly_trends.index[-2]
-            if previous_month:
-                change = monthly_trends[latest_month] - monthly_trends[previous_month]
-                if change > 0:
-                    insights.append(f"- Your spending in {latest_month.strftime('%B %Y')} increased by **₹{change:,.2f}** compared to {previous_month.strftime('%B %Y')}.")
-                elif change < 0:
-                    insights.append(f"- Your spending in {latest_month.strftime('%B %Y')} decreased by **₹{-change:,.2f}** compared to {previous_month.strftime('%B %Y')}.")
-                else:
-                    insights.append(f"- Your spending remained consistent in {latest_month.strftime('%B %Y')} compared to {previous_month.strftime('%B %Y')}.")
+            goals[row["Category"]] = {"amount": amount, "period": row["Period"], "rollover": bool(row["Rollover"])}
+    st.session_state.budget_goals = goals
+
+def show_budget_status(status):
+    """Budget status table from budgets.evaluate_budgets (per account when it has an Account column)."""
+    columns = [col for col in [ACCOUNT_COLUMN, "Category", "Period", "Available", "Spent", "Remaining", "Burn Rate",
+                               "Projected Overrun", "Period End"] if col in status.columns]
+    st.dataframe(
+        status[columns], use_container_width=True, hide_index=True,
+        column_config={
+            **{col: st.column_config.NumberColumn(col, format="₹%.2f")
+               for col in ["Available", "Spent", "Remaining", "Projected Overrun"]},
+            "Burn Rate": st.column_config.NumberColumn("Burn Rate (per day)", format="₹%.2f"),
+            "Period End": st.column_config.DateColumn("Period End", format="DD MMM YYYY"),
+        }
+    )
 
-    else:
-        insights.append("No debit transactions found to generate detailed spending insights.")
+def create_enhanced_visualizations(data):
+    """Create enhanced visualizations from transactions or from an already-built AggregateCube"""
+    if data is None or data.empty:
+        st.info("No data available for visualizations.")
+        return None, None, None
 
-    return "\n".join(insights)
+    fig_trend, fig_pie, fig_bar = build_figures(data)
+    if fig_pie is None:
+        st.info("No expense transactions found for category analysis charts.")
 
+    return fig_trend, fig_pie, fig_bar
+
+@st.cache_resource
+def configure_metrics_export():
+    """Attach the metrics log and start the /metrics endpoint once per server process, as configured by env vars."""
+    log_target = os.environ.get(METRICS_LOG_ENV)
+    if log_target:
+        log_to(log_target)
+    port = os.environ.get(METRICS_PORT_ENV)
+    if port:
+        try:
+            serve_metrics(int(port))
+        except (OSError, ValueError) as e:
+            # Another server process may already own the port; the dashboard itself still works
+            st.warning(f"Metrics endpoint not started on port {port}: {e}")
+    return True
+
+def render_performance_panel(run):
+    """Sidebar panel with this rerun's stage timings and the process-wide metrics."""
+    with st.sidebar:
+        st.markdown("### ⏱️ Performance")
+        if not st.checkbox("Show stage timings", key="show_performance",
+                           help="Duration, rows in/out and memory change of each pipeline stage in this rerun."):
+            return
+        stages = pd.DataFrame([
+            {
+                "Stage": "  " * record["depth"] + record["stage"],
+                "ms": record["seconds"] * 1000,
+                "Rows in": record["rows_in"],
+                "Rows out": record["rows_out"],
+                "Δ MiB": None if record["memory_delta_bytes"] is None else record["memory_delta_bytes"] / 2**20,
+            }
+            for record in run.stages
+        ], columns=["Stage", "ms", "Rows in", "Rows out", "Δ MiB"])
+        st.caption(f"This rerun: {run.seconds * 1000:,.0f} ms in total; cached steps show as near zero.")
+        st.dataframe(
+            stages, use_container_width=True, hide_index=True,
+            column_config={
+                "ms": st.column_config.NumberColumn("ms", format="%.1f"),
+                "Rows in": st.column_config.NumberColumn("Rows in", format="%d"),
+                "Rows out": st.column_config.NumberColumn("Rows out", format="%d"),
+                "Δ MiB": st.column_config.NumberColumn("Δ MiB", format="%.1f"),
+            }
+        )
+        st.download_button(
+            label="📥 Prometheus metrics",
+            data=METRICS.prometheus_text().encode("utf-8"),
+            file_name="finwise_metrics.prom",
+            mime="text/plain",
+            use_container_width=True,
+            help=f"Counters and histograms for every rerun in this server process, plus the categorization cache's "
+                 f"hit/miss counters. Set {METRICS_PORT_ENV} to serve them at /metrics."
+        )
 
 def main():
+    configure_metrics_export()
+    run = start_run()
+    try:
+        render_dashboard()
+    finally:
+        finish_run(run)
+    render_performance_panel(run)
+
+def render_dashboard():
     st.markdown("""
     <div class="main-header">
         <h1>⚡ FinWise  </h1>
@@ -403,6 +580,15 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
+    profile = current_profile()
+    rules = profile_rules(profile)
+    rules_error = get_rules_provider().last_error
+    if rules_error:
+        st.warning(f"categories.json could not be reloaded ({rules_error}); the previous rules are still in use.")
+    if st.session_state.get("rules_hash") not in (None, rules.hash):
+        st.toast("🔄 Categorization rules were updated; your transactions have been recategorized.")
+    st.session_state.rules_hash = rules.hash
+
     with st.sidebar:
         st.markdown("### 🚀 Features")
         st.markdown("""
@@ -414,239 +600,431 @@ def main():
         """)
 
         st.markdown("### 📊 Quick Stats")
-        if st.session_state.processed_transactions is not None:
-            df_sidebar = st.session_state.processed_transactions
-            debits_sidebar = df_sidebar[df_sidebar["Debit/Credit"] == "Debit"].copy()
-            credits_sidebar = df_sidebar[df_sidebar["Debit/Credit"] == "Credit"].copy()
+        if st.session_state.aggregate_cube is not None:
+            debits_sidebar = st.session_state.aggregate_cube.debits()
+            credits_sidebar = st.session_state.aggregate_cube.credits()
 
             col1, col2 = st.columns(2)
             with col1:
-                st.markdown(f'<div class="metric-card"><h3>Total Expenses</h3><h2>₹{debits_sidebar["Amount"].sum():,.2f}</h2></div>', unsafe_allow_html=True)
+                st.markdown(f'<div class="metric-card"><h3>Total Expenses</h3><h2>₹{debits_sidebar.total():,.2f}</h2></div>', unsafe_allow_html=True)
             with col2:
-                st.markdown(f'<div class="metric-card"><h3>Total Income</h3><h2>₹{credits_sidebar["Amount"].sum():,.2f}</h2></div>', unsafe_allow_html=True)
-            st.metric("Transactions (Debit)", len(debits_sidebar))
-            st.metric("Categories (Debit)", debits_sidebar["Category"].nunique())
+                st.markdown(f'<div class="metric-card"><h3>Total Income</h3><h2>₹{credits_sidebar.total():,.2f}</h2></div>', unsafe_allow_html=True)
+            st.metric("Transactions (Debit)", debits_sidebar.count())
+            st.metric("Categories (Debit)", len(debits_sidebar.categories()))
             # FIX: Changed outer f-string quotes to single quotes to avoid conflict with inner double quotes
-            st.metric("Net Flow", f'₹{(credits_sidebar["Amount"].sum() - debits_sidebar["Amount"].sum()):,.2f}')
+            st.metric("Net Flow", f'₹{(credits_sidebar.total() - debits_sidebar.total()):,.2f}')
+
+        st.markdown("---")
+        st.markdown("### 🚨 Anomaly Scoring")
+        anomaly_mode = st.selectbox(
+            "Scoring method",
+            options=list(ANOMALY_SCORING_MODES),
+            help="Robust scoring is not skewed by a few very large transactions; seasonal modes compare "
+                 "against the same day of the month or weekday, so regular bills are not flagged.",
+            key="anomaly_mode"
+        )
+        exact_amounts = st.checkbox(
+            "Exact amounts (integer paise)",
+            help="Hold amounts as whole paise so totals are exact integer sums, with no floating-point "
+                 "rounding drift; amounts are still shown in rupees.",
+            key="amount_paise"
+        )
+        amount_unit = "paise" if exact_amounts else "rupees"
 
         st.markdown("---")
-        st.markdown("### 🎯 Set Monthly Budgets")
+        st.markdown("### 💾 Saved History")
+        use_store = st.checkbox(
+            "Keep my transaction history",
+            help="Uploads are merged into a history private to your sign-in, or to this page's link if "
+                 "you are not signed in (duplicates skipped), so next time the dashboard opens without "
+                 "re-uploading anything. Bookmark the link to come back to it.",
+            key="use_store"
+        )
+        store = get_transaction_store(profile)
+        if use_store and len(store):
+            st.caption(f"{len(store):,} transactions saved.")
+            if st.button("Delete saved history", key="clear_store"):
+                store.clear()
+                st.session_state.merged_uploads = {}
+                st.rerun()
+
+        st.markdown("---")
+        st.markdown("### 🎯 Set Budgets")
         # Get all unique categories from processed data for budget setting
-        if st.session_state.processed_transactions is not None:
-            all_expense_categories = sorted(st.session_state.processed_transactions[st.session_state.processed_transactions["Debit/Credit"] == "Debit"]["Category"].unique())
+        if st.session_state.aggregate_cube is not None:
+            all_expense_categories = sorted(st.session_state.aggregate_cube.debits().categories())
             if "Other" in all_expense_categories: # Move 'Other' to end for better UX
                 all_expense_categories.remove("Other")
                 all_expense_categories.append("Other")
 
-            for category in all_expense_categories:
-                # Use a unique key for each number_input to prevent re-rendering issues
-                st.session_state.budget_goals[category] = st.number_input(
-                    f"Budget for {category} (₹)",
-                    min_value=0.0,
-                    value=st.session_state.budget_goals.get(category, 0.0),
-                    step=100.0,
-                    key=f"budget_{category}"
+            # Edits are batched in a form: nothing reruns until the budgets are saved
+            with st.form("budget_form", border=False):
+                edited_budgets = st.data_editor(
+                    budget_table(all_expense_categories),
+                    hide_index=True, use_container_width=True,
+                    disabled=["Category"],
+                    column_config={
+                        "Budget": st.column_config.NumberColumn("Budget (₹)", min_value=0.0, step=100.0, format="%.2f"),
+                        "Period": st.column_config.SelectboxColumn("Period", options=BUDGET_PERIODS, required=True),
+                        "Rollover": st.column_config.CheckboxColumn(
+                            "Rollover", help="Carry unused budget (or overspending) into the next period."
+                        ),
+                    },
+                    key=f"budget_editor_{st.session_state.budget_version}"
                 )
+                if st.form_submit_button("Save Budgets", use_container_width=True):
+                    save_budget_table(edited_budgets)
             if st.button("Clear All Budgets", key="clear_budgets"):
                 st.session_state.budget_goals = {cat: 0.0 for cat in all_expense_categories}
+                st.session_state.budget_version += 1
                 st.rerun() # Rerun to update budget inputs
 
     # Main content area
     uploaded_file = st.file_uploader(
         "📁 Upload your transaction CSV file",
         type=["csv"],
-        help="Upload a CSV file with columns: Date (DD Mon YYYY), Details, Amount, Debit/Credit"
+        help="Upload a CSV file with columns: Date (e.g. DD Mon YYYY, DD/MM/YYYY or YYYY-MM-DD), Details, Amount, Debit/Credit"
     )
 
-    if uploaded_file is not None:
-        with st.spinner("Loading & Validating transaction data..."):
-            df = load_and_process_file(uploaded_file)
-
-        if df is not None:
-            st.success(f"✅ Loaded {len(df)} transactions successfully!")
-
-            with st.spinner("Categorizing transactions..."):
-                df_processed = process_transactions_advanced(df.copy())
-                st.session_state.processed_transactions = df_processed
-                st.session_state.categorization_complete = True
-
-            if st.session_state.categorization_complete and st.session_state.processed_transactions is not None:
-                df_current = st.session_state.processed_transactions.copy() # Work on a copy for filtering
-
-                st.markdown("### 🔍 Filter Transactions")
-                col_date_start, col_date_end, col_category_filter = st.columns([1, 1, 2])
-
-                min_date = df_current['Date'].min().date() if not df_current.empty else datetime.now().date() - timedelta(days=365)
-                max_date = df_current['Date'].max().date() if not df_current.empty else datetime.now().date()
-
-                with col_date_start:
-                    start_date = st.date_input("Start Date", value=min_date, min_value=min_date, max_value=max_date)
-                with col_date_end:
-                    end_date = st.date_input("End Date", value=max_date, min_value=min_date, max_value=max_date)
-
-                # Get all unique categories for filtering
-                all_filterable_categories = sorted(df_current["Category"].unique().tolist())
-                if "Other" in all_filterable_categories:
-                    all_filterable_categories.remove("Other")
-                    all_filterable_categories.append("Other") # Move to end
-
-                with col_category_filter:
-                    selected_categories = st.multiselect(
-                        "Filter by Category",
-                        options=all_filterable_categories,
-                        default=all_filterable_categories # Default to all selected
-                    )
-
-                # Apply filters
-                filtered_df = df_current[
-                    (df_current['Date'].dt.date >= start_date) &
-                    (df_current['Date'].dt.date <= end_date) &
-                    (df_current['Category'].isin(selected_categories))
-                ].copy() # Ensure a copy after filtering
+    df_processed = None
+    appended_rows = None
 
-                if filtered_df.empty:
-                    st.warning("No transactions match the selected filters.")
+    if uploaded_file is not None:
+        large_file = getattr(uploaded_file, "size", 0) > CHUNKED_INGESTION_THRESHOLD_BYTES
+        content_hash = get_content_hash(uploaded_file)
+        dataset_key = (content_hash, rules.hash, amount_unit)
+        with st.spinner("Loading, validating & categorizing transaction data..."), stage("upload") as record:
+            df_processed = categorized_upload(content_hash, large_file, uploaded_file, rules, amount_unit)
+            record["rows_out"] = None if df_processed is None else len(df_processed)
+
+        if df_processed is not None:
+            st.success(f"✅ Loaded {len(df_processed)} transactions successfully!")
+            if use_store:
+                # Show the upload merged into the saved history
+                previous_store_key = ("store", profile, store.version, rules.hash, amount_unit)
+                with stage("store_merge", rows_in=len(df_processed)) as record:
+                    appended_rows = merge_upload_into_store(store, dataset_key, df_processed, rules)
+                    record["rows_out"] = None if appended_rows is None else len(appended_rows)
+                dataset_key = ("store", profile, store.version, rules.hash, amount_unit)
+                with stage("store_load") as record:
+                    df_processed = load_saved_transactions(profile, store.version, rules.hash, amount_unit, store, rules)
+                    record["rows_out"] = len(df_processed)
+    elif use_store and len(store):
+        # Returning user: read the saved history, no CSV parsing at all
+        dataset_key = ("store", profile, store.version, rules.hash, amount_unit)
+        with stage("store_load") as record:
+            df_processed = load_saved_transactions(profile, store.version, rules.hash, amount_unit, store, rules)
+            record["rows_out"] = len(df_processed)
+        st.success(f"📂 Loaded {len(df_processed)} saved transactions.")
+
+    if df_processed is not None:
+        # Manual corrections from the review grid are applied on top of the rules
+        overrides = get_category_overrides(profile)
+        with stage("overrides", rows_in=len(df_processed)) as record:
+            df_processed = identify_transactions(dataset_key, df_processed)
+            df_processed = apply_overrides(dataset_key, profile, overrides.version, df_processed, overrides)
+            record["rows_out"] = len(df_processed)
+        dataset_key = dataset_key + (profile, overrides.version)
+        if appended_rows is not None:
+            previous_store_key = previous_store_key + (profile, overrides.version)
+            appended_rows = overrides.apply(with_ids(appended_rows))
+
+    multi_account = False
+    if df_processed is not None and has_accounts(df_processed):
+        account_names = sorted(df_processed[ACCOUNT_COLUMN].unique().tolist())
+        selected_account = st.selectbox(
+            "👤 Account", options=[ALL_ACCOUNTS] + account_names, key="selected_account",
+            help="Statistics, budgets and anomalies are always computed per account."
+        )
+        if selected_account == ALL_ACCOUNTS:
+            multi_account = True
+        else:
+            with stage("select_account", rows_in=len(df_processed)) as record:
+                df_processed = select_account(dataset_key, df_processed, selected_account)
+                record["rows_out"] = len(df_processed)
+            dataset_key = dataset_key + (selected_account,)
+
+    if df_processed is not None:
+        st.session_state.processed_transactions = df_processed
+        st.session_state.categorization_complete = True
+
+        # Category statistics, the aggregate cube and the filter index are built once per dataset, not on every rerun
+        if st.session_state.get("anomaly_detector_key") != dataset_key:
+            with stage("build_indexes", rows_in=len(df_processed)) as record:
+                incremental = appended_rows is not None and st.session_state.get("anomaly_detector_key") == previous_store_key
+                multi_account_data = has_accounts(df_processed)
+                if incremental:
+                    # Only the newly saved rows are folded into the running category statistics and budget counters
+                    st.session_state.anomaly_detector.append(appended_rows, score=False)
+                    st.session_state.spend_counters.add(appended_rows)
+                    if multi_account_data and st.session_state.account_spend_counters is not None:
+                        st.session_state.account_spend_counters.add(appended_rows, ACCOUNT_COLUMN)
                 else:
-                    st.markdown(f"**Displaying {len(filtered_df)} transactions after filtering.**")
-
-                tab1, tab2, tab3, tab4, tab5 = st.tabs(["💸 Expenses", "💰 Income", "📊 Analytics", "📈 Insights", "🚨 Anomalies"])
-
-                with tab1:
-                    st.markdown("### 💸 Expense Analysis")
-                    debits_df = filtered_df[filtered_df["Debit/Credit"] == "Debit"].copy()
-
-                    if not debits_df.empty:
-                        col1, col2, col3, col4 = st.columns(4)
-                        with col1:
-                            st.markdown(f'<div class="metric-card"><h3>Total Expenses</h3><h2>₹{debits_df["Amount"].sum():,.0f}</h2></div>', unsafe_allow_html=True)
-                        with col2:
-                            st.markdown(f'<div class="metric-card"><h3>Transactions</h3><h2>{len(debits_df)}</h2></div>', unsafe_allow_html=True)
-                        with col3:
-                            st.markdown(f'<div class="metric-card"><h3>Avg. Amount</h3><h2>₹{debits_df["Amount"].mean():,.0f}</h2></div>', unsafe_allow_html=True)
-                        with col4:
-                            st.markdown(f'<div class="metric-card"><h3>Categories</h3><h2>{debits_df["Category"].nunique()}</h2></div>', unsafe_allow_html=True)
-
-                        st.markdown("---")
-                        st.markdown("### 📝 Review & Edit Categories")
-                        all_editable_categories = sorted(list(set(CATEGORY_RULES.keys()).union(set(debits_df["Category"].unique()))))
-                        if "Income" in all_editable_categories:
-                            all_editable_categories.remove("Income")
-                        if "Other" not in all_editable_categories:
-                            all_editable_categories.append("Other")
-                        all_editable_categories = sorted(all_editable_categories)
-
-                        edited_df = st.data_editor(
-                            debits_df[["Date", "Details", "Amount", "Category"]].head(50), # Show first 50 for editing
-                            column_config={
-                                "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
-                                "Amount": st.column_config.NumberColumn("Amount", format="₹%.2f"),
-                                "Category": st.column_config.SelectboxColumn("Category", options=all_editable_categories, help="Rule-based category")
-                            },
-                            hide_index=True,
-                            use_container_width=True,
-                            key="expense_editor"
-                        )
-                        # Note: Edits made in st.data_editor are not automatically saved back to the main DataFrame
-                        # For persistence of edits, you would need to implement logic to update st.session_state.processed_transactions
-                        # based on the changes in 'edited_df'.
-
-                        st.markdown("### 📊 Category Breakdown")
-                        category_summary = debits_df.groupby("Category").agg({"Amount": ["sum", "count", "mean"]}).round(2)
-                        category_summary.columns = ["Total Amount", "Count", "Average"]
-                        category_summary = category_summary.sort_values("Total Amount", ascending=False)
-                        st.dataframe(
-                            category_summary,
-                            use_container_width=True,
-                            column_config={
-                                "Total Amount": st.column_config.NumberColumn("Total Amount", format="₹%.2f"),
-                                "Average": st.column_config.NumberColumn("Average", format="₹%.2f")
-                            }
-                        )
-                    else:
-                        st.info("No debit transactions found to analyze expenses based on current filters.")
-
-
-                with tab2:
-                    st.markdown("### 💰 Income Analysis")
-                    credits_df = filtered_df[filtered_df["Debit/Credit"] == "Credit"].copy()
-                    if not credits_df.empty:
-                        total_income = credits_df["Amount"].sum()
-                        st.metric("💰 Total Income", f"₹{total_income:,.2f}")
-                        st.dataframe(
-                            credits_df[["Date", "Details", "Amount", "Category"]],
-                            use_container_width=True,
-                            column_config={
-                                "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
-                                "Amount": st.column_config.NumberColumn("Amount", format="₹%.2f")
-                            }
+                    st.session_state.anomaly_detector = IncrementalAnomalyDetector().fit(df_processed)
+                st.session_state.aggregate_cube = AggregateCube.build(df_processed)
+                if not incremental:
+                    st.session_state.spend_counters = SpendCounters.from_cube(st.session_state.aggregate_cube)
+                if not multi_account_data:
+                    st.session_state.account_spend_counters = None
+                elif not incremental or st.session_state.account_spend_counters is None:
+                    # Per-account budgets, like the overall ones, count all spending whatever the filters
+                    st.session_state.account_spend_counters = SpendCounters.build(df_processed, group_col=ACCOUNT_COLUMN)
+                st.session_state.transaction_index = TransactionIndex(df_processed)
+                st.session_state.anomaly_detector_key = dataset_key
+                record["rows_out"] = len(st.session_state.transaction_index)
+
+        if st.session_state.categorization_complete and st.session_state.processed_transactions is not None:
+            df_current = st.session_state.processed_transactions # Read-only; views below never modify it
+
+            st.markdown("### 🔍 Filter Transactions")
+            col_date_start, col_date_end, col_category_filter = st.columns([1, 1, 2])
+
+            transaction_index = st.session_state.transaction_index
+            # Transactions are sorted by date, so the range is simply the first and last row
+            min_date = df_current['Date'].iloc[0].date() if not df_current.empty else datetime.now().date() - timedelta(days=365)
+            max_date = df_current['Date'].iloc[-1].date() if not df_current.empty else datetime.now().date()
+
+            with col_date_start:
+                start_date = st.date_input("Start Date", value=min_date, min_value=min_date, max_value=max_date)
+            with col_date_end:
+                end_date = st.date_input("End Date", value=max_date, min_value=min_date, max_value=max_date)
+
+            # Get all unique categories for filtering
+            all_filterable_categories = transaction_index.categories # Already sorted
+            if "Other" in all_filterable_categories:
+                all_filterable_categories.remove("Other")
+                all_filterable_categories.append("Other") # Move to end
+
+            with col_category_filter:
+                selected_categories = st.multiselect(
+                    "Filter by Category",
+                    options=all_filterable_categories,
+                    default=all_filterable_categories # Default to all selected
+                )
+
+            # Apply filters: binary search on the sorted dates plus the per-category row indexes
+            filter_key = (start_date, end_date, tuple(selected_categories))
+            with stage("filter", rows_in=len(df_current)) as record:
+                filtered_df = transaction_index.select(start_date, end_date, selected_categories)
+                # Every total, count and breakdown below is read from this slice of the cube
+                filtered_cube = st.session_state.aggregate_cube.slice(start_date, end_date, selected_categories)
+                filtered_debits_cube = filtered_cube.debits()
+                record["rows_out"] = len(filtered_df)
+
+            if filtered_df.empty:
+                st.warning("No transactions match the selected filters.")
+            else:
+                st.markdown(f"**Displaying {len(filtered_df)} transactions after filtering.**")
+
+            # Detect anomalies once for both the Insights and Anomalies tabs.
+            # Unfiltered views reuse the session's detector instead of recomputing category stats.
+            unfiltered = len(filtered_df) == len(df_current)
+            with stage("anomalies", rows_in=len(filtered_df)) as record:
+                anomalies_in_filtered_data = find_anomalies(
+                    dataset_key, filter_key, anomaly_mode, filtered_df,
+                    _detector=st.session_state.anomaly_detector if unfiltered else None, multi_account=multi_account
+                )
+                record["rows_out"] = len(anomalies_in_filtered_data)
+
+            tab1, tab2, tab3, tab4, tab5 = st.tabs(["💸 Expenses", "💰 Income", "📊 Analytics", "📈 Insights", "🚨 Anomalies"])
+
+            with tab1:
+                st.markdown("### 💸 Expense Analysis")
+                if not filtered_debits_cube.empty:
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        st.markdown(f'<div class="metric-card"><h3>Total Expenses</h3><h2>₹{filtered_debits_cube.total():,.0f}</h2></div>', unsafe_allow_html=True)
+                    with col2:
+                        st.markdown(f'<div class="metric-card"><h3>Transactions</h3><h2>{filtered_debits_cube.count()}</h2></div>', unsafe_allow_html=True)
+                    with col3:
+                        st.markdown(f'<div class="metric-card"><h3>Avg. Amount</h3><h2>₹{filtered_debits_cube.mean():,.0f}</h2></div>', unsafe_allow_html=True)
+                    with col4:
+                        st.markdown(f'<div class="metric-card"><h3>Categories</h3><h2>{len(filtered_debits_cube.categories())}</h2></div>', unsafe_allow_html=True)
+
+                    st.markdown("---")
+                    st.markdown("### 📝 Review & Edit Categories")
+                    all_editable_categories = sorted(list((set(rules.rules.keys()) - {PRIORITIES_KEY}).union(set(filtered_debits_cube.categories()))))
+                    if "Income" in all_editable_categories:
+                        all_editable_categories.remove("Income")
+                    if "Other" not in all_editable_categories:
+                        all_editable_categories.append("Other")
+                    all_editable_categories = sorted(all_editable_categories)
+
+                    for note in st.session_state.pop("review_notes", []):
+                        st.info(note)
+
+                    # Page through every filtered expense; only the rows on the current page are sliced and sent
+                    debit_positions = np.flatnonzero((filtered_df["Debit/Credit"] == "Debit").to_numpy())
+                    col_page_size, col_page, col_learn = st.columns([1, 1, 2])
+                    with col_page_size:
+                        page_size = st.selectbox("Rows per page", REVIEW_PAGE_SIZES, key="review_page_size")
+                    page_count = max(1, -(-len(debit_positions) // page_size))
+                    # The page lives only in session state (no widget default), so it can be reset when filters shrink
+                    if st.session_state.get("review_page", page_count + 1) > page_count:
+                        st.session_state.review_page = 1
+                    with col_page:
+                        page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key="review_page")
+                    with col_learn:
+                        learn_rules = st.checkbox(
+                            "Learn a rule from each correction",
+                            help="Also learn the corrected description as a keyword for its new category. Learned "
+                                 "keywords apply to your profile only, on top of categories.json.",
+                            key="learn_rules"
                         )
-                    else:
-                        st.info("No credit transactions found based on current filters.")
-
-                with tab3:
-                    st.markdown("### 📊 Advanced Analytics")
-                    debits_df_for_charts = filtered_df[filtered_df["Debit/Credit"] == "Debit"].copy()
-                    if not debits_df_for_charts.empty:
-                        fig_trend, fig_pie, fig_bar = create_enhanced_visualizations(debits_df_for_charts)
-                        if fig_trend:
-                            st.plotly_chart(fig_trend, use_container_width=True)
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            if fig_pie:
-                                st.plotly_chart(fig_pie, use_container_width=True)
-                            else:
-                                st.info("Not enough data to generate Expense Distribution Pie Chart.")
-                        with col2:
-                            if fig_bar:
-                                st.plotly_chart(fig_bar, use_container_width=True)
-                            else:
-                                st.info("Not enough data to generate Top Spending Categories Bar Chart.")
-                    else:
-                        st.info("No debit transactions found for advanced analytics charts based on current filters.")
-
-
-                with tab4:
-                    st.markdown("### 📈 Smart Insights")
-                    if not filtered_df.empty:
-                        insights_text = generate_smart_insights(filtered_df.copy(), st.session_state.budget_goals)
-                        st.markdown(insights_text)
-                    else:
-                        st.info("Apply filters to see smart insights for the selected period/categories.")
-
-                with tab5:
-                    st.markdown("### 🚨 Anomalous Transactions")
-                    anomalies_in_filtered_data = detect_anomalies(filtered_df.copy())
-                    if not anomalies_in_filtered_data.empty:
-                        st.warning(f"Found {len(anomalies_in_filtered_data)} potential anomalies in the filtered data:")
-                        st.dataframe(
-                            anomalies_in_filtered_data.drop(columns=['ZScore']),
-                            use_container_width=True,
-                            column_config={
-                                "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
-                                "Amount": st.column_config.NumberColumn("Amount", format="₹%.2f"),
-                            }
+                    page_start = (page - 1) * page_size
+                    page_rows = filtered_df.iloc[debit_positions[page_start:page_start + page_size]]
+                    st.caption(f"Expenses {page_start + 1:,}–{page_start + len(page_rows):,} of {len(debit_positions):,}")
+
+                    # Plain strings, so any category can be picked, not only those already on the page
+                    review_df = in_rupees(page_rows[[ID_COLUMN, "Date", "Details", "Amount", "Category"]]).astype({"Category": str})
+                    review_df = review_df.set_index(ID_COLUMN)
+                    edited_df = st.data_editor(
+                        review_df,
+                        column_config={
+                            "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
+                            "Amount": st.column_config.NumberColumn("Amount", format="₹%.2f"),
+                            "Category": st.column_config.SelectboxColumn("Category", options=all_editable_categories, help="Rule-based category")
+                        },
+                        disabled=["Date", "Details", "Amount"],
+                        hide_index=True,
+                        use_container_width=True,
+                        # A fresh editor for every page and data version, so edits never carry over to other rows
+                        key=f"expense_editor_{hash((dataset_key, filter_key, page, page_size))}"
+                    )
+                    changed = edited_df["Category"].to_numpy() != review_df["Category"].to_numpy()
+                    if changed.any():
+                        record_overrides(profile, edited_df[changed], learn_rules)
+                        st.rerun()
+                    if len(overrides):
+                        if st.button(f"Reset {len(overrides)} manual correction(s)", key="clear_overrides"):
+                            overrides.clear()
+                            try:
+                                overrides.save(os.path.join(profile, CATEGORY_OVERRIDES_FILE))
+                            except OSError:
+                                pass
+                            st.rerun()
+
+                    st.markdown("### 📊 Category Breakdown")
+                    category_summary = filtered_debits_cube.by_category()[["Sum", "Count", "Mean"]].round(2)
+                    category_summary.columns = ["Total Amount", "Count", "Average"]
+                    category_summary = category_summary.sort_values("Total Amount", ascending=False)
+                    st.dataframe(
+                        category_summary,
+                        use_container_width=True,
+                        column_config={
+                            "Total Amount": st.column_config.NumberColumn("Total Amount", format="₹%.2f"),
+                            "Average": st.column_config.NumberColumn("Average", format="₹%.2f")
+                        }
+                    )
+                else:
+                    st.info("No debit transactions found to analyze expenses based on current filters.")
+
+
+            with tab2:
+                st.markdown("### 💰 Income Analysis")
+                credits_df = filtered_df[filtered_df["Debit/Credit"] == "Credit"]
+                if not credits_df.empty:
+                    total_income = filtered_cube.credits().total()
+                    st.metric("💰 Total Income", f"₹{total_income:,.2f}")
+                    st.dataframe(
+                        in_rupees(credits_df[["Date", "Details", "Amount", "Category"]]),
+                        use_container_width=True,
+                        column_config={
+                            "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
+                            "Amount": st.column_config.NumberColumn("Amount", format="₹%.2f")
+                        }
+                    )
+                else:
+                    st.info("No credit transactions found based on current filters.")
+
+            with tab3:
+                st.markdown("### 📊 Advanced Analytics")
+                if not filtered_debits_cube.empty:
+                    with stage("charts", rows_in=len(filtered_df)):
+                        fig_trend, fig_pie, fig_bar = build_charts(dataset_key, filter_key, filtered_debits_cube)
+                    if fig_trend:
+                        st.plotly_chart(fig_trend, use_container_width=True)
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if fig_pie:
+                            st.plotly_chart(fig_pie, use_container_width=True)
+                        else:
+                            st.info("Not enough data to generate Expense Distribution Pie Chart.")
+                    with col2:
+                        if fig_bar:
+                            st.plotly_chart(fig_bar, use_container_width=True)
+                        else:
+                            st.info("Not enough data to generate Top Spending Categories Bar Chart.")
+                else:
+                    st.info("No debit transactions found for advanced analytics charts based on current filters.")
+
+
+            with tab4:
+                st.markdown("### 📈 Smart Insights")
+                if not filtered_df.empty:
+                    budget_key = budget_goals_key()
+                    with stage("insights", rows_in=len(filtered_df)):
+                        # Budgets always track the current week/month/year of the whole history, whatever the filters
+                        budget_status = evaluate_budgets(st.session_state.spend_counters, st.session_state.budget_goals)
+                        insights_text = build_insights(
+                            dataset_key, filter_key, anomaly_mode, budget_key,
+                            filtered_df, anomalies_in_filtered_data, filtered_cube, budget_status
                         )
-                        st.markdown("""
-                            <div class="anomaly-highlight">
-                                Note: Anomalies are detected based on statistical deviation within categories.
-                                Review these transactions for potential errors or unusual spending.
-                            </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.info("No significant spending anomalies detected in the filtered data.")
-
-
-                st.markdown("---")
-                col1, col2, col3 = st.columns([1, 1, 1])
-                with col2:
-                    csv_data = filtered_df.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="📥 Download Filtered Data",
-                        data=csv_data,
-                        file_name=f"filtered_transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
+                    st.markdown(insights_text)
+                    if not multi_account and not budget_status.empty:
+                        st.markdown("### 🎯 Budget Status")
+                        show_budget_status(budget_status)
+                    if multi_account:
+                        st.markdown("### 👥 Insights by Account")
+                        with stage("account_insights", rows_in=len(filtered_df)) as record:
+                            account_insights, account_budget_status = build_account_insights(
+                                dataset_key, filter_key, anomaly_mode, budget_key, filtered_df,
+                                anomalies_in_filtered_data, st.session_state.account_spend_counters
+                            )
+                            record["rows_out"] = len(account_insights)
+                        if not account_budget_status.empty:
+                            show_budget_status(account_budget_status)
+                        for row in account_insights.itertuples(index=False):
+                            with st.expander(f"{row[0]} — {row.Transactions} transactions, {row.Anomalies} anomalies"):
+                                st.markdown(row.Insights)
+                else:
+                    st.info("Apply filters to see smart insights for the selected period/categories.")
+
+            with tab5:
+                st.markdown("### 🚨 Anomalous Transactions")
+                if not anomalies_in_filtered_data.empty:
+                    st.warning(f"Found {len(anomalies_in_filtered_data)} potential anomalies in the filtered data:")
+                    st.dataframe(
+                        in_rupees(anomalies_in_filtered_data.drop(columns=['ZScore'])),
+                        use_container_width=True,
+                        column_config={
+                            "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
+                            "Amount": st.column_config.NumberColumn("Amount", format="₹%.2f"),
+                        }
                     )
+                    st.markdown("""
+                        <div class="anomaly-highlight">
+                            Note: Anomalies are detected based on statistical deviation within categories.
+                            Review these transactions for potential errors or unusual spending.
+                        </div>
+                    """, unsafe_allow_html=True)
+                else:
+                    st.info("No significant spending anomalies detected in the filtered data.")
+
+
+            st.markdown("---")
+            col1, col2, col3 = st.columns([1, 1, 1])
+            with col2:
+                with stage("export", rows_in=len(filtered_df)) as record:
+                    csv_data = in_rupees(filtered_df).to_csv(index=False).encode('utf-8')
+                    record["rows_out"] = len(filtered_df)
+                st.download_button(
+                    label="📥 Download Filtered Data",
+                    data=csv_data,
+                    file_name=f"filtered_transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    mime="text/csv",
+                    use_container_width=True
+                )
 
     st.markdown("---")
     st.markdown("""
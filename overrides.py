@@ -0,0 +1,104 @@
+"""
+Manual category overrides for FinWise.
+
+Corrections made in the review grid are kept as a small table of
+transaction id -> category, separate from the categorized data. The table is
+applied as one vectorized patch after rule-based categorization, so it
+survives rule changes, recategorization and reloads from the saved history.
+Transaction ids are content hashes (see transaction_ids), so the same
+transaction gets the same id in every upload and session.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from store import key_frame
+
+ID_COLUMN = "Id"
+
+
+def transaction_ids(df):
+    """
+    Stable uint64 id per row: a hash of the duplicate-key columns and account, plus the row's
+    occurrence number among identical rows, as in the store's keys. key_frame normalizes amounts
+    to paise, so a row has the same id whichever amount unit it was loaded in.
+    """
+    hashes = pd.util.hash_pandas_object(key_frame(df), index=False).to_numpy()
+    occurrence = pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+    return pd.util.hash_array(hashes ^ occurrence.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+
+
+def with_ids(df):
+    """The transactions with an Id column, computed only if it is missing."""
+    if ID_COLUMN in df.columns:
+        return df
+    return df.assign(**{ID_COLUMN: transaction_ids(df)})
+
+
+class CategoryOverrides:
+    """Transaction id -> category corrections, persisted as JSON."""
+
+    def __init__(self):
+        self.categories = pd.Series(dtype=object, index=pd.Index([], dtype=np.uint64))
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.categories)
+
+    def set(self, ids, categories):
+        """Record (or replace) the category of each transaction id."""
+        update = pd.Series(list(categories), index=pd.Index(np.asarray(ids, dtype=np.uint64)), dtype=object)
+        if update.empty:
+            return
+        with self._lock:
+            kept = self.categories[~self.categories.index.isin(update.index)]
+            self.categories = pd.concat([kept, update[~update.index.duplicated(keep="last")]])
+            self.version += 1
+
+    def clear(self):
+        with self._lock:
+            self.categories = self.categories.iloc[0:0]
+            self.version += 1
+
+    def apply(self, df):
+        """
+        Return the transactions with overridden categories patched in. Ids are looked
+        up with one hash-index probe per row; rows without an override are untouched.
+        """
+        if self.categories.empty or df.empty:
+            return df
+        positions = self.categories.index.get_indexer(df[ID_COLUMN].to_numpy())
+        hit = positions >= 0
+        if not hit.any():
+            return df
+        patched = df["Category"].astype(object).to_numpy(copy=True)
+        patched[hit] = self.categories.to_numpy()[positions[hit]]
+        return df.assign(Category=pd.Series(patched, index=df.index, dtype="category"))
+
+    def save(self, file_path):
+        """Persist the overrides as JSON. Writes are atomic."""
+        with self._lock:
+            payload = {"overrides": [[str(i), category] for i, category in self.categories.items()]}
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """Load persisted overrides, starting empty if the file is missing or unreadable."""
+        overrides = cls()
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return overrides
+        entries = payload.get("overrides", [])
+        overrides.set([int(i) for i, _ in entries], [category for _, category in entries])
+        overrides.version = 0
+        return overrides
@@ -1,15 +1,34 @@
-import pandas as pd
-import random
-from datetime import datetime, timedelta
-import numpy as np
+"""
+Synthetic bank statement generator for FinWise.
+
+Generates realistic transactions from the templates below for demos and load
+tests: any number of rows over any date span, one or many accounts, with
+injected high and low anomalies. Rows are drawn in bulk with NumPy, in date
+order, and streamed to CSV or Parquet one chunk at a time, so memory stays
+bounded however many rows are written:
 
-# Set random seed for reproducible data
-random.seed(42)
-np.random.seed(42)
+    python random_data_generator.py                          # regenerate finwise_sample_data_3months.csv
+    python random_data_generator.py --rows 10000000 --start 2015-01-01 --end 2024-12-31 \
+        --accounts 50 --output load_test.parquet
 
-# Define date range (3 months: November 2024 to January 2025)
-start_date = datetime(2024, 11, 1)
-end_date = datetime(2025, 1, 31)
+Nothing runs at import time; use generate_frame or generate_chunks from code.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+DEFAULT_OUTPUT = "finwise_sample_data_3months.csv"
+DEFAULT_START = "2024-11-01"
+DEFAULT_END = "2025-01-31"
+DATE_FORMAT = "%d %b %Y"
+DEFAULT_CHUNK_ROWS = 1_000_000
+SALARY_DETAILS = "Salary Credit - ABC Tech Solutions"
+SALARY_RANGE = (75000, 85000)
 
 # Category-wise transaction templates with realistic details
 transaction_templates = {
@@ -206,137 +225,233 @@ income_sources = [
     ("Rental Income", 20000, 30000)
 ]
 
-def generate_transactions():
-    transactions = []
-    current_date = start_date
-    
-    # Ensure regular income (salary on 1st of each month)
-    for month in range(3):  # 3 months
-        salary_date = datetime(2024, 11 + month, 1) if month < 2 else datetime(2025, 1, 1)
-        if salary_date <= end_date:
-            transactions.append({
-                'Date': salary_date.strftime('%d %b %Y'),
-                'Details': 'Salary Credit - ABC Tech Solutions',
-                'Amount': random.uniform(75000, 85000),
-                'Debit/Credit': 'Credit'
-            })
-    
-    # Add other income transactions
-    for _ in range(15):  # Additional income transactions
-        date = start_date + timedelta(days=random.randint(0, (end_date - start_date).days))
-        detail, min_amt, max_amt = random.choice(income_sources)
-        transactions.append({
-            'Date': date.strftime('%d %b %Y'),
-            'Details': detail,
-            'Amount': round(random.uniform(min_amt, max_amt), 2),
-            'Debit/Credit': 'Credit'
-        })
-    
-    # Generate expense transactions with realistic patterns
+# Relative expense frequency per category (the midpoint of its typical transactions per quarter)
+EXPENSE_FREQUENCY = {
+    "Food & Dining": 32.5,
+    "Groceries": 20, "Transportation": 20, "Utilities": 20,
+    "Shopping": 11.5, "Entertainment": 11.5, "Personal Care": 11.5,
+    "Travel": 5.5, "Home & Garden": 5.5, "Bills & Finance": 5.5,
+}
+DEFAULT_EXPENSE_FREQUENCY = 8.5
+
+
+def template_table():
+    """
+    Flatten the templates into arrays: details, amount low/high, category and debit flag
+    for every template, plus the draw probability of each expense and income template.
+    """
+    rows = []
     for category, templates in transaction_templates.items():
-        if category == "Income":  # Skip income category for expenses
+        if category == "Income": # Income is drawn from income_sources as credits
             continue
-            
-        # Determine frequency based on category
-        if category in ["Food & Dining"]:
-            num_transactions = random.randint(25, 40)  # High frequency
-        elif category in ["Groceries", "Transportation", "Utilities"]:
-            num_transactions = random.randint(15, 25)  # Medium frequency
-        elif category in ["Shopping", "Entertainment", "Personal Care"]:
-            num_transactions = random.randint(8, 15)   # Medium-low frequency
-        elif category in ["Travel", "Home & Garden", "Bills & Finance"]:
-            num_transactions = random.randint(3, 8)    # Low frequency
-        else:
-            num_transactions = random.randint(5, 12)   # Default frequency
-        
-        for _ in range(num_transactions):
-            date = start_date + timedelta(days=random.randint(0, (end_date - start_date).days))
-            detail, min_amt, max_amt = random.choice(templates)
-            
-            # Add some variation to amounts to create anomalies
-            amount = random.uniform(min_amt, max_amt)
-            
-            # 5% chance of creating an anomaly (unusually high amount)
-            if random.random() < 0.05:
-                amount *= random.uniform(2.5, 4.0)  # Create high anomaly
-            # 3% chance of creating low anomaly
-            elif random.random() < 0.03:
-                amount *= random.uniform(0.1, 0.3)  # Create low anomaly
-            
-            transactions.append({
-                'Date': date.strftime('%d %b %Y'),
-                'Details': detail,
-                'Amount': round(amount, 2),
-                'Debit/Credit': 'Debit'
-            })
-    
-    # Sort transactions by date
-    transactions.sort(key=lambda x: datetime.strptime(x['Date'], '%d %b %Y'))
-    
-    return transactions
+        weight = EXPENSE_FREQUENCY.get(category, DEFAULT_EXPENSE_FREQUENCY) / len(templates)
+        rows.extend((detail, low, high, category, True, weight) for detail, low, high in templates)
+    rows.extend((detail, low, high, "Income", False, 1.0) for detail, low, high in income_sources)
+    rows.append((SALARY_DETAILS, *SALARY_RANGE, "Income", False, 0.0)) # Only used for monthly salaries
+    details, low, high, category, debit, weight = (np.array(column) for column in zip(*rows))
+    return {
+        "details": details.astype(object),
+        "low": low.astype(float),
+        "high": high.astype(float),
+        "category": category.astype(object),
+        "debit": debit.astype(bool),
+        "expense_p": np.where(debit, weight, 0.0) / weight[debit].sum(),
+        "income_p": np.where(debit, 0.0, weight) / weight[~debit].sum(),
+    }
 
-# Generate the dataset
-sample_data = generate_transactions()
-df = pd.DataFrame(sample_data)
 
-# Save to CSV
-df.to_csv('finwise_sample_data_3months.csv', index=False)
+def account_names(accounts):
+    """ACC001, ACC002, ... for `accounts` accounts."""
+    return np.array([f"ACC{i:03d}" for i in range(1, accounts + 1)], dtype=object)
 
-print(f"Generated {len(df)} transactions")
-print(f"Date range: {df['Date'].min()} to {df['Date'].max()}")
-print(f"Total Credits: ₹{df[df['Debit/Credit'] == 'Credit']['Amount'].sum():,.2f}")
-print(f"Total Debits: ₹{df[df['Debit/Credit'] == 'Debit']['Amount'].sum():,.2f}")
-print(f"Net Flow: ₹{(df[df['Debit/Credit'] == 'Credit']['Amount'].sum() - df[df['Debit/Credit'] == 'Debit']['Amount'].sum()):,.2f}")
-print("\nSample transactions:")
-print(df.head(10).to_string(index=False))
 
-# Display category distribution
-debit_df = df[df['Debit/Credit'] == 'Debit'].copy()
+def generate_chunks(rows=250, start=DEFAULT_START, end=DEFAULT_END, accounts=1, income_rate=0.06,
+                    high_anomaly_rate=0.05, low_anomaly_rate=0.03, seed=42, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yield DataFrames of about `chunk_rows` transactions each, `rows` in total, in date order.
 
-# Add category mapping for analysis
-def categorize_sample_transaction(details):
-    details_lower = str(details).lower()
-    
-    category_keywords = {
-        "Food & Dining": ["swiggy", "zomato", "kfc", "mcdonalds", "cafe", "restaurant", "pizza", "subway", "dhaba", "starbucks", "domino", "haldiram"],
-        "Groceries": ["reliance fresh", "dmart", "bigbasket", "kirana", "zepto", "spencer", "supermarket", "grocery", "fruits", "vegetables"],
-        "Transportation": ["uber", "ola", "petrol", "diesel", "metro", "auto", "bus", "rapido", "gas station"],
-        "Shopping": ["amazon", "flipkart", "myntra", "zara", "h&m", "electronics", "nike", "adidas", "lifestyle"],
-        "Utilities": ["electricity", "water bill", "jio", "airtel", "gas cylinder", "broadband", "dth"],
-        "Healthcare": ["apollo", "pharmacy", "doctor", "hospital", "dental", "medicine", "health", "checkup"],
-        "Entertainment": ["netflix", "bookmyshow", "spotify", "cinema", "gaming", "concert", "prime"],
-        "Travel": ["indigo", "flight", "hotel", "oyo", "makemytrip", "railway", "goibibo", "agoda"],
-        "Education": ["course", "udemy", "book", "tuition", "educational", "skill"],
-        "Home & Garden": ["rent", "maintenance", "ikea", "furniture", "appliances", "garden", "home"],
-        "Personal Care": ["salon", "gym", "cosmetics", "spa", "barber", "fitness"],
-        "Bills & Finance": ["credit card", "loan", "emi", "bank", "insurance", "tax", "mutual fund"],
-        "Investments": ["investment", "stock", "sip", "gold", "fixed deposit"],
-        "Subscriptions": ["prime", "youtube", "disney", "microsoft", "adobe"],
-        "Gifts & Donations": ["gift", "donation", "birthday", "wedding"],
-        "Sports & Fitness": ["sports", "fitness", "yoga", "swimming"],
-        "Business": ["office", "client", "business", "vendor"],
-        "ATM/Cash": ["atm", "cash withdrawal"],
-        "Transfer": ["transfer", "upi", "neft", "family", "friend"]
-    }
-    
-    for category, keywords in category_keywords.items():
-        for keyword in keywords:
-            if keyword in details_lower:
-                return category
-    return "Other"
-
-if not debit_df.empty:
-    debit_df['Category'] = debit_df['Details'].apply(categorize_sample_transaction)
-    category_summary = debit_df.groupby('Category')['Amount'].agg(['count', 'sum']).round(2)
-    category_summary.columns = ['Count', 'Total Amount']
-    category_summary = category_summary.sort_values('Total Amount', ascending=False)
-    print(f"\nCategory-wise Expense Summary:")
-    print(category_summary.to_string())
-
-print(f"\n✅ Sample data saved as 'finwise_sample_data_3months.csv'")
-print(f"📊 This dataset includes:")
-print(f"   • Regular monthly salaries and varied income sources")
-print(f"   • Realistic spending patterns across all categories")
-print(f"   • Built-in anomalies for testing anomaly detection")
-print(f"   • Seasonal variations and weekend/weekday patterns")
-print(f"   • Mix of small daily expenses and large occasional purchases")
\ No newline at end of file
+    Every account is paid a salary on the 1st of each month; the remaining rows are spread
+    uniformly over [start, end] and are credits from income_sources with probability
+    `income_rate`, otherwise expenses from transaction_templates. An expense is inflated
+    2.5-4x with probability `high_anomaly_rate`, or else shrunk to 10-30% with probability
+    `low_anomaly_rate`. Columns are Date (datetime64), Details, Amount, Debit/Credit, the
+    template's Category and whether the row is an injected Anomaly (ground truth, not part
+    of a real statement) and, with more than one account, Account; text columns are
+    categoricals.
+    """
+    rng = np.random.default_rng(seed)
+    table = template_table()
+    first_day = pd.Timestamp(start).normalize()
+    days = (pd.Timestamp(end).normalize() - first_day).days + 1
+    if days < 1:
+        raise ValueError("end must not be before start")
+    names = account_names(accounts)
+    salary_template = len(table["details"]) - 1
+
+    # Salaries: every account on the 1st of every month in range, in date order
+    month_starts = pd.date_range(first_day, periods=days, freq="D")
+    month_starts = month_starts[month_starts.day == 1]
+    salary_days = np.repeat(((month_starts - first_day).days).to_numpy(), accounts)
+    salary_days = salary_days[:rows]
+    salary_accounts = np.tile(np.arange(accounts), len(month_starts))[:len(salary_days)]
+
+    # Rows per day for the rest; chunks then take consecutive runs of days, so output is date-sorted
+    per_day = rng.multinomial(rows - len(salary_days), np.full(days, 1.0 / days))
+    day_ends = np.cumsum(per_day)
+
+    category_codes, categories = pd.factorize(table["category"])
+    details_categories = pd.Index(pd.unique(table["details"]))
+    details_codes = details_categories.get_indexer(table["details"])
+
+    day = 0
+    while day < days:
+        # Chunks take whole consecutive days, so output is date-sorted and a day's salaries and
+        # purchases stay together; a chunk overshoots chunk_rows by at most one day's rows
+        first_row = day_ends[day - 1] if day else 0
+        last_day = min(max(int(np.searchsorted(day_ends, first_row + chunk_rows, side="left")), day), days - 1)
+        offsets = np.repeat(np.arange(day, last_day + 1), per_day[day:last_day + 1])
+        salary = slice(*np.searchsorted(salary_days, [day, last_day + 1], side="left"))
+        day = last_day + 1
+        n = len(offsets)
+        if n == 0 and salary.start == salary.stop:
+            continue
+
+        credit = rng.random(n) < income_rate
+        template = np.where(
+            credit,
+            rng.choice(len(table["details"]), n, p=table["income_p"]),
+            rng.choice(len(table["details"]), n, p=table["expense_p"]),
+        )
+        low = table["low"][template]
+        amount = low + (table["high"][template] - low) * rng.random(n)
+        # Anomalies are injected into expenses only
+        high = ~credit & (rng.random(n) < high_anomaly_rate)
+        shrunk = ~credit & ~high & (rng.random(n) < low_anomaly_rate)
+        amount[high] *= rng.uniform(2.5, 4.0, int(high.sum()))
+        amount[shrunk] *= rng.uniform(0.1, 0.3, int(shrunk.sum()))
+        account = rng.integers(0, accounts, n)
+
+        # Salaries go first on their day, as a payroll credit would
+        n_salary = salary.stop - salary.start
+        chunk_days = np.concatenate([salary_days[salary], offsets])
+        order = np.argsort(chunk_days, kind="stable")
+        template = np.concatenate([np.full(n_salary, salary_template), template])[order]
+        amount = np.concatenate([rng.uniform(*SALARY_RANGE, n_salary), amount])[order]
+        account = np.concatenate([salary_accounts[salary], account])[order]
+        anomaly = np.concatenate([np.zeros(n_salary, dtype=bool), high | shrunk])[order]
+        debit = table["debit"][template]
+
+        chunk = pd.DataFrame({
+            "Date": first_day + pd.to_timedelta(chunk_days[order], unit="D"),
+            "Details": pd.Categorical.from_codes(details_codes[template], details_categories),
+            "Amount": np.round(amount, 2),
+            "Debit/Credit": pd.Categorical.from_codes(np.where(debit, 0, 1), ["Debit", "Credit"]),
+            "Category": pd.Categorical.from_codes(category_codes[template], categories),
+            "Anomaly": anomaly,
+        })
+        if accounts > 1:
+            chunk["Account"] = pd.Categorical.from_codes(account, names)
+        yield chunk
+
+
+def generate_frame(rows=250, **options):
+    """All generated transactions in one DataFrame; see generate_chunks for the options."""
+    return pd.concat(generate_chunks(rows, **options), ignore_index=True)
+
+
+def statement_table(chunk, file_format):
+    """A generated chunk as an Arrow table in statement layout (no Category or Anomaly column)."""
+    chunk = chunk.drop(columns=["Category", "Anomaly"])
+    if file_format == "csv":
+        # Format each distinct day once; a chunk covers far fewer days than rows
+        codes, days = pd.factorize(chunk["Date"], sort=True)
+        chunk["Date"] = pd.Categorical.from_codes(codes, days.strftime(DATE_FORMAT))
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+    if file_format == "csv":
+        table = table.cast(pa.schema([
+            pa.field(field.name, pa.string() if pa.types.is_dictionary(field.type) else field.type)
+            for field in table.schema
+        ]))
+    return table
+
+
+def write_transactions(path, rows=250, file_format=None, **options):
+    """
+    Stream generated transactions to a CSV or Parquet file one chunk at a time.
+    The format follows the file extension unless given; with no rows the file holds just the
+    header (or Parquet schema). Returns per-run totals.
+    """
+    file_format = file_format or ("parquet" if path.endswith(".parquet") else "csv")
+    summary = {"rows": 0, "credits": 0.0, "debits": 0.0, "first_date": None, "last_date": None,
+               "anomalies": 0, "categories": {}}
+    writer = None
+    try:
+        for chunk in generate_chunks(rows, **options):
+            table = statement_table(chunk, file_format)
+            if writer is None:
+                writer = (pq.ParquetWriter(path, table.schema) if file_format == "parquet"
+                          else pacsv.CSVWriter(path, table.schema))
+            writer.write_table(table)
+
+            debit = (chunk["Debit/Credit"] == "Debit").to_numpy()
+            amounts = chunk["Amount"].to_numpy()
+            summary["rows"] += len(chunk)
+            summary["credits"] += float(amounts[~debit].sum())
+            summary["debits"] += float(amounts[debit].sum())
+            summary["anomalies"] += int(chunk["Anomaly"].sum())
+            summary["first_date"] = summary["first_date"] or chunk["Date"].iloc[0]
+            summary["last_date"] = chunk["Date"].iloc[-1]
+            for category, count in chunk["Category"][debit].value_counts(sort=False).items():
+                if count:
+                    summary["categories"][category] = summary["categories"].get(category, 0) + int(count)
+        if writer is None:
+            # No rows: still write a file with the header (or Parquet schema) of a generated statement
+            table = statement_table(next(generate_chunks(1, **options)).iloc[0:0], file_format)
+            writer = (pq.ParquetWriter(path, table.schema) if file_format == "parquet"
+                      else pacsv.CSVWriter(path, table.schema))
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic bank statement for demos and load tests.")
+    parser.add_argument("--rows", type=int, default=250, help="Number of transactions (default: 250)")
+    parser.add_argument("--start", default=DEFAULT_START, help=f"First date, YYYY-MM-DD (default: {DEFAULT_START})")
+    parser.add_argument("--end", default=DEFAULT_END, help=f"Last date, YYYY-MM-DD (default: {DEFAULT_END})")
+    parser.add_argument("--accounts", type=int, default=1, help="Number of accounts; more than one adds an Account column")
+    parser.add_argument("--income-rate", type=float, default=0.06, help="Share of non-salary rows that are credits")
+    parser.add_argument("--high-anomaly-rate", type=float, default=0.05, help="Share of expenses inflated 2.5-4x")
+    parser.add_argument("--low-anomaly-rate", type=float, default=0.03, help="Share of other expenses shrunk to 10-30%%")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows generated and written per chunk")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None, help="Output format (default: from the file extension)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help=f"Output file (default: {DEFAULT_OUTPUT})")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    summary = write_transactions(
+        args.output, rows=args.rows, file_format=args.format, start=args.start, end=args.end,
+        accounts=args.accounts, income_rate=args.income_rate, high_anomaly_rate=args.high_anomaly_rate,
+        low_anomaly_rate=args.low_anomaly_rate, seed=args.seed, chunk_rows=args.chunk_rows,
+    )
+    elapsed = time.perf_counter() - started
+
+    print(f"Generated {summary['rows']:,} transactions in {elapsed:.2f}s ({summary['rows'] / elapsed:,.0f} rows/sec)")
+    if summary["rows"]:
+        print(f"Date range: {summary['first_date']:%d %b %Y} to {summary['last_date']:%d %b %Y}")
+    print(f"Total Credits: ₹{summary['credits']:,.2f}")
+    print(f"Total Debits: ₹{summary['debits']:,.2f}")
+    print(f"Net Flow: ₹{summary['credits'] - summary['debits']:,.2f}")
+    print(f"Injected anomalies: {summary['anomalies']:,}")
+    if summary["categories"]:
+        print("\nExpenses by template category:")
+        for category, count in sorted(summary["categories"].items(), key=lambda item: -item[1]):
+            print(f"  {category:<20} {count:>12,}")
+    print(f"\n✅ Saved as '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
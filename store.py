@@ -0,0 +1,215 @@
+"""
+Persistent on-disk transaction store for FinWise.
+
+Cleaned and categorized transactions are kept as Parquet files partitioned by
+month (``<root>/month=YYYY-MM/transactions.parquet``) with a small JSON
+manifest. New statements are merged incrementally: only the months they touch
+are rewritten, and rows already in the store are skipped. Reads memory-map
+just the partitions and columns that are asked for, so a returning user's
+dashboard loads without parsing any CSV. Amounts are always stored as float
+rupees and converted on load, so histories saved with either amount unit mix.
+The manifest records the hash of the rules each partition was categorized
+with, so a partition saved under older rules can be recategorized on its own.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingestion import ACCOUNT_COLUMN, UNKNOWN_ACCOUNT
+from transactions import amount_scale, compact_transactions, in_rupees, sort_by_date, to_paise
+
+# A transaction is a duplicate when all of these and its account match a stored transaction
+KEY_COLUMNS = ["Date", "Details", "Amount", "Debit/Credit"]
+STORE_COLUMNS = ["Date", "Details", "Amount", "Debit/Credit", "Category"]
+PARTITION_FILE = "transactions.parquet"
+
+
+def fill_accounts(df):
+    """
+    `df` with an Account column of strings, UNKNOWN_ACCOUNT where the account is missing or the
+    column is absent, so rows from statements with and without accounts key the same way.
+    """
+    if ACCOUNT_COLUMN in df.columns:
+        accounts = df[ACCOUNT_COLUMN].astype(object).fillna(UNKNOWN_ACCOUNT)
+    else:
+        accounts = UNKNOWN_ACCOUNT
+    return df.assign(**{ACCOUNT_COLUMN: accounts})
+
+
+def key_frame(df):
+    """
+    The duplicate-key columns and account of every row (see fill_accounts), normalized so a
+    row hashes the same however it was loaded: amounts as int64 paise in either amount unit,
+    and dates in nanoseconds whatever resolution Parquet or pandas inferred.
+    """
+    keys = fill_accounts(df[KEY_COLUMNS + [col for col in [ACCOUNT_COLUMN] if col in df.columns]])
+    amounts = keys["Amount"] if amount_scale(keys["Amount"]) != 1 else to_paise(keys["Amount"])
+    return keys.assign(Date=keys["Date"].astype("datetime64[ns]"), Amount=amounts)
+
+
+def occurrence_keys(df):
+    """
+    One key per row: a hash of the duplicate-key columns and account plus the row's occurrence
+    number among identical rows. Two genuine identical purchases on the same day in one statement
+    stay distinct, while re-uploading an overlapping statement adds nothing.
+    """
+    hashes = pd.util.hash_pandas_object(key_frame(df), index=False).to_numpy()
+    occurrence = pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+    return pd.MultiIndex.from_arrays([hashes, occurrence])
+
+
+class TransactionStore:
+    """Month-partitioned Parquet store with incremental, de-duplicating merges."""
+
+    def __init__(self, root):
+        self.root = root
+        self._manifest_path = os.path.join(root, "manifest.json")
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"version": 0, "partitions": {}, "partition_rules": {}}
+
+    def _write_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self._manifest_path)
+
+    @property
+    def version(self):
+        """Increases every time a merge changes the stored data."""
+        return self.manifest["version"]
+
+    def partition_rules(self, month):
+        """Hash of the rules a partition was categorized with, or None if unknown or mixed."""
+        rules = self.manifest.get("partition_rules", {})
+        # Manifests from before per-partition hashes recorded one hash for the whole store
+        return rules[month] if month in rules else self.manifest.get("rules_hash")
+
+    def stale_months(self, rules_hash):
+        """Months whose partitions were not categorized with `rules_hash`."""
+        return [month for month in self.months() if self.partition_rules(month) != rules_hash]
+
+    def __len__(self):
+        return sum(self.manifest["partitions"].values())
+
+    def months(self):
+        return sorted(self.manifest["partitions"])
+
+    def clear(self):
+        """Delete every stored transaction."""
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.manifest = {"version": self.version + 1, "partitions": {}, "partition_rules": {}}
+        self._write_manifest()
+
+    def _partition_path(self, month):
+        return os.path.join(self.root, f"month={month}", PARTITION_FILE)
+
+    def _read_partition(self, month, columns=None):
+        return pq.read_table(self._partition_path(month), columns=columns, memory_map=True)
+
+    def _write_partition(self, month, df, rules_hash):
+        path = self._partition_path(month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+        self.manifest["partitions"][month] = len(df)
+        self.manifest.setdefault("partition_rules", {})[month] = rules_hash
+
+    def load(self, start_date=None, end_date=None, columns=None, amount_unit="rupees"):
+        """
+        Stored transactions in date order, optionally limited to a date range and a subset
+        of columns. Only the partitions overlapping the range are opened. With
+        amount_unit="paise" amounts are returned as int64 paise.
+        """
+        months = self.months()
+        if start_date is not None:
+            months = [m for m in months if m >= pd.Timestamp(start_date).strftime("%Y-%m")]
+        if end_date is not None:
+            months = [m for m in months if m <= pd.Timestamp(end_date).strftime("%Y-%m")]
+        if not months:
+            df = compact_transactions(pd.DataFrame({
+                "Date": pd.Series(dtype="datetime64[ns]"), "Details": pd.Series(dtype=object),
+                "Amount": pd.Series(dtype=float), "Debit/Credit": pd.Series(dtype=object),
+                "Category": pd.Series(dtype=object),
+            }))[columns or STORE_COLUMNS]
+        else:
+            # Partitions written before an Account column appeared have nulls for it
+            table = pa.concat_tables([self._read_partition(month, columns) for month in months], promote_options="default")
+            df = table.to_pandas()
+            if ACCOUNT_COLUMN in df.columns and df[ACCOUNT_COLUMN].isna().any():
+                df[ACCOUNT_COLUMN] = fill_accounts(df)[ACCOUNT_COLUMN].astype("category")
+        if amount_unit == "paise" and "Amount" in df.columns:
+            df["Amount"] = to_paise(df["Amount"])
+        if not df.empty and "Date" in df.columns and (start_date is not None or end_date is not None):
+            dates = df["Date"].to_numpy()
+            lo = 0 if start_date is None else dates.searchsorted(np.datetime64(pd.Timestamp(start_date)))
+            hi = len(dates) if end_date is None else dates.searchsorted(
+                np.datetime64(pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1))
+            )
+            df = df.iloc[lo:hi].reset_index(drop=True)
+        return df
+
+    def merge(self, df, rules_hash=None):
+        """
+        Merge processed transactions into the store. Only the months present in `df` are
+        read and rewritten. Returns (rows that were new, number of duplicates skipped); the new
+        rows keep the amount unit of `df`. `rules_hash` identifies the rules that categorized
+        `df`; a partition that already held rows from other rules is left marked as mixed.
+        """
+        paise = amount_scale(df["Amount"]) != 1
+        df = compact_transactions(in_rupees(fill_accounts(df[STORE_COLUMNS + [col for col in [ACCOUNT_COLUMN] if col in df.columns]])))
+        added = []
+        duplicates = 0
+        for period, new_rows in df.groupby(df["Date"].dt.to_period("M"), sort=True):
+            month = period.strftime("%Y-%m")
+            if month in self.manifest["partitions"]:
+                existing = fill_accounts(self._read_partition(month).to_pandas())
+                is_duplicate = occurrence_keys(new_rows).isin(occurrence_keys(existing))
+                duplicates += int(is_duplicate.sum())
+                new_rows = new_rows[~is_duplicate]
+                if new_rows.empty:
+                    continue
+                combined = pd.concat([existing, new_rows], ignore_index=True)
+            else:
+                combined = new_rows
+            combined = compact_transactions(sort_by_date(combined))
+            if month in self.manifest["partitions"] and self.partition_rules(month) != rules_hash:
+                partition_rules = None # Old rows keep their categories until recategorize()
+            else:
+                partition_rules = rules_hash
+            self._write_partition(month, combined, partition_rules)
+            added.append(new_rows)
+
+        if added:
+            self.manifest["version"] += 1
+            self._write_manifest()
+        added_df = pd.concat(added, ignore_index=True) if added else df.iloc[0:0]
+        if paise:
+            added_df = added_df.assign(Amount=to_paise(added_df["Amount"]))
+        return added_df, duplicates
+
+    def recategorize(self, categorize, rules_hash):
+        """
+        Rewrite every partition not categorized with `rules_hash` using `categorize`, a function
+        from stored transactions to the same transactions with a new Category. Partitions already
+        up to date are not read. Returns the months that were rewritten.
+        """
+        stale = self.stale_months(rules_hash)
+        for month in stale:
+            df = categorize(self._read_partition(month).to_pandas())
+            self._write_partition(month, compact_transactions(in_rupees(df)), rules_hash)
+        if stale:
+            self._write_manifest()
+        return stale
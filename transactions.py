@@ -0,0 +1,155 @@
+"""
+In-memory layout of processed transactions for FinWise.
+
+Processed transactions are kept sorted by date and stored compactly:
+categorical (dictionary-encoded) Details, Category and Debit/Credit columns,
+and optionally float32 amounts. Amounts may instead be held as exact int64
+paise: an integer Amount column always means paise, and is converted to
+rupees only for display and export (see in_rupees).
+
+TransactionIndex adds the sorted datetime64 dates plus, for every category, the row positions of its transactions, so a
+date-range + category filter is answered with binary searches and an index
+merge instead of full-frame boolean masks and copies.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Low-cardinality text columns stored as pandas categoricals (integer codes + one copy of each string)
+CATEGORICAL_COLUMNS = ["Details", "Category", "Debit/Credit", "Account"]
+# "rupees": float64 rupee amounts; "paise": exact int64 paise
+AMOUNT_UNITS = ("rupees", "paise")
+PAISE_PER_RUPEE = 100
+
+
+def to_paise(amounts):
+    """Rupee amounts as exact int64 paise, rounded to the nearest paisa."""
+    return np.rint(np.asarray(amounts, dtype=float) * PAISE_PER_RUPEE).astype(np.int64)
+
+
+def amount_scale(amounts):
+    """Units per rupee of an amount column: 100 for integer paise, 1 for rupees."""
+    return PAISE_PER_RUPEE if pd.api.types.is_integer_dtype(amounts) else 1
+
+
+def in_rupees(df, column="Amount"):
+    """The frame with `column` in rupees, for display and export. Rupee amounts are returned as is."""
+    if column not in df.columns or amount_scale(df[column]) == 1:
+        return df
+    return df.assign(**{column: df[column] / PAISE_PER_RUPEE})
+
+
+def compact_transactions(df, amount_dtype=None):
+    """
+    Return a compact copy of processed transactions.
+
+    Details, Category and Debit/Credit become categoricals, so each row stores
+    a small integer code; for Debit/Credit that code is effectively an int8
+    debit flag. Amounts keep their dtype (float64 rupees or int64 paise) by
+    default; pass amount_dtype="float32" to halve rupee amounts at the cost of
+    precision above roughly ₹100,000.
+    Columns that are not needed for analysis are dropped; an Account column is kept.
+    """
+    columns = [col for col in ["Date", "Details", "Amount", "Debit/Credit", "Category", "Account"] if col in df.columns]
+    compact = df[columns].copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in compact.columns and not isinstance(compact[col].dtype, pd.CategoricalDtype):
+            compact[col] = compact[col].astype("category")
+    if amount_dtype is not None:
+        compact["Amount"] = compact["Amount"].astype(amount_dtype)
+    return compact
+
+
+def concat_compact(parts):
+    """
+    Concatenate compact frames with the same columns. Categorical columns are joined with
+    union_categoricals, so they stay categorical instead of falling back to object.
+    """
+    columns = {}
+    for col in parts[0].columns:
+        values = [part[col] for part in parts]
+        if all(isinstance(value.dtype, pd.CategoricalDtype) for value in values):
+            columns[col] = union_categoricals(values)
+        else:
+            columns[col] = pd.concat(values, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def memory_report(before, after):
+    """Bytes in total and per transaction for two representations of the same transactions."""
+    def measure(df):
+        total = int(df.memory_usage(deep=True, index=True).sum())
+        return {"bytes": total, "bytes_per_transaction": total / len(df) if len(df) else 0.0}
+
+    report = {"rows": len(after), "before": measure(before), "after": measure(after)}
+    report["reduction"] = 1 - report["after"]["bytes"] / report["before"]["bytes"] if report["before"]["bytes"] else 0.0
+    return report
+
+
+def sort_by_date(df):
+    """Return the transactions in date order (stable, so same-day rows keep their file order)."""
+    if df["Date"].is_monotonic_increasing:
+        return df.reset_index(drop=True)
+    return df.sort_values("Date", kind="stable").reset_index(drop=True)
+
+
+class TransactionIndex:
+    """Date and per-category row-position indexes over date-sorted transactions."""
+
+    def __init__(self, df):
+        if not df["Date"].is_monotonic_increasing:
+            raise ValueError("TransactionIndex requires transactions sorted by 'Date'; use sort_by_date first.")
+        self.df = df
+        self.dates = df["Date"].to_numpy()
+        # Group row positions by category; positions stay ascending within each category
+        codes, uniques = pd.factorize(df["Category"], sort=True)
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self.category_positions = {
+            category: order[boundaries[i]:boundaries[i + 1]] for i, category in enumerate(uniques)
+        }
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def categories(self):
+        return list(self.category_positions)
+
+    def date_bounds(self, start_date=None, end_date=None):
+        """Row range [lo, hi) covering an inclusive date range (whole days)."""
+        lo = 0
+        hi = len(self.dates)
+        if start_date is not None:
+            lo = self.dates.searchsorted(np.datetime64(pd.Timestamp(start_date)), side="left")
+        if end_date is not None:
+            day_after = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+            hi = self.dates.searchsorted(np.datetime64(day_after), side="left")
+        return lo, max(lo, hi)
+
+    def positions(self, start_date=None, end_date=None, categories=None):
+        """Ascending row positions matching the date range and categories."""
+        lo, hi = self.date_bounds(start_date, end_date)
+        if categories is None:
+            return np.arange(lo, hi)
+        parts = []
+        for category in categories:
+            positions = self.category_positions.get(category)
+            if positions is None:
+                continue
+            parts.append(positions[positions.searchsorted(lo):positions.searchsorted(hi)])
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(parts), kind="stable")
+
+    def select(self, start_date=None, end_date=None, categories=None):
+        """
+        Transactions in an inclusive date range and a set of categories.
+        When every category is selected this is a plain positional slice, with no mask and no copy.
+        """
+        if categories is not None and set(self.category_positions).issubset(categories):
+            categories = None
+        if categories is None:
+            lo, hi = self.date_bounds(start_date, end_date)
+            return self.df.iloc[lo:hi]
+        return self.df.take(self.positions(start_date, end_date, categories))